@@ -1,8 +1,23 @@
 import os
+import sys
+import math
+import time
 import cv2
 import imageio
 import argparse
-from ultralytics import YOLO
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# the inference backends live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from inference_backend import BACKENDS, set_torch_threads
+from tracker import Tracker, CountingLine
+from detection_cache import DetectionCache, CachedDetector, source_key
+
+# What to draw on one model's tile, in full-frame pixel coordinates:
+# boxes (N, 4) xyxy, box_labels (N,) strings, label (str) shown at the top of the tile, lines [(start, end)]
+TileOverlay = namedtuple("TileOverlay", ["boxes", "box_labels", "label", "lines"])
 
 def parse_timestamp(timestamp_str):
     """
@@ -17,8 +32,102 @@ def parse_timestamp(timestamp_str):
     else:
         raise ValueError("Timestamp format should be mm:ss or hh:mm:ss")
 
+class CompositeWriter:
+    """
+    Appends composite frames to an MP4 (OpenCV) or GIF (imageio) file as they are produced. MP4 frames are
+    encoded and written one at a time, so memory stays constant however long the clip is; imageio's GIF writer
+    keeps every frame until the file is closed, so GIF output grows with the clip.
+    """
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = fps
+        self.is_mp4 = path.lower().endswith(".mp4")
+        self._writer = None  # opened on the first frame, once the composite size is known
+        self.frames_written = 0
+
+    def append(self, frame):
+        """Append a BGR frame."""
+        if self.is_mp4:
+            if self._writer is None:
+                height, width = frame.shape[:2]
+                self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (width, height))
+            self._writer.write(frame)
+        else:
+            if self._writer is None:
+                self._writer = imageio.get_writer(self.path, mode="I", fps=self.fps, loop=0)
+            self._writer.append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        self.frames_written += 1
+
+    def close(self):
+        if self._writer is None:
+            return
+        if self.is_mp4:
+            self._writer.release()
+        else:
+            self._writer.close()
+        self._writer = None
+
+
+class MosaicCompositor:
+    """
+    Lays out one tile per model in an automatic rows x cols grid on a canvas that is allocated once.
+    The source frame is downscaled once straight into the first tile and copied to the others, and boxes and
+    labels are drawn at tile scale, so no full-resolution copy or concatenation is made per frame.
+    """
+    def __init__(self, num_tiles, frame_width, frame_height, scale=0.25):
+        """
+        Parameters:
+            num_tiles (int): number of tiles (models).
+            frame_width, frame_height (int): size of the source frames.
+            scale (float): tile size relative to the source frame.
+        """
+        self.num_tiles = num_tiles
+        self.cols = math.ceil(math.sqrt(num_tiles))
+        self.rows = math.ceil(num_tiles / self.cols)
+        self.tile_width = max(1, int(frame_width * scale))
+        self.tile_height = max(1, int(frame_height * scale))
+        self.scale_x = self.tile_width / frame_width
+        self.scale_y = self.tile_height / frame_height
+        self.canvas = np.zeros((self.rows * self.tile_height, self.cols * self.tile_width, 3), dtype=np.uint8)
+        # views into the canvas, written in place
+        self.tiles = []
+        for idx in range(num_tiles):
+            row, col = divmod(idx, self.cols)
+            y, x = row * self.tile_height, col * self.tile_width
+            self.tiles.append(self.canvas[y:y + self.tile_height, x:x + self.tile_width])
+        # text and line sizes follow the tile height
+        self.font_scale = self.tile_height / 432
+        self.thickness = max(1, round(self.font_scale * 2))
+
+    def compose(self, frame, overlays):
+        """Draw frame with each model's TileOverlay into its tile and return the canvas (reused on the next call)."""
+        cv2.resize(frame, (self.tile_width, self.tile_height), dst=self.tiles[0], interpolation=cv2.INTER_LINEAR)
+        for tile in self.tiles[1:]:
+            np.copyto(tile, self.tiles[0])
+        for tile, overlay in zip(self.tiles, overlays):
+            self.draw_overlay(tile, overlay)
+        return self.canvas
+
+    def draw_overlay(self, tile, overlay):
+        scale = np.array([self.scale_x, self.scale_y, self.scale_x, self.scale_y], dtype=np.float32)
+        boxes = (np.asarray(overlay.boxes, dtype=np.float32).reshape(-1, 4) * scale).astype(np.int32)
+        box_font = self.font_scale * 0.4
+        for (x1, y1, x2, y2), text in zip(boxes, overlay.box_labels):
+            cv2.rectangle(tile, (x1, y1), (x2, y2), (0, 255, 0), self.thickness)
+            cv2.putText(tile, text, (x1, max(0, y1 - 3)), cv2.FONT_HERSHEY_SIMPLEX, box_font, (0, 255, 0),
+                        max(1, self.thickness // 2))
+        for start, end in overlay.lines:
+            cv2.line(tile, (int(start[0] * self.scale_x), int(start[1] * self.scale_y)),
+                     (int(end[0] * self.scale_x), int(end[1] * self.scale_y)), (255, 0, 0), self.thickness)
+        cv2.putText(tile, overlay.label, (int(30 * self.font_scale), int(40 * self.font_scale)), cv2.FONT_HERSHEY_SIMPLEX,
+                    self.font_scale, (0, 255, 0), self.thickness, cv2.LINE_AA)
+
+
 class VideoInferenceComparator:
-    def __init__(self, video_path, start_time, end_time, model_paths, output_folder, frame_step=2):
+    def __init__(self, video_path, start_time, end_time, model_paths, output_folder, frame_step=2,
+                 backend="torch", threads=0, imgsz=640, track=False, detect_stride=1, count_line=None,
+                 output_format="mp4", save_frames=False, scale=0.25, parallel=False, cache_path=None,
+                 cache_max_mb=512):
         """
         Initializes the comparator with the video, timestamp range, models, and output folder.
         
@@ -27,8 +136,23 @@ class VideoInferenceComparator:
             start_time (float): Start time in seconds.
             end_time (float): End time in seconds.
             model_paths (list of str): List of file paths to the YOLO model weights.
-            output_folder (str): Folder where output frames and GIF will be saved.
+            output_folder (str): Folder where the comparison GIF/MP4 (and optionally the frames) will be saved.
             frame_step (int): Process every nth frame to save compute (default is 2).
+            backend (str): Inference backend used for every model: torch, onnx or openvino.
+            threads (int): CPU threads per model for the backend (0 keeps the backend default, or splits the
+                cores evenly between the models when running in parallel).
+            imgsz (int): Model input size.
+            track (bool): count people with a tracker instead of the raw number of boxes per frame.
+            detect_stride (int): with tracking, run the detectors only on every nth processed frame.
+            count_line (tuple | None): (x1, y1, x2, y2) of a counting line normalized to 0-1, counted with tracking.
+            output_format (str): "mp4" or "gif". MP4 composites are streamed into the file as they are produced;
+                GIF composites are held in memory until the end of the clip.
+            save_frames (bool): also save every composite as a JPEG in output_folder/frames.
+            scale (float): size of each model's tile in the composite relative to the video frame.
+            parallel (bool): run the models on each frame concurrently in a thread pool instead of one after another.
+            cache_path (str | None): SQLite detection cache. Frames already inferred with the same model, video
+                and parameters are read from it instead of running the model. None to disable.
+            cache_max_mb (int): size of the detection cache above which the least recently used entries are evicted.
         """
         self.video_path = video_path
         self.start_time = start_time
@@ -36,37 +160,140 @@ class VideoInferenceComparator:
         self.model_paths = model_paths
         self.frame_step = frame_step
         self.output_folder = output_folder
+        self.track = track
+        self.detect_stride = max(1, int(detect_stride)) if track else 1
+        self.count_line = count_line
+        self.trackers = None  # one per model, created on the first frame once the frame size is known
+        self.frames_processed = 0
+        self.output_format = output_format
+        self.save_frames = save_frames
+        self.scale = scale
         self.frames_folder = os.path.join(self.output_folder, "frames")
-        os.makedirs(self.frames_folder, exist_ok=True)
         os.makedirs(self.output_folder, exist_ok=True)
+        if self.save_frames:
+            os.makedirs(self.frames_folder, exist_ok=True)
         
-        # Load models
+        self.parallel = parallel and len(model_paths) > 1
+        if self.parallel and not threads:
+            # split the cores between the models so concurrent models do not oversubscribe them
+            threads = max(1, (os.cpu_count() or 1) // len(model_paths))
+        if backend == "torch":
+            # torch threads are process-wide, so they are set once for all the models
+            set_torch_threads(threads)
+        # every backend releases the GIL during inference, so threads are enough to run the models concurrently
+        self.executor = ThreadPoolExecutor(max_workers=len(model_paths)) if self.parallel else None
+        self.model_latencies = [[] for _ in model_paths]  # seconds per frame for each model
+        self.frame_latencies = []  # wall time in seconds to run every model on a frame
+
+        self.cache = DetectionCache(cache_path, max_bytes=cache_max_mb * 1024 * 1024) if cache_path else None
+        source = source_key(video_path) if self.cache else ""
+
+        # Load models. With the cache a model is only loaded once a frame is missing from it
         self.models = []
         for model_path in self.model_paths:
-            print(f"Loading model: {model_path}")
-            model = YOLO(model_path)
+            model = CachedDetector(self.cache, model_path, backend=backend, imgsz=imgsz, threads=threads, source=source)
+            if self.cache is None:
+                print(f"Loading model: {model_path}")
+                model.load()
             self.models.append(model)
     
-    def run_models_on_frame(self, frame):
+    def _predict(self, idx, frame, preprocessed, frame_index):
+        """Run model idx on frame, reusing the shared preprocessing if the backend supports it."""
+        start = time.perf_counter()
+        model = self.models[idx].detector
+        shared = preprocessed.get(getattr(model, "imgsz", None))
+        if shared is not None and hasattr(model, "predict_preprocessed"):
+            detections = model.predict_preprocessed(shared)[0]
+        else:
+            detections = model.predict([frame])[0]
+        self.model_latencies[idx].append(time.perf_counter() - start)
+        self.models[idx].store(frame_index, detections)
+        return detections
+
+    def predict_all(self, frame, frame_index):
+        """Run every model on frame, in parallel if enabled. Returns the Detections in model order."""
+        start = time.perf_counter()
+        # Frames already in the detection cache skip the model
+        all_detections = []
+        for idx, model in enumerate(self.models):
+            lookup_start = time.perf_counter()
+            detections = model.lookup(frame_index)
+            if detections is not None:
+                self.model_latencies[idx].append(time.perf_counter() - lookup_start)
+            all_detections.append(detections)
+        missing = [idx for idx, detections in enumerate(all_detections) if detections is None]
+        for idx in missing:
+            if not self.models[idx].loaded:
+                print(f"Loading model: {self.model_paths[idx]}")
+                self.models[idx].load()
+
+        # Letterbox the frame once per input size for the exported (onnx/openvino) models
+        preprocessed = {}
+        for idx in missing:
+            model = self.models[idx].detector
+            if hasattr(model, "predict_preprocessed") and model.imgsz not in preprocessed:
+                preprocessed[model.imgsz] = model.preprocess([frame])
+        if self.executor is not None and len(missing) > 1:
+            futures = {idx: self.executor.submit(self._predict, idx, frame, preprocessed, frame_index) for idx in missing}
+            for idx, future in futures.items():
+                all_detections[idx] = future.result()
+        else:
+            for idx in missing:
+                all_detections[idx] = self._predict(idx, frame, preprocessed, frame_index)
+        self.frame_latencies.append(time.perf_counter() - start)
+        return all_detections
+
+    def latency_report(self, last_only=False):
+        """Wall time per composite frame next to the latency of each model, in ms."""
+        if not self.frame_latencies:
+            return "no frames inferred"
+        pick = (lambda values: values[-1]) if last_only else (lambda values: sum(values) / len(values))
+        per_model = ", ".join(f"{os.path.basename(path)} {pick(latencies) * 1000:.0f} ms"
+                              for path, latencies in zip(self.model_paths, self.model_latencies))
+        return f"all models {pick(self.frame_latencies) * 1000:.0f} ms wall ({per_model})"
+
+    def run_models_on_frame(self, frame, frame_index):
         """
-        Runs inference on a single frame for each model.
-        Returns a list of annotated frames.
+        Runs inference on a single frame for each model. frame_index is the frame's position in the video,
+        used as its detection cache key.
+        Returns a list of TileOverlay, one per model.
         """
-        annotated_frames = []
+        if self.track and self.trackers is None:
+            height, width = frame.shape[:2]
+            self.trackers = []
+            for _ in self.models:
+                lines = []
+                if self.count_line:
+                    x1, y1, x2, y2 = self.count_line
+                    lines.append(CountingLine((x1 * width, y1 * height), (x2 * width, y2 * height)))
+                self.trackers.append(Tracker(lines=lines))
+        run_detector = self.frames_processed % self.detect_stride == 0
+        self.frames_processed += 1
+
+        all_detections = [None] * len(self.models)
+        if run_detector:
+            all_detections = self.predict_all(frame, frame_index)
+
+        overlays = []
         for idx, model in enumerate(self.models):
-            # Run inference (YOLO accepts a frame as a numpy array)
-            results = model(frame)
-            # Annotate the frame with detections (the result plot is a numpy array)
-            annotated = results[0].plot(line_width = 3, font_size = 0.5)
-            # Count the number of bounding boxes (detections)
-            num_boxes = len(results[0].boxes) if results[0].boxes is not None else 0
-            # Create a label that includes the model name and the detection count
-            label = f"{os.path.basename(self.model_paths[idx])}: {num_boxes} detections"
-            #label = os.path.basename(self.model_paths[idx])
-            cv2.putText(annotated, label, (120, 120), cv2.FONT_HERSHEY_SIMPLEX, 
-                        5, (0, 255, 0), 4, cv2.LINE_AA)
-            annotated_frames.append(annotated)
-        return annotated_frames
+            detections = all_detections[idx]
+            model_name = os.path.basename(self.model_paths[idx])
+            if self.track:
+                # The tracker carries identities between detector runs, so the count does not flicker
+                tracker = self.trackers[idx]
+                tracks = tracker.step(detections)
+                label = f"{model_name}: {tracker.count} in view, {tracker.unique_count} unique"
+                for line in tracker.lines:
+                    label += f", {line.crossed_in} in / {line.crossed_out} out"
+                overlays.append(TileOverlay(tracks.xyxy, [f"#{track_id}" for track_id in tracks.ids], label,
+                                            [(line.start, line.end) for line in tracker.lines]))
+            else:
+                box_labels = [f"{model.names.get(int(cls), int(cls))} {conf:.2f}"
+                              for conf, cls in zip(detections.conf, detections.cls)]
+                # Create a label that includes the model name and the detection count
+                label = f"{model_name}: {len(detections.conf)} detections"
+                overlays.append(TileOverlay(detections.xyxy, box_labels, label, []))
+        return overlays
 
     def process_video(self):
         cap = cv2.VideoCapture(self.video_path)
@@ -85,57 +312,52 @@ class VideoInferenceComparator:
         current_frame = start_frame
         frame_counter = 0
 
-        # Process frames and save to disk without storing in memory
-        while cap.isOpened() and current_frame <= end_frame:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if (frame_counter % self.frame_step) == 0:
-                annotated_list = self.run_models_on_frame(frame)
-                
-                # For a grid layout, if needed (for 4 models as an example):
-                if len(annotated_list) == 4:
-                    row1 = cv2.hconcat([annotated_list[0], annotated_list[1]])
-                    row2 = cv2.hconcat([annotated_list[2], annotated_list[3]])
-                    combined = cv2.vconcat([row1, row2])
-                else:
-                    combined = cv2.hconcat(annotated_list)
-                
-                scale_factor = 0.25  # adjust this value as needed
-                new_width = int(combined.shape[1] * scale_factor)
-                new_height = int(combined.shape[0] * scale_factor)
-                combined = cv2.resize(combined, (new_width, new_height))
-
-
-                frame_filename = os.path.join(self.frames_folder, f"frame_{current_frame:06d}.jpg")
-                cv2.imwrite(frame_filename, combined)
-                print(f"Saved frame {current_frame} to {frame_filename}")
-
-            current_frame += 1
-            frame_counter += 1
-
-        cap.release()
-
-        # Now read the saved images from disk to create the GIF.
-        frame_files = sorted([os.path.join(self.frames_folder, f)
-                            for f in os.listdir(self.frames_folder)
-                            if f.endswith(".jpg")])
-        processed_frames = []
-        for file in frame_files:
-            # imageio reads the image in RGB format.
-            frame = imageio.imread(file)
-            processed_frames.append(frame)
-        
-        # Calculate frame duration for the GIF.
-        fps = len(processed_frames) / (self.end_time - self.start_time)
-        gif_path = os.path.join(self.output_folder, "comparison.gif")
-        imageio.mimsave(gif_path, processed_frames, fps=fps, loop=0)#, optimize=False)
-        print(f"GIF saved to {gif_path}")
+        # Composites are streamed into the output file as they are produced, so memory does not grow with the segment
+        output_path = os.path.join(self.output_folder, f"comparison.{self.output_format}")
+        writer = CompositeWriter(output_path, fps=fps / self.frame_step)
+        compositor = None  # sized on the first frame
+        try:
+            while cap.isOpened() and current_frame <= end_frame:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                if (frame_counter % self.frame_step) == 0:
+                    frames_inferred = len(self.frame_latencies)
+                    overlays = self.run_models_on_frame(frame, current_frame)
+                    if compositor is None:
+                        compositor = MosaicCompositor(len(self.models), frame.shape[1], frame.shape[0], scale=self.scale)
+                    combined = compositor.compose(frame, overlays)
+
+                    writer.append(combined)
+                    if self.save_frames:
+                        frame_filename = os.path.join(self.frames_folder, f"frame_{current_frame:06d}.jpg")
+                        cv2.imwrite(frame_filename, combined)
+                        print(f"Saved frame {current_frame} to {frame_filename}")
+                    else:
+                        print(f"Processed frame {current_frame}")
+                    if len(self.frame_latencies) > frames_inferred:
+                        print(f"  {self.latency_report(last_only=True)}")
+
+                current_frame += 1
+                frame_counter += 1
+        finally:
+            cap.release()
+            writer.close()
+            if self.executor is not None:
+                self.executor.shutdown()
+            if self.cache is not None:
+                self.cache.close()
+                print("Detection cache:", self.cache.stats())
+
+        mode = "in parallel" if self.parallel else "sequentially"
+        print(f"Mean latency with the models run {mode}: {self.latency_report()}")
+
+        print(f"{self.output_format.upper()} with {writer.frames_written} frames saved to {output_path}")
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Compare multiple YOLO models on a video segment and create a GIF.")
+    parser = argparse.ArgumentParser(description="Compare multiple YOLO models on a video segment and create a GIF or MP4.")
     parser.add_argument("--video_path", type=str, required=True, help="Path to the video file.")
     parser.add_argument("--start_time", type=str, required=True,
                         help="Start time (mm:ss or hh:mm:ss) for the segment.")
@@ -143,8 +365,27 @@ def main():
                         help="(Optional) End time (mm:ss or hh:mm:ss) for the segment. Defaults to 10 seconds after start time if not provided.")
     parser.add_argument("--model_paths", type=str, required=True,
                         help="Comma-separated list of file paths for the YOLO models.")
-    parser.add_argument("--output_folder", type=str, default="output", help="Folder to save output frames and GIF.")
+    parser.add_argument("--output_folder", type=str, default="output", help="Folder to save the GIF/MP4 (and frames).")
+    parser.add_argument("--output_format", type=str, default="mp4", choices=["mp4", "gif"],
+                        help="Output file format. mp4 is written in constant memory, gif holds every frame until the end.")
+    parser.add_argument("--save_frames", action="store_true", help="Also save every composite frame as a JPEG.")
+    parser.add_argument("--scale", type=float, default=0.25, help="Size of each model's tile relative to the video frame.")
     parser.add_argument("--frame_step", type=int, default=4, help="Process every nth frame (default: 2).")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS,
+                        help="Inference backend. .pt weights are exported for onnx/openvino on first use.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="CPU threads per model (0 keeps the backend default, or splits the cores with --parallel).")
+    parser.add_argument("--parallel", action="store_true", help="Run the models on each frame concurrently.")
+    parser.add_argument("--cache_path", type=str, default="",
+                        help="Detection cache (e.g. detection_cache.sqlite), so re-renders of the same clip skip the "
+                             "models. Disabled if not given.")
+    parser.add_argument("--cache_max_mb", type=int, default=512, help="Size limit of the detection cache in MB.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Model input size.")
+    parser.add_argument("--track", action="store_true", help="Count people with a tracker instead of boxes per frame.")
+    parser.add_argument("--detect_stride", type=int, default=1,
+                        help="With --track, run the detectors only on every nth processed frame.")
+    parser.add_argument("--count_line", type=str, default=None,
+                        help="With --track, count crossings of the line x1,y1,x2,y2 (normalized 0-1).")
     args = parser.parse_args()
 
     start_sec = parse_timestamp(args.start_time)
@@ -154,6 +395,7 @@ def main():
         end_sec = start_sec + 10  # Default to 10 seconds after the start time
 
     models_list = [mp.strip() for mp in args.model_paths.split(",")]
+    count_line = tuple(float(v) for v in args.count_line.split(",")) if args.count_line else None
 
     comparator = VideoInferenceComparator(
         video_path=args.video_path,
@@ -161,7 +403,19 @@ def main():
         end_time=end_sec,
         model_paths=models_list,
         output_folder=args.output_folder,
-        frame_step=args.frame_step
+        frame_step=args.frame_step,
+        backend=args.backend,
+        threads=args.threads,
+        imgsz=args.imgsz,
+        track=args.track,
+        detect_stride=args.detect_stride,
+        count_line=count_line,
+        output_format=args.output_format,
+        save_frames=args.save_frames,
+        scale=args.scale,
+        parallel=args.parallel,
+        cache_path=args.cache_path or None,
+        cache_max_mb=args.cache_max_mb,
     )
     comparator.process_video()
 
@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+
+# =========================
+# Micro-batched inference
+# Frames are submitted one at a time and collected into micro-batches that are bounded both by size and by
+# how long the first frame of the batch has been waiting. Each batch is run through the model in a single
+# forward pass and every result is handed back to the callback submitted with its frame.
+# Larger batches give more throughput, a shorter wait gives lower latency.
+# =========================
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=4, max_wait=0.25, max_queue=32, metrics=None):
+        """
+        Parameters:
+            predict_fn (callable): takes a list of frames and returns a list of results in the same order.
+            max_batch_size (int): maximum number of frames per forward pass.
+            max_wait (float): maximum seconds the first frame of a batch waits for the batch to fill up.
+            max_queue (int): maximum number of frames waiting for inference before submit() blocks.
+            metrics (StageMetrics | None): if given, every forward pass is recorded as the "inference" stage
+                and the "batches" and "frames_inferred" counters are updated.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._closed = False
+
+        # counters
+        self.batches_run = 0
+        self.frames_inferred = 0
+        self.last_batch_size = 0
+        self.last_batch_latency = 0.0  # seconds spent in predict_fn for the last batch
+
+        self._thread = threading.Thread(target=self._worker, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, callback):
+        """
+        Queue a frame for inference. callback(frame, result) is called from the batching thread, with result None
+        if inference failed for the frame's batch.
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        self._queue.put((frame, callback))
+
+    def _collect_batch(self):
+        """Block for the first frame, then gather more until the batch is full or max_wait has passed."""
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _worker(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect_batch()
+            if not batch:
+                continue
+            frames = [frame for frame, _ in batch]
+            start = time.monotonic()
+            try:
+                results = self.predict_fn(frames)
+            except Exception:
+                # every frame of the batch gets None, which callbacks must treat as a failure, not as no detections
+                logger.exception("Inference failed for a batch of %d frames", len(frames))
+                results = [None] * len(frames)
+            self.last_batch_latency = time.monotonic() - start
+            self.last_batch_size = len(frames)
+            self.batches_run += 1
+            self.frames_inferred += len(frames)
+            if self.metrics is not None:
+                self.metrics.record("inference", self.last_batch_latency)
+                self.metrics.count("batches")
+                self.metrics.count("frames_inferred", len(frames))
+            for (frame, callback), result in zip(batch, results):
+                try:
+                    callback(frame, result)
+                except Exception:
+                    logger.exception("Inference callback failed")
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "batches_run": self.batches_run,
+            "frames_inferred": self.frames_inferred,
+            "mean_batch_size": self.frames_inferred / self.batches_run if self.batches_run else 0.0,
+            "last_batch_latency": self.last_batch_latency,
+        }
+
+    def close(self):
+        """Run inference on every frame still queued, then stop the batching thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
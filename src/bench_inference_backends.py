@@ -0,0 +1,101 @@
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from box_ops import box_iou
+from inference_backend import load_detector, set_torch_threads, BACKENDS
+
+# =========================
+# Latency and agreement of the inference backends
+# Runs the same frames through every backend, reports per-frame latency, and compares the boxes of each
+# backend with the PyTorch (ultralytics) reference.
+# =========================
+
+valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_frames(source, num_frames):
+    """Read up to num_frames frames from an image directory or a video file."""
+    frames = []
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if os.path.splitext(filename)[1].lower() in valid_extensions:
+                frame = cv2.imread(os.path.join(source, filename))
+                if frame is not None:
+                    frames.append(frame)
+            if len(frames) >= num_frames:
+                break
+    else:
+        cap = cv2.VideoCapture(source)
+        while len(frames) < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    return frames
+
+
+def compare_detections(reference, detections):
+    """Return (count difference, mean IoU of matched boxes, max corner deviation in pixels) for one frame."""
+    count_diff = len(detections.conf) - len(reference.conf)
+    if len(reference.conf) == 0 or len(detections.conf) == 0:
+        return count_diff, 1.0 if len(reference.conf) == len(detections.conf) else 0.0, 0.0
+    iou = box_iou(reference.xyxy, detections.xyxy)
+    best = iou.argmax(axis=1)
+    deviation = np.abs(reference.xyxy - detections.xyxy[best]).max()
+    return count_diff, float(iou.max(axis=1).mean()), float(deviation)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency and boxes of the inference backends.")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the .pt weights.")
+    parser.add_argument("--source", type=str, required=True, help="Image directory or video file.")
+    parser.add_argument("--backends", type=str, default=",".join(BACKENDS),
+                        help="Comma-separated backends to compare (torch is always run as the reference).")
+    parser.add_argument("--num_frames", type=int, default=50, help="Number of frames to run.")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per backend (0 keeps the default).")
+    parser.add_argument("--imgsz", type=int, default=640, help="Model input size.")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold.")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed warm-up frames per backend.")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.num_frames)
+    if not frames:
+        print(f"No frames found in {args.source}")
+        exit()
+    print(f"Loaded {len(frames)} frames from {args.source}")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")
+
+    reference = None
+    for backend in backends:
+        if backend == "torch":
+            set_torch_threads(args.threads)
+        detector = load_detector(args.model_path, backend=backend, imgsz=args.imgsz, threads=args.threads)
+        for frame in frames[:args.warmup]:
+            detector.predict([frame], conf=args.conf)
+        latencies, outputs = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            outputs.append(detector.predict([frame], conf=args.conf)[0])
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies) * 1000
+        line = (f"{backend:>9}: p50 {np.percentile(latencies, 50):7.1f} ms  p95 {np.percentile(latencies, 95):7.1f} ms  "
+                f"{1000 / latencies.mean():6.1f} FPS")
+        if backend == "torch":
+            reference = outputs
+        else:
+            comparisons = np.array([compare_detections(r, d) for r, d in zip(reference, outputs)])
+            line += (f"  | vs torch: mean |count diff| {np.abs(comparisons[:, 0]).mean():.2f}, "
+                     f"mean IoU {comparisons[:, 1].mean():.3f}, max deviation {comparisons[:, 2].max():.1f} px")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+
+from yolo_labels import format_labels, read_label_dir, xyxy_to_xywhn
+
+# =========================
+# Benchmark of the shared YOLO label codec against the per-box Python loops it replaced.
+# Writes a synthetic label directory (or uses an existing one) and times reading the whole directory
+# and encoding detections as label text with both implementations.
+# =========================
+
+
+def legacy_read(annotation_file):
+    # the loop previously used by manual_train_annotation.py and test_assess.py
+    boxes = []
+    with open(annotation_file, 'r') as f:
+        lines = f.readlines()
+    for line in lines:
+        box = line.strip().split(' ')
+        if len(box) != 5:
+            continue
+        box = [float(x) for x in box]
+        box[0] = int(box[0])
+        boxes.append(box)
+    return boxes
+
+
+def legacy_encode(boxes, width, height):
+    # the loop previously used by capture_finetuning_images.py
+    lines = []
+    for box in boxes:
+        x1, y1, x2, y2, conf, cls = box
+        x_center = ((x1 + x2) / 2.0) / width
+        y_center = ((y1 + y2) / 2.0) / height
+        bbox_width = (x2 - x1) / width
+        bbox_height = (y2 - y1) / height
+        lines.append(f"0 {x_center:.6f} {y_center:.6f} {bbox_width:.6f} {bbox_height:.6f}\n")
+    return "".join(lines)
+
+
+def make_label_dir(directory, num_files, boxes_per_file, rng):
+    for i in range(num_files):
+        n = rng.integers(0, 2 * boxes_per_file + 1)
+        xywhn = rng.uniform(0.05, 0.95, size=(n, 4)).astype(np.float32)
+        with open(os.path.join(directory, f"frame_{i:07d}.txt"), "w") as f:
+            f.write(format_labels(0, xywhn))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized YOLO label codec against per-box loops.")
+    parser.add_argument("--label_dir", type=str, default=None,
+                        help="Existing label directory to read. A synthetic one is generated if not given.")
+    parser.add_argument("--num_files", type=int, default=20000, help="Number of synthetic label files.")
+    parser.add_argument("--boxes_per_file", type=int, default=8, help="Mean number of boxes per synthetic file.")
+    parser.add_argument("--encode_boxes", type=int, default=200000, help="Number of detections to encode.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tmp_dir = None
+    label_dir = args.label_dir
+    if label_dir is None:
+        tmp_dir = label_dir = tempfile.mkdtemp(prefix="label_bench_")
+        print(f"Writing {args.num_files} synthetic label files to {label_dir}...")
+        make_label_dir(label_dir, args.num_files, args.boxes_per_file, rng)
+
+    try:
+        names = sorted(f for f in os.listdir(label_dir) if f.lower().endswith(".txt"))
+        legacy, legacy_time = timed(lambda: [legacy_read(os.path.join(label_dir, n)) for n in names])
+        label_set, codec_time = timed(read_label_dir, label_dir, names)
+        assert sum(len(b) for b in legacy) == len(label_set.classes)
+        print(f"Read {len(names)} files / {len(label_set.classes)} boxes: "
+              f"legacy {legacy_time:.3f} s, codec {codec_time:.3f} s ({legacy_time / codec_time:.1f}x)")
+
+        width, height = 1920, 1080
+        x1y1 = rng.uniform(0, 1000, size=(args.encode_boxes, 2))
+        detections = np.column_stack([x1y1, x1y1 + rng.uniform(5, 200, size=(args.encode_boxes, 2)),
+                                      rng.uniform(0, 1, args.encode_boxes), np.zeros(args.encode_boxes)]).astype(np.float32)
+        legacy_text, legacy_time = timed(legacy_encode, detections, width, height)
+        codec_text, codec_time = timed(lambda: format_labels(0, xyxy_to_xywhn(detections[:, :4], width, height)))
+        print(f"Encoded {args.encode_boxes} boxes: "
+              f"legacy {legacy_time:.3f} s, codec {codec_time:.3f} s ({legacy_time / codec_time:.1f}x)")
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import time
+import argparse
+
+import cv2
+
+from yolo_labels import read_labels
+from evaluate_model import label_path_of
+from pack_dataset import PackedSplit, ensure_packed, resolve_splits
+
+# =========================
+# Benchmark of one training epoch of data loading from JPEG files against a packed split (see pack_dataset.py).
+# The JPEG path does what Ultralytics does for every sample: decode the image, resize its long side to imgsz and
+# read its labels. The packed path copies the letterboxed image out of the memory map and slices its labels.
+# With --ultralytics, a full epoch of YOLODataset and PackedYOLODataset samples (augmentations included) is timed
+# as well. Every pass is run --repeat times; the first pass of each path may include reading from disk.
+# Example:
+#   python src/bench_packed_dataset.py data_webcam.yaml --split train --imgsz 640
+# =========================
+
+
+def jpeg_epoch(image_paths, imgsz):
+    for image_path in image_paths:
+        image = cv2.imread(image_path)
+        h0, w0 = image.shape[:2]
+        r = imgsz / max(h0, w0)
+        if r != 1:
+            image = cv2.resize(image, (min(round(w0 * r), imgsz), min(round(h0 * r), imgsz)),
+                               interpolation=cv2.INTER_LINEAR)
+        read_labels(label_path_of(image_path))
+
+
+def packed_epoch(packed):
+    for i in range(len(packed)):
+        packed.image(i)
+        packed.image_labels(i)
+
+
+def dataset_epoch(dataset):
+    for i in range(len(dataset)):
+        dataset[i]
+
+
+def timed_passes(name, func, repeat, count):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    print(f"{name}: first {times[0]:.2f} s, best {min(times):.2f} s ({count / min(times):.0f} images/s)")
+    return min(times)
+
+
+def build_datasets(data, image_list, packed_dir, imgsz):
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_yolo_dataset
+    from packed_training import build_packed_dataset
+
+    cfg = get_cfg(overrides={"imgsz": imgsz})
+    data = {"names": data["names"], "nc": len(data["names"]), "channels": 3}
+    return (build_yolo_dataset(cfg, image_list, batch=16, data=data, mode="train"),
+            build_packed_dataset(cfg, packed_dir, batch=16, data=data, mode="train"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time an epoch of data loading from JPEGs and from a packed split.")
+    parser.add_argument("data_yaml", type=str, help="Data yaml, e.g. data_webcam.yaml.")
+    parser.add_argument("--split", type=str, default="train", help="Split to time.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Training image size.")
+    parser.add_argument("--out_root", type=str, default="datasets/packed", help="Directory of the packed splits.")
+    parser.add_argument("--datasets_dir", type=str, default=None,
+                        help="Directory relative split paths are resolved against (default: resolved by Ultralytics "
+                             "like training does).")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the split per path.")
+    parser.add_argument("--ultralytics", action="store_true",
+                        help="Also time full YOLODataset and PackedYOLODataset epochs with augmentations.")
+    args = parser.parse_args()
+
+    packed_yaml = ensure_packed(args.data_yaml, args.imgsz, args.out_root, args.datasets_dir)
+    data, splits = resolve_splits(args.data_yaml, args.datasets_dir)
+    _, packed_splits = resolve_splits(packed_yaml, args.datasets_dir)
+    packed = PackedSplit(packed_splits[args.split])
+    image_paths = packed.im_files
+    print(f"{args.split}: {len(image_paths)} images at imgsz {args.imgsz}")
+
+    jpeg_time = timed_passes("JPEG decode + resize + labels", lambda: jpeg_epoch(image_paths, args.imgsz),
+                             args.repeat, len(image_paths))
+    packed_time = timed_passes("Packed memmap copy + labels", lambda: packed_epoch(packed),
+                               args.repeat, len(image_paths))
+    print(f"Packed loading is {jpeg_time / packed_time:.1f}x faster")
+
+    if args.ultralytics:
+        jpeg_dataset, packed_dataset = build_datasets(data, splits[args.split], packed_splits[args.split], args.imgsz)
+        jpeg_time = timed_passes("YOLODataset epoch", lambda: dataset_epoch(jpeg_dataset),
+                                 args.repeat, len(jpeg_dataset))
+        packed_time = timed_passes("PackedYOLODataset epoch", lambda: dataset_epoch(packed_dataset),
+                                   args.repeat, len(packed_dataset))
+        print(f"Packed training epochs load {jpeg_time / packed_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
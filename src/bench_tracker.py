@@ -0,0 +1,86 @@
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from inference_backend import load_detector, BACKENDS
+from tracker import Tracker
+
+# =========================
+# Detector stride the tracker allows
+# Runs the detector once on every frame of a video segment and caches the detections. The tracker is then
+# replayed with the detections of only every stride-th frame and its per-frame count is compared with the
+# count of the tracker fed on every frame. The largest stride whose mean absolute count error stays within
+# --tolerance is the detector stride that keeps the count accuracy unchanged.
+# =========================
+
+
+def read_detections(detector, video_path, max_frames, class_id, conf):
+    """Run the detector on the first max_frames frames. Returns the detections and the mean latency."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file {video_path}")
+    detections, latencies = [], []
+    while len(detections) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        detections.append(detector.predict([frame], classes=[class_id], conf=conf)[0])
+        latencies.append(time.perf_counter() - start)
+    cap.release()
+    return detections, float(np.mean(latencies)) if latencies else 0.0
+
+
+def replay(detections, stride):
+    """Feed the tracker every stride-th detection. Returns per-frame counts, unique count and tracker time per frame."""
+    tracker = Tracker()
+    counts = np.zeros(len(detections), dtype=np.int64)
+    start = time.perf_counter()
+    for index, frame_detections in enumerate(detections):
+        tracker.step(frame_detections if index % stride == 0 else None)
+        counts[index] = tracker.count
+    elapsed = time.perf_counter() - start
+    return counts, tracker.unique_count, elapsed / max(1, len(detections))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the detector stride the tracker allows at unchanged count accuracy.")
+    parser.add_argument("--video_path", type=str, required=True, help="Path to the video file.")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the model weights.")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS, help="Inference backend.")
+    parser.add_argument("--target_label", type=str, default="person", help="Class to count.")
+    parser.add_argument("--conf", type=float, default=0.4, help="Confidence threshold.")
+    parser.add_argument("--max_frames", type=int, default=600, help="Number of frames to run.")
+    parser.add_argument("--strides", type=str, default="1,2,3,4,6,8,12", help="Comma-separated detector strides.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Largest mean absolute count error (people) that counts as unchanged accuracy.")
+    args = parser.parse_args()
+
+    detector = load_detector(args.model_path, backend=args.backend)
+    class_id = next((k for k, v in detector.names.items() if v == args.target_label), None)
+    if class_id is None:
+        print(f"Target label '{args.target_label}' not found in model classes.")
+        exit()
+
+    detections, inference_time = read_detections(detector, args.video_path, args.max_frames, class_id, args.conf)
+    print(f"Ran the detector on {len(detections)} frames, {inference_time * 1000:.1f} ms per frame")
+    raw_counts = np.array([len(d.conf) for d in detections])
+    reference, _, _ = replay(detections, 1)
+
+    allowed = 1
+    for stride in sorted(int(s) for s in args.strides.split(",")):
+        counts, unique, track_time = replay(detections, stride)
+        error = np.abs(counts - reference).mean()
+        if error <= args.tolerance:
+            allowed = max(allowed, stride)
+        per_frame = inference_time / stride + track_time
+        print(f"stride {stride:3d}: count MAE vs stride 1 {error:.3f}, vs raw detections {np.abs(counts - raw_counts).mean():.3f}, "
+              f"unique {unique}, tracker {track_time * 1000:.3f} ms/frame, "
+              f"detector + tracker {per_frame * 1000:.1f} ms/frame ({inference_time / per_frame:.1f}x faster)")
+    print(f"Largest detector stride within {args.tolerance} people of the every-frame count: {allowed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from inference_backend import load_detector, resolve_model, set_torch_threads, BACKENDS
+from bench_inference_backends import load_frames
+
+# =========================
+# Model benchmark suite
+# Runs every combination of weights x imgsz x batch size x threads x backend on a fixed local image
+# directory or video and reports p50/p95 latency, throughput, peak memory and the mean number of detections
+# per frame, written as JSON and CSV. Every combination runs in a fresh process, so peak RSS belongs to that
+# combination alone and one backend's thread pools do not affect the next.
+# Example:
+#   python benchmark_models.py --weights yolo11n.pt,finetune/.../best.pt --source datasets/dataset_webcam/images/test
+#       --imgsz 480,640 --batch 1,4 --threads 2,4 --backends torch,onnx,openvino
+# =========================
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_config(config):
+    """Benchmark one combination. Runs in its own process; returns a result dict."""
+    result = dict(config)
+    try:
+        frames = load_frames(config["source"], config["num_frames"])
+        if not frames:
+            raise IOError(f"No frames found in {config['source']}")
+        load_start = time.perf_counter()
+        if config["backend"] == "torch":
+            set_torch_threads(config["threads"])  # each config runs in its own process
+        detector = load_detector(config["weights"], backend=config["backend"], imgsz=config["imgsz"],
+                                 threads=config["threads"])
+        result["load_s"] = time.perf_counter() - load_start
+        # the input size the model actually runs at; a fixed-shape model file can differ from the requested imgsz
+        result["run_imgsz"] = detector.imgsz
+
+        batch_size = config["batch"]
+        # cycle through the frame set so every iteration gets a full batch
+        batches = [[frames[(i * batch_size + j) % len(frames)] for j in range(batch_size)]
+                   for i in range(config["warmup"] + config["iters"])]
+        for batch in batches[:config["warmup"]]:
+            detector.predict(batch, conf=config["conf"])
+
+        latencies, counts = [], []
+        for batch in batches[config["warmup"]:]:
+            start = time.perf_counter()
+            detections = detector.predict(batch, conf=config["conf"])
+            latencies.append(time.perf_counter() - start)
+            counts.extend(len(d.conf) for d in detections)
+        latencies = np.array(latencies) * 1000
+        result.update({
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "mean_ms": float(latencies.mean()),
+            "p50_ms_per_frame": float(np.percentile(latencies, 50) / batch_size),
+            "fps": float(batch_size * len(latencies) / (latencies.sum() / 1000)),
+            "peak_rss_mb": peak_rss_mb(),
+            "mean_count": float(np.mean(counts)),
+            "error": "",
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def parse_list(text, cast=str):
+    return [cast(value.strip()) for value in text.split(",") if value.strip()]
+
+
+def environment():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def write_results(output, env, results):
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(f"{output}.json", "w") as f:
+        json.dump({"environment": env, "results": results}, f, indent=2)
+    fields = ["weights", "backend", "imgsz", "run_imgsz", "batch", "threads", "p50_ms", "p95_ms", "mean_ms", "p50_ms_per_frame",
+              "fps", "peak_rss_mb", "mean_count", "load_s", "error"]
+    with open(f"{output}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark models over a grid of image size, batch, threads and backend.")
+    parser.add_argument("--weights", type=str, required=True, help="Comma-separated model weights (.pt).")
+    parser.add_argument("--source", type=str, required=True, help="Image directory or video file used for every run.")
+    parser.add_argument("--imgsz", type=str, default="640", help="Comma-separated model input sizes.")
+    parser.add_argument("--batch", type=str, default="1", help="Comma-separated batch sizes.")
+    parser.add_argument("--threads", type=str, default="0", help="Comma-separated CPU thread counts (0 = backend default).")
+    parser.add_argument("--backends", type=str, default="torch", help=f"Comma-separated backends from {BACKENDS}.")
+    parser.add_argument("--num_frames", type=int, default=32, help="Number of frames loaded from the source.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed warm-up iterations per combination.")
+    parser.add_argument("--iters", type=int, default=50, help="Timed iterations (batches) per combination.")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold.")
+    parser.add_argument("--output", type=str, default="benchmarks/benchmark",
+                        help="Output path without extension; <output>.json and <output>.csv are written.")
+    args = parser.parse_args()
+
+    backends = parse_list(args.backends)
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error(f"Unknown backend '{backend}'. Expected one of {BACKENDS}")
+    grid = itertools.product(parse_list(args.weights), backends, parse_list(args.imgsz, int),
+                             parse_list(args.batch, int), parse_list(args.threads, int))
+    configs = [
+        {"weights": weights, "backend": backend, "imgsz": imgsz, "batch": batch, "threads": threads,
+         "source": args.source, "num_frames": args.num_frames, "warmup": args.warmup, "iters": args.iters,
+         "conf": args.conf}
+        for weights, backend, imgsz, batch, threads in grid
+    ]
+
+    # Exports are created up front, so no timed process pays for (or races on) exporting a model
+    for weights, backend, imgsz in sorted({(c["weights"], c["backend"], c["imgsz"]) for c in configs}):
+        if backend != "torch":
+            resolve_model(weights, backend, imgsz)
+
+    env = environment()
+    results = []
+    context = multiprocessing.get_context("spawn")
+    print(f"Running {len(configs)} combinations on {args.source}")
+    for index, config in enumerate(configs, start=1):
+        # a fresh process per combination, so peak RSS and thread settings do not leak between runs
+        with context.Pool(1) as pool:
+            result = pool.apply(run_config, (config,))
+        results.append(result)
+        name = f"{os.path.basename(config['weights'])} {config['backend']} imgsz={config['imgsz']} batch={config['batch']} threads={config['threads']}"
+        if result.get("run_imgsz", config["imgsz"]) != config["imgsz"]:
+            name += f" (runs at imgsz={result['run_imgsz']})"
+        if result["error"]:
+            print(f"[{index}/{len(configs)}] {name}: failed: {result['error']}")
+        else:
+            print(f"[{index}/{len(configs)}] {name}: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+                  f"{result['fps']:.1f} FPS, peak RSS {result['peak_rss_mb']:.0f} MB, mean count {result['mean_count']:.2f}")
+        # written after every combination, so a long run can be inspected or interrupted
+        write_results(args.output, env, results)
+    print(f"Results written to {args.output}.json and {args.output}.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import numpy as np
+
+# =========================
+# Vectorized box operations on (N, 4) arrays of pixel (x1, y1, x2, y2) boxes
+# =========================
+
+
+def box_area(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def box_iou(boxes_a, boxes_b):
+    """Return the (N, M) matrix of IoUs between every box of boxes_a (N, 4) and boxes_b (M, 4)."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    intersection = wh[..., 0] * wh[..., 1]
+    union = box_area(boxes_a)[:, None] + box_area(boxes_b)[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold=0.7, classes=None, max_det=300):
+    """
+    Greedy non-maximum suppression. Returns the indices of the kept boxes, highest score first.
+    If classes is given, boxes only suppress boxes of the same class.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if classes is not None:
+        # shift each class into its own coordinate range so boxes of different classes never overlap
+        offsets = np.asarray(classes, dtype=np.float32).reshape(-1, 1) * (boxes.max() + 1)
+        boxes = boxes + offsets
+    order = np.argsort(-scores, kind="stable")
+    areas = box_area(boxes)
+    keep = []
+    while order.size and len(keep) < max_det:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[rest, 2:])
+        wh = np.clip(bottom_right - top_left, 0, None)
+        intersection = wh[:, 0] * wh[:, 1]
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
@@ -1,11 +1,19 @@
 import os
+import time
 import cv2
 from datetime import datetime, timedelta
-import time
-from ultralytics import YOLO
-import torch
 
-from config.config import frame_capture_settings
+from config.config import frame_capture_settings, CameraSettings
+from capture_source import ThreadedCapture
+from frame_writer import FrameWriterPool
+from batched_inference import MicroBatcher
+from frame_dedup import DuplicateFilter
+from yolo_labels import format_labels, xyxy_to_xywhn
+from stage_metrics import StageMetrics, MetricsReporter
+from inference_backend import load_detector, draw_detections, set_torch_threads
+from roi_inference import RegionPlan
+from motion_gate import MotionGate
+from label_index import LabelIndex
 
 def get_key_by_value(dictionary, value):
     for key, val in dictionary.items():
@@ -14,33 +22,218 @@ def get_key_by_value(dictionary, value):
     return None
 
 
+def yolo_label_text(detections, width, height):
+    """Encode the boxes of a frame's Detections as the text of a YOLO annotation file (class 0, normalized)."""
+    if detections is None:
+        return ""
+    return format_labels(0, xyxy_to_xywhn(detections.xyxy, width, height))
+
+
+def draw_result(frame, detections):
+    """Draw a frame's Detections on it (in place)."""
+    if detections is None:
+        return frame
+    return draw_detections(frame, detections)
+
+
+def camera_region_plan(camera):
+    """RegionPlan of a CameraSettings entry. ROI and tiling fields left unset fall back to the single camera settings."""
+    def setting(name):
+        value = getattr(camera, name)
+        return value if value is not None else getattr(frame_capture_settings, name)
+    return RegionPlan(setting("roi_polygons"), tile_size=setting("tile_size"), tile_overlap=setting("tile_overlap"))
+
+
+def build_motion_gate(enabled=None):
+    """
+    A MotionGate configured from the settings, or None if motion gating is disabled. enabled defaults to
+    motion_gate_enabled (the counting service's setting).
+    """
+    if not (frame_capture_settings.motion_gate_enabled if enabled is None else enabled):
+        return None
+    return MotionGate(
+        pixel_threshold=frame_capture_settings.motion_pixel_threshold,
+        min_changed_fraction=frame_capture_settings.motion_min_changed_fraction,
+        max_skip=frame_capture_settings.motion_max_skip_s,
+    )
+
+
+class CameraStream:
+    """
+    One camera of a capture run: its reader thread, output directories, duplicate filter and counters.
+    All cameras of a run share one model and one writer pool.
+    """
+    def __init__(self, webcam_url, webcam_name, frame_interval, img_dir, default_label_dir, dedup=None, regions=None):
+        self.webcam_url = webcam_url
+        self.webcam_name = webcam_name
+        self.frame_interval = frame_interval
+        self.img_dir = img_dir
+        self.default_label_dir = default_label_dir
+        self.dedup = dedup
+        self.regions = regions or RegionPlan()  # ROI polygons and tiling used for this camera's inference
+        # frames of a static scene are skipped (neither saved nor run through the model), never given old labels
+        self.motion_gate = build_motion_gate(frame_capture_settings.capture_motion_gate_enabled)
+        self.capture = None
+        self.frames_saved = 0
+        self.frames_duplicate = 0
+        self.frames_static = 0
+
+    def start(self, metrics=None):
+        # Frames are read on a background thread and only every frame_interval-th frame is decoded
+        self.capture = ThreadedCapture(
+            self.webcam_url,
+            frame_interval=self.frame_interval,
+            buffer_size=frame_capture_settings.capture_buffer_size,
+            metrics=metrics,
+            name=self.webcam_name,
+        ).start()
+        return self
+
+    def stop(self):
+        if self.capture is not None:
+            self.capture.stop()
+
+    def stats(self):
+        stats = dict(self.capture.stats()) if self.capture is not None else {}
+        stats["frames_saved"] = self.frames_saved
+        stats["frames_duplicate"] = self.frames_duplicate
+        stats["frames_static"] = self.frames_static
+        if self.motion_gate is not None:
+            stats.update(self.motion_gate.stats())
+        return stats
+
+
+def build_streams():
+    """
+    Create a CameraStream for every camera in frame_capture_settings.cameras, or for the single
+    webcam_url camera if no list is configured. Cameras saving to the same img_dir share a duplicate filter.
+    """
+    cameras = frame_capture_settings.cameras or [
+        CameraSettings(webcam_url=frame_capture_settings.webcam_url, webcam_name=frame_capture_settings.webcam_name)
+    ]
+    dedup_filters = {}
+    streams = []
+    for camera in cameras:
+        img_dir = camera.img_dir or frame_capture_settings.img_dir
+        dedup = None
+        if frame_capture_settings.dedup_enabled:
+            if img_dir not in dedup_filters:
+                # The persistent index is built from the frames already in img_dir on first use
+                if img_dir == frame_capture_settings.img_dir:
+                    index_path = frame_capture_settings.dedup_index_path
+                else:
+                    index_path = os.path.join(img_dir, os.path.basename(frame_capture_settings.dedup_index_path))
+                dedup_filters[img_dir] = DuplicateFilter(index_path, max_distance=frame_capture_settings.dedup_max_distance)
+                if not os.path.exists(index_path):
+                    print(f"Building duplicate index from {img_dir}...")
+                    dedup_filters[img_dir].build_index(img_dir)
+                print(f"Duplicate index for {img_dir} holds {len(dedup_filters[img_dir])} frames")
+            dedup = dedup_filters[img_dir]
+        streams.append(CameraStream(
+            webcam_url=camera.webcam_url,
+            webcam_name=camera.webcam_name,
+            frame_interval=camera.frame_interval or frame_capture_settings.frame_interval,
+            img_dir=img_dir,
+            default_label_dir=camera.default_label_dir or frame_capture_settings.default_label_dir,
+            dedup=dedup,
+            regions=camera_region_plan(camera),
+        ))
+    return streams
+
+
 def main():
     ###########################################################################################
-    # Save frames from a webcam stream for collecting finetuning images
+    # Save frames from one or more webcam streams for collecting finetuning images
     # If a pretrained model is provided that can identify the class listed in the config,
     # it will draw bounding boxes around the detected objects and save the annotations in YOLO format.
     # Otherwise, no inference is performed and only the raw frames are saved along with a blank annotation file
+    # All cameras share a single model, so memory scales with the number of models rather than cameras.
     ###########################################################################################
 
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = YOLO(frame_capture_settings.model_path).to(device)
+    if frame_capture_settings.inference_backend == "torch":
+        set_torch_threads(frame_capture_settings.inference_threads)
+    model = load_detector(
+        frame_capture_settings.model_path,
+        backend=frame_capture_settings.inference_backend,
+        imgsz=frame_capture_settings.inference_imgsz,
+        threads=frame_capture_settings.inference_threads,
+    )
     class_id = get_key_by_value(model.names, frame_capture_settings.target_label) # see if the target label is in the model classes
     if class_id is None: #
         print(f"Target label '{frame_capture_settings.target_label}' not found in model classes. Assisted labeling unavailable.")
         model = None
     else:
         print(f"Target label '{frame_capture_settings.target_label}' found in model classes. Assisted labeling available.")
-        print(f"Using device: {device}")
+        print(f"Using the {model.backend} backend")
+
 
+    # Per-stage latency metrics, written periodically to metrics_path and/or served on metrics_port
+    metrics = StageMetrics()
+    reporter = MetricsReporter(
+        metrics,
+        json_path=frame_capture_settings.metrics_path,
+        interval=frame_capture_settings.metrics_interval_s,
+        port=frame_capture_settings.metrics_port,
+    ).start()
+    headless = frame_capture_settings.headless
 
-    # load the webcam stream
-    cap = cv2.VideoCapture(frame_capture_settings.webcam_url)
-    if not cap.isOpened():
-        print("Error: Could not open the video stream.")
+    # load the webcam streams
+    all_streams = build_streams()
+    streams = list(all_streams)  # cameras still running
+    try:
+        for stream in streams:
+            stream.start(metrics)
+            print(f"Opened camera {stream.webcam_name} (every {stream.frame_interval}th frame)")
+            if stream.regions.active:
+                print(f"  {len(stream.regions.roi_polygons)} ROI polygons, tile size {stream.regions.tile_size}")
+    except IOError as e:
+        print(f"Error: {e}")
+        for stream in streams:
+            stream.stop()
+        reporter.stop()
         exit()
 
-    frame_count = 0
+    writer = FrameWriterPool(
+        num_workers=frame_capture_settings.writer_workers,
+        max_queue=frame_capture_settings.writer_queue_size,
+        jpeg_quality=frame_capture_settings.jpeg_quality,
+        metrics=metrics,
+    )
+
+    # Kept frames from every camera are collected into micro-batches and run through the shared model together.
+    # The label file of each frame is written from the batcher's callback once its result is ready.
+    batcher = None
+    if model:
+        batcher = MicroBatcher(
+            lambda frames: model.predict(frames, classes=[class_id], conf=frame_capture_settings.conf_threshold),
+            max_batch_size=frame_capture_settings.inference_batch_size,
+            max_wait=frame_capture_settings.inference_max_wait_ms / 1000.0,
+            metrics=metrics,
+        )
+    latest_display = {}  # most recent annotated frame of each camera, shown from the main thread
+    # every saved frame is recorded as pending in the labeling index, which the annotation tool reads
+    label_index = LabelIndex(frame_capture_settings.label_index_path)
+
+    def save_labels(stream, txt_filename, img_filename, captured, frame, result):
+        """Write the label file of a saved frame (empty without a result) and add the frame to the labeling index."""
+        height, width = frame.shape[:2]
+        writer.write_text(txt_filename, yolo_label_text(result, width, height))
+        label_index.add(os.path.splitext(os.path.basename(img_filename))[0], img_filename, txt_filename,
+                        camera=stream.webcam_name, captured_at=captured.wall_time.timestamp())
+        if not headless:
+            latest_display[stream.webcam_name] = stream.regions.draw(draw_result(frame.copy(), result))
+        print(f"Queued annotations: {txt_filename}")
+
+    def on_result(stream, txt_filename, img_filename, captured):
+        def callback(frame, result):
+            if result is None:
+                # inference failed for this frame's batch; an empty label file would read as a frame without people
+                metrics.count("inference_errors")
+                print(f"Inference failed, no annotations written for {img_filename}")
+                return
+            save_labels(stream, txt_filename, img_filename, captured, frame, result)
+        return callback
 
     # This script will run for the number of hours specified in the config
     start_time = datetime.now()
@@ -49,72 +242,103 @@ def main():
     print("End time:", end_time)
 
 
-    while datetime.now() < end_time:
-        if cv2.waitKey(1) & 0xFF == ord("q"): # Press 'q' to quit
-            break
-        try:
-            ret, frame = cap.read()
-            counter = 0
-            while not ret:
-                time.sleep(1)
-                ret, frame = cap.read()
-                counter += 1
-                if counter >= 10:
-                    raise RuntimeError(f"Failed to capture frame after {counter} retries")
-        except Exception as e:
-            print(f"Error reading webcam: {e}")
-            break
-
-        frame_count += 1
-        # Process only every FRAME_INTERVAL frame
-        if frame_count % frame_capture_settings.frame_interval != 1:
-            continue
-
-        # Save the raw frame
-        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        img_filename = os.path.join(frame_capture_settings.img_dir, f"{frame_capture_settings.webcam_name}_{timestamp}.jpg")
-        cv2.imwrite(img_filename, frame)
-        print(f"Saved image: {img_filename}")
-
-        if model:
-            results = model(frame, classes=[class_id], conf=frame_capture_settings.conf_threshold)
-        else:
-            results = []
-        height, width = frame.shape[:2]
+    next_stream = 0
+    try:
+        while datetime.now() < end_time and streams:
+            if not headless:
+                with metrics.time("display"):
+                    if cv2.waitKey(1) & 0xFF == ord("q"): # Press 'q' to quit
+                        break
+
+                    # Optionally, display the most recent frame of each camera with the detections drawn
+                    for webcam_name in list(latest_display):
+                        cv2.imshow(f"Dataset Collection - {webcam_name}", latest_display.pop(webcam_name))
+
+            # Round-robin over the cameras: each pass takes at most one frame from every camera, starting after
+            # the camera served first last time, so a busy camera cannot starve the others of the shared model.
+            order = streams[next_stream:] + streams[:next_stream]
+            next_stream = (next_stream + 1) % len(streams)
+            got_frame = False
+            for stream in order:
+                with metrics.time("read"):
+                    captured = stream.capture.read(timeout=0)
+                if captured is None:
+                    if not stream.capture.is_alive():
+                        print(f"Error reading webcam {stream.webcam_name}: {stream.capture.error}")
+                        stream.stop()
+                        streams.remove(stream)
+                    continue
+                got_frame = True
+                metrics.count("frames_read")
+                metrics.record("frame_age", stream.capture.last_frame_age)
+                frame = captured.frame
+                print(f"{stream.webcam_name} frame {captured.frame_index}: age {stream.capture.last_frame_age * 1000:.0f} ms, "
+                      f"dropped {stream.capture.frames_dropped} frames so far")
+
+                # Skip frames of a static scene. A skipped frame is not saved, so it needs no labels of its own
+                if stream.motion_gate:
+                    with metrics.time("motion_gate"):
+                        moved = stream.motion_gate.check(frame, captured.captured_at)
+                    if not moved:
+                        stream.frames_static += 1
+                        metrics.count("frames_static")
+                        continue
+
+                # Skip frames that are near-duplicates of frames already collected
+                if stream.dedup:
+                    with metrics.time("dedup"):
+                        is_duplicate, frame_hash, distance = stream.dedup.check(frame)
+                    if is_duplicate:
+                        stream.frames_duplicate += 1
+                        metrics.count("frames_duplicate")
+                        print(f"Skipped near-duplicate frame (hash distance {distance})")
+                        continue
+                    stream.dedup.add(frame_hash)
+
+                # Queue the raw frame for saving. The writer pool encodes and writes it off the capture loop,
+                # so boxes are only ever drawn on a copy of the frame.
+                timestamp = captured.wall_time.strftime("%Y_%m_%d_%H_%M_%S")
+                img_filename = os.path.join(stream.img_dir, f"{stream.webcam_name}_{timestamp}.jpg")
+                with metrics.time("queue_image"):
+                    writer.write_image(img_filename, frame)
+                stream.frames_saved += 1
+                metrics.count("frames_saved")
+                print(f"Queued image: {img_filename}")
+
+                # Queue the frame for inference, or write a blank annotation file if assisted labeling is unavailable
+                txt_filename = os.path.join(f"{stream.default_label_dir}", f"{stream.webcam_name}_{timestamp}.txt")
+                with metrics.time("queue_inference"):
+                    if batcher:
+                        # with ROIs or tiling only the crops of the frame are run and their boxes merged back
+                        stream.regions.submit(batcher, frame, on_result(stream, txt_filename, img_filename, captured))
+                    else:
+                        save_labels(stream, txt_filename, img_filename, captured, frame, None)
+
+            if not got_frame:
+                # nothing ready on any camera; wait briefly instead of spinning
+                time.sleep(0.01)
+                continue
+            writer_stats = writer.stats()
+            print(f"Write queue depth {writer_stats['queue_depth']}, mean write latency {writer_stats['write_latency_mean'] * 1000:.0f} ms")
+    except KeyboardInterrupt:
+        print("Stopping...")
+
 
-        # Open a .txt file for writing the annotations in YOLO format
-        txt_filename = os.path.join(f"{frame_capture_settings.default_label_dir}", f"{frame_capture_settings.webcam_name}_{timestamp}.txt")
-        with open(txt_filename, "w") as f:
-            for result in results:
-                if result.boxes is not None:
-                    boxes = result.boxes.data.cpu().numpy()  # each row: [x1, y1, x2, y2, conf, cls]
-                    for box in boxes:
-                        x1, y1, x2, y2, conf, cls = box
-                        # Convert bounding box to YOLO format (normalized)
-                        x_center = ((x1 + x2) / 2.0) / width
-                        y_center = ((y1 + y2) / 2.0) / height
-                        bbox_width = (x2 - x1) / width
-                        bbox_height = (y2 - y1) / height
-                        # Write annotation line: class x_center y_center width height
-                        f.write(f"0 {x_center:.6f} {y_center:.6f} {bbox_width:.6f} {bbox_height:.6f}\n")
-                        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                        cv2.putText(
-                            frame,
-                            f"{int(cls)} {conf:.2f}",
-                            (int(x1), int(y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0, 255, 0),
-                            2,
-                        )
-        print(f"Saved annotations: {txt_filename}")
-
-        # Optionally, display the frame (with no annotations drawn)
-        cv2.imshow("Dataset Collection", frame)
-
-
-    cap.release()
-    cv2.destroyAllWindows()
+    for stream in all_streams:
+        stream.stop()
+        print(f"Capture stats for {stream.webcam_name}:", stream.stats())
+    if batcher:
+        print("Running inference on queued frames...")
+        batcher.close()
+        print("Inference stats:", batcher.stats())
+    print("Flushing pending writes...")
+    writer.close()
+    print("Writer stats:", writer.stats())
+    print("Labeling progress:", label_index.progress())
+    label_index.close()
+    reporter.stop()
+    if not headless:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
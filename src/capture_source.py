@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+import cv2
+
+# =========================
+# Threaded capture source
+# Reads a video stream on its own thread. Frames that will be thrown away are only grabbed (the stream is
+# advanced without decoding), and only every frame_interval-th frame is decoded. Decoded frames go into a
+# small "latest frame" buffer so a slow consumer never builds up a backlog of stale frames.
+# =========================
+
+# frame: decoded BGR image
+# frame_index: 0-based index of the frame in the stream
+# captured_at: time.monotonic() when the frame was decoded, used to compute its age
+# wall_time: datetime when the frame was decoded, used for file naming
+CapturedFrame = namedtuple("CapturedFrame", ["frame", "frame_index", "captured_at", "wall_time"])
+
+
+class ThreadedCapture:
+    def __init__(self, source, frame_interval=1, buffer_size=1, max_retries=10, retry_delay=1.0, metrics=None, name=None):
+        """
+        Parameters:
+            source (str | int): url, file path or device index passed to cv2.VideoCapture.
+            frame_interval (int): decode every nth frame; the others are only grabbed.
+            buffer_size (int): number of decoded frames kept for the consumer. When the buffer is full the
+                oldest frame is dropped, so the consumer always gets the most recent frames.
+            max_retries (int): consecutive failed grabs tolerated before the reader gives up.
+            retry_delay (float): seconds to wait between failed grabs.
+            metrics (StageMetrics | None): if given, grab and decode times are recorded as "<name>.grab"
+                and "<name>.decode".
+            name (str | None): name used for the metrics stages and the reader thread. Defaults to source.
+        """
+        self.source = source
+        self.frame_interval = max(1, int(frame_interval))
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.metrics = metrics
+        self.name = name if name is not None else str(source)
+
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open the video stream: {source}")
+
+        self._buffer = deque(maxlen=max(1, int(buffer_size)))
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.error = None  # set to an exception if the reader thread stopped because of a failure
+
+        # counters
+        self.frames_grabbed = 0   # frames the stream advanced over
+        self.frames_decoded = 0   # frames decoded and put in the buffer
+        self.frames_dropped = 0   # decoded frames overwritten before the consumer read them
+        self.frames_read = 0      # frames handed to the consumer
+        self.last_frame_age = 0.0 # seconds between decoding and reading of the last frame returned
+
+    def start(self):
+        self._thread = threading.Thread(target=self._reader, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _grab(self):
+        """Advance the stream by one frame, retrying on failure. Raises RuntimeError after max_retries."""
+        retries = 0
+        while not self.cap.grab():
+            retries += 1
+            if retries >= self.max_retries or self._stop.is_set():
+                raise RuntimeError(f"Failed to capture frame after {retries} retries")
+            time.sleep(self.retry_delay)
+
+    def _reader(self):
+        frame_index = 0
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                self._grab()
+                self.frames_grabbed += 1
+                if self.metrics is not None:
+                    self.metrics.record(f"{self.name}.grab", time.perf_counter() - start)
+                if frame_index % self.frame_interval == 0:
+                    start = time.perf_counter()
+                    ret, frame = self.cap.retrieve()
+                    if self.metrics is not None:
+                        self.metrics.record(f"{self.name}.decode", time.perf_counter() - start)
+                    if ret:
+                        captured = CapturedFrame(frame, frame_index, time.monotonic(), datetime.now())
+                        with self._cond:
+                            if len(self._buffer) == self._buffer.maxlen:
+                                self.frames_dropped += 1
+                            self._buffer.append(captured)
+                            self.frames_decoded += 1
+                            self._cond.notify()
+                frame_index += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self._cond.notify_all()
+
+    def read(self, timeout=None):
+        """
+        Return the oldest buffered CapturedFrame, waiting up to timeout seconds for one.
+        Returns None if no frame is available (timeout, or the reader thread has stopped).
+        """
+        with self._cond:
+            if not self._buffer:
+                self._cond.wait_for(lambda: self._buffer or not self.is_alive(), timeout=timeout)
+            if not self._buffer:
+                return None
+            captured = self._buffer.popleft()
+        self.frames_read += 1
+        self.last_frame_age = time.monotonic() - captured.captured_at
+        return captured
+
+    def stats(self):
+        return {
+            "frames_grabbed": self.frames_grabbed,
+            "frames_decoded": self.frames_decoded,
+            "frames_dropped": self.frames_dropped,
+            "frames_read": self.frames_read,
+            "last_frame_age": self.last_frame_age,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.cap.release()
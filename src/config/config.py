@@ -1,11 +1,24 @@
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import DirectoryPath
+from pydantic import BaseModel, DirectoryPath
 
 
 env_path = (Path(__file__).parent / '.env').resolve()  # Using .resolve() for an absolute path
 
 
+class CameraSettings(BaseModel):
+    # one entry of FrameCaptureSettings.cameras. Fields left unset fall back to the single camera settings
+    webcam_url: str
+    webcam_name: str
+    frame_interval: Optional[int] = None
+    img_dir: Optional[DirectoryPath] = None
+    default_label_dir: Optional[DirectoryPath] = None
+    roi_polygons: Optional[list[list[tuple[float, float]]]] = None
+    tile_size: Optional[int] = None
+    tile_overlap: Optional[float] = None
+
+
 class FrameCaptureSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=env_path, env_file_encoding='utf-8', extra='ignore')
     
@@ -19,6 +32,34 @@ class FrameCaptureSettings(BaseSettings):
     img_dir: DirectoryPath              # directory to save captured frames for fine tuning
     default_label_dir: DirectoryPath    # directory to save labels in YOLO format. Will be used for AI assisted labeling. Will move to edited_label_dir after manual editing
     edited_label_dir: DirectoryPath     # directory to save edited labels for fine tuning
+    capture_buffer_size: int = 1        # number of decoded frames buffered by the capture thread. Older frames are dropped when full
+    writer_workers: int = 2             # number of background threads encoding and writing frames and labels
+    writer_queue_size: int = 64         # maximum number of pending writes before the capture loop waits on storage
+    jpeg_quality: int = 95              # JPEG quality (0-100) of saved frames
+    inference_backend: str = "torch"    # torch (.pt through ultralytics), onnx or openvino. .pt weights are exported on first use
+    inference_threads: int = 0          # CPU threads used by the inference backend. 0 keeps the backend default
+    inference_imgsz: int = 640          # model input size
+    inference_batch_size: int = 4       # maximum number of kept frames per batched forward pass
+    inference_max_wait_ms: int = 250    # maximum time a kept frame waits for its batch to fill up. Lower values reduce latency
+    roi_polygons: list[list[tuple[float, float]]] = []  # JSON list of polygons of [x, y] points normalized to 0-1. Only these zones are run through the model. Empty for the whole frame
+    tile_size: int = 0                  # run the model on overlapping tile_size x tile_size crops of each region (in one batch). 0 disables tiling
+    tile_overlap: float = 0.2           # fraction of a tile shared with its neighbours
+    motion_gate_enabled: bool = True    # counting service: only run the model when the scene changed since the last inference and reuse the last count otherwise
+    capture_motion_gate_enabled: bool = False  # capture: skip (do not save) frames of a static scene, at most motion_max_skip_s apart. Labels are never reused
+    motion_pixel_threshold: int = 25    # grey level difference (0-255) for a downsampled pixel to count as changed
+    motion_min_changed_fraction: float = 0.002  # fraction of changed pixels that counts as motion
+    motion_max_skip_s: float = 30.0     # force inference at least this often even without motion
+    annotation_prefetch: int = 8        # number of frames the annotation tool decodes ahead of the one being edited
+    annotation_order: str = "score"     # score: most informative frames first (see score_pending_frames.py), name: file name order
+    label_index_path: Path = Path("images_for_manual_labeling/label_index.sqlite")  # SQLite index of every captured frame and its labeling status
+    dedup_enabled: bool = False         # skip (do not save) frames that are near-duplicates of recently saved or already collected frames. Off by default
+    dedup_max_distance: int = 3         # frames whose 64 bit difference hashes differ in at most this many bits are duplicates
+    dedup_index_path: Path = Path("images_for_manual_labeling/dhash_index.bin")  # persistent index of hashes of saved frames
+    cameras: list[CameraSettings] = []  # JSON list of cameras captured in one process with one shared model. Empty to capture only webcam_url
+    headless: bool = False              # run without any display window (no cv2.imshow / waitKey). Stop with Ctrl+C
+    metrics_path: Optional[Path] = None # JSON file the per-stage latency metrics are written to. Unset to disable
+    metrics_interval_s: float = 10.0    # seconds between metrics snapshots
+    metrics_port: int = 0               # serve the metrics as text on http://127.0.0.1:<port>/metrics. 0 to disable
 
 class TrainValTestSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=env_path, env_file_encoding='utf-8', extra='ignore')
@@ -31,6 +72,8 @@ class TrainValTestSettings(BaseSettings):
     test_labels_dir: DirectoryPath
     sample_ratio_val: float
     sample_ratio_test: float
+    manifest_dir: Path = Path("datasets/dataset_webcam")  # where train.txt, val.txt and test.txt image lists are written
+    split_salt: str = ""                # changing it reshuffles which split every frame is hashed into
 
 
 class FineTuneSettings(BaseSettings):
@@ -48,9 +91,22 @@ class FineTuneSettings(BaseSettings):
     webcam_finetune_imgsz: int
     webcam_finetune_epochs: int
     webcam_finetune_batch_size: int
+    packed_dataset: bool = False         # train from memory-mapped shards packed by pack_dataset.py instead of JPEGs
+    packed_dataset_dir: Path = Path("datasets/packed")  # where the packed shards are written
+    stage_cache: bool = True             # skip training stages whose weights, data and settings are unchanged
+    stage_cache_dir: Path = Path("finetune_cache")  # best.pt of every trained stage, keyed by a hash of its inputs
+
+
+class CountServiceSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=env_path, env_file_encoding='utf-8', extra='ignore')
 
+    # cameras, model, target label and confidence threshold are taken from FrameCaptureSettings
+    count_db_path: Path = Path("counts/people_counts.sqlite")  # append-only SQLite store of per-frame counts
+    count_target_fps: float = 2.0       # frames counted per second on each camera
+    count_report_interval_s: int = 60   # seconds between printed aggregate and throughput reports
 
 
 frame_capture_settings = FrameCaptureSettings()
 train_val_test_settings = TrainValTestSettings()
-finetune_settings = FineTuneSettings()
\ No newline at end of file
+finetune_settings = FineTuneSettings()
+count_service_settings = CountServiceSettings()
\ No newline at end of file
@@ -0,0 +1,218 @@
+import time
+from collections import deque
+
+import cv2
+
+from config.config import frame_capture_settings, count_service_settings, CameraSettings
+from capture_source import ThreadedCapture
+from batched_inference import MicroBatcher
+from count_store import CountStore, RollingAggregator
+from capture_finetuning_images import get_key_by_value, camera_region_plan, build_motion_gate
+from inference_backend import load_detector, set_torch_threads
+
+# =========================
+# Live people counting service
+# Reads every configured camera at count_target_fps, counts the target class in each frame with one shared
+# model and appends the counts to a SQLite time-series store. Per-minute and per-hour aggregates are kept in
+# memory and printed together with throughput every count_report_interval_s seconds, along with a warning
+# for any camera that is not keeping up with real time. With the motion gate enabled the model only runs
+# when the scene changed, and the count of the last inferred frame is recorded for static frames. Counts are
+# stored in capture order: a static frame is only recorded once the frames before it have been.
+# Runs until interrupted with Ctrl+C.
+# =========================
+
+
+class PendingCount:
+    """A frame waiting to be recorded: counted by the model, or reusing the count of the inferred frame before it."""
+    def __init__(self, captured, inferred):
+        self.captured = captured
+        self.inferred = inferred
+        self.count = None  # count of an inferred frame, None until its result arrived or if inference failed
+        self.done = not inferred
+
+
+class CountedCamera:
+    """Reader thread and throughput counters of one camera in the counting service."""
+    def __init__(self, camera, target_fps):
+        self.name = camera.webcam_name
+        self.target_fps = target_fps
+        self.regions = camera_region_plan(camera)
+        self.motion_gate = build_motion_gate()
+        self.last_count = None  # count of the last inferred frame that was recorded, reused while the scene is static
+        self.pending = deque()  # PendingCount of the frames not recorded yet, in capture order
+        self.capture = ThreadedCapture(camera.webcam_url, buffer_size=frame_capture_settings.capture_buffer_size)
+        # decode only as many frames as we count
+        stream_fps = self.capture.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.capture.frame_interval = max(1, round(stream_fps / target_fps))
+        self.frames_counted = 0
+        self.latency_sum = 0.0
+        self.inference_errors = 0  # frames dropped because inference failed
+        # values at the last report, used to compute per-interval rates
+        self._reported_counted = 0
+        self._reported_dropped = 0
+        self._reported_latency_sum = 0.0
+        self._reported_checked = 0
+        self._reported_skipped = 0
+
+    def record(self, latency):
+        self.frames_counted += 1
+        self.latency_sum += latency
+
+    def report(self, elapsed):
+        """Return (fps, mean latency, dropped frames) since the previous report and whether the camera is behind."""
+        counted = self.frames_counted - self._reported_counted
+        dropped = self.capture.frames_dropped - self._reported_dropped
+        latency = (self.latency_sum - self._reported_latency_sum) / counted if counted else 0.0
+        self._reported_counted = self.frames_counted
+        self._reported_dropped = self.capture.frames_dropped
+        self._reported_latency_sum = self.latency_sum
+        fps = counted / elapsed if elapsed > 0 else 0.0
+        # behind if we count noticeably fewer frames than targeted, or decoded frames were overwritten unread
+        behind = fps < 0.9 * self.target_fps or dropped > 0
+        return fps, latency, dropped, behind
+
+    def skipped_fraction(self):
+        """Fraction of frames since the previous call whose count was reused instead of running the model."""
+        if self.motion_gate is None:
+            return 0.0
+        checked = self.motion_gate.frames_checked - self._reported_checked
+        skipped = self.motion_gate.frames_skipped - self._reported_skipped
+        self._reported_checked = self.motion_gate.frames_checked
+        self._reported_skipped = self.motion_gate.frames_skipped
+        return skipped / checked if checked else 0.0
+
+
+def main():
+    if frame_capture_settings.inference_backend == "torch":
+        set_torch_threads(frame_capture_settings.inference_threads)
+    model = load_detector(
+        frame_capture_settings.model_path,
+        backend=frame_capture_settings.inference_backend,
+        imgsz=frame_capture_settings.inference_imgsz,
+        threads=frame_capture_settings.inference_threads,
+    )
+    class_id = get_key_by_value(model.names, frame_capture_settings.target_label)
+    if class_id is None:
+        print(f"Target label '{frame_capture_settings.target_label}' not found in model classes. Nothing to count.")
+        exit()
+    print(f"Counting '{frame_capture_settings.target_label}' with the {model.backend} backend")
+
+    cameras = frame_capture_settings.cameras or [
+        CameraSettings(webcam_url=frame_capture_settings.webcam_url, webcam_name=frame_capture_settings.webcam_name)
+    ]
+    target_fps = count_service_settings.count_target_fps
+    counted_cameras = []
+    try:
+        for camera in cameras:
+            counted_cameras.append(CountedCamera(camera, target_fps))
+    except IOError as e:
+        print(f"Error: {e}")
+        # release the cameras opened before the one that failed
+        for counted_camera in counted_cameras:
+            counted_camera.capture.stop()
+        exit()
+
+    store = CountStore(count_service_settings.count_db_path)
+    aggregator = RollingAggregator()
+    batcher = MicroBatcher(
+        lambda frames: model.predict(frames, classes=[class_id], conf=frame_capture_settings.conf_threshold),
+        max_batch_size=frame_capture_settings.inference_batch_size,
+        max_wait=frame_capture_settings.inference_max_wait_ms / 1000.0,
+    )
+
+    def record_count(camera, captured, count):
+        latency = time.monotonic() - captured.captured_at
+        ts = captured.wall_time.timestamp()
+        store.append(ts, camera.name, captured.frame_index, count, latency * 1000)
+        aggregator.add(ts, camera.name, count)
+        camera.record(latency)
+
+    def on_result(entry):
+        # called from the batching thread, which only fills in the entry; counts are recorded by the main loop
+        def callback(frame, result):
+            entry.count = None if result is None else len(result.conf)
+            entry.done = True
+        return callback
+
+    def record_ready(camera):
+        """Record the frames of a camera whose count is known, in capture order."""
+        while camera.pending and camera.pending[0].done:
+            entry = camera.pending.popleft()
+            if entry.inferred:
+                camera.last_count = entry.count
+            if camera.last_count is None:
+                # inference failed for this frame or for the frame whose count it reuses: the sample is dropped
+                # rather than stored as 0 people, and the next frame goes to the model again
+                camera.inference_errors += 1
+                if camera.motion_gate is not None:
+                    camera.motion_gate.reset()
+                continue
+            record_count(camera, entry.captured, camera.last_count)
+
+    for camera in counted_cameras:
+        camera.capture.start()
+        print(f"Opened camera {camera.name} (counting every {camera.capture.frame_interval}th frame)")
+
+    print(f"Writing counts to {count_service_settings.count_db_path}. Press Ctrl+C to stop.")
+    active = list(counted_cameras)
+    next_camera = 0
+    last_report = time.monotonic()
+    try:
+        while active:
+            # Round-robin over the cameras so every camera gets a fair share of the shared model
+            order = active[next_camera:] + active[:next_camera]
+            next_camera = (next_camera + 1) % len(active)
+            got_frame = False
+            for camera in order:
+                captured = camera.capture.read(timeout=0)
+                if captured is None:
+                    if not camera.capture.is_alive():
+                        print(f"Error reading webcam {camera.name}: {camera.capture.error}")
+                        active.remove(camera)
+                    continue
+                got_frame = True
+                # On a static scene the count of the last inferred frame is reused instead of running the model.
+                # A frame the gate lets through becomes its reference, so the first frame always runs inference.
+                if camera.motion_gate is None or camera.motion_gate.check(captured.frame, captured.captured_at):
+                    entry = PendingCount(captured, inferred=True)
+                    camera.pending.append(entry)
+                    camera.regions.submit(batcher, captured.frame, on_result(entry))
+                else:
+                    camera.pending.append(PendingCount(captured, inferred=False))
+            for camera in counted_cameras:
+                record_ready(camera)
+            if not got_frame:
+                time.sleep(0.005)
+
+            now = time.monotonic()
+            if now - last_report >= count_service_settings.count_report_interval_s:
+                elapsed, last_report = now - last_report, now
+                for camera in counted_cameras:
+                    fps, latency, dropped, behind = camera.report(elapsed)
+                    minutes = aggregator.per_minute(camera.name)
+                    hours = aggregator.per_hour(camera.name)
+                    minute_mean = minutes[-1]["mean"] if minutes else 0.0
+                    hour_mean = hours[-1]["mean"] if hours else 0.0
+                    print(f"{camera.name}: {fps:.2f}/{target_fps:.2f} fps, latency {latency * 1000:.0f} ms, "
+                          f"mean count {minute_mean:.1f} (minute) {hour_mean:.1f} (hour), "
+                          f"{camera.skipped_fraction():.0%} of inferences skipped (static scene), "
+                          f"{camera.inference_errors} frames dropped by failed inference")
+                    if behind:
+                        print(f"WARNING: {camera.name} is falling behind real time "
+                              f"({fps:.2f} of {target_fps:.2f} fps counted, {dropped} frames dropped)")
+    except KeyboardInterrupt:
+        print("Stopping...")
+
+    for camera in counted_cameras:
+        camera.capture.stop()
+        if camera.motion_gate is not None:
+            print(f"Motion gate for {camera.name}:", camera.motion_gate.stats())
+    batcher.close()
+    for camera in counted_cameras:
+        record_ready(camera)
+    store.close()
+    print(f"Wrote {store.rows_written} counts to {count_service_settings.count_db_path}")
+
+
+if __name__ == "__main__":
+    main()
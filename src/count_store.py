@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# =========================
+# Time-series sink for people counts
+# CountStore appends one row per counted frame to a local SQLite database. Rows are committed in batches so
+# the store keeps up with many cameras at real-time rates. RollingAggregator keeps per-minute and per-hour
+# count statistics in memory for live reporting.
+# =========================
+
+
+class CountStore:
+    def __init__(self, db_path, commit_every=50, commit_interval=1.0):
+        """
+        Parameters:
+            db_path (str | Path): SQLite database file. Created (with its directory) if missing.
+            commit_every (int): commit after this many pending rows.
+            commit_interval (float): commit pending rows at least this often, in seconds.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # rows are appended from the inference thread, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counts ("
+            " ts REAL NOT NULL,"          # unix timestamp of the frame
+            " camera TEXT NOT NULL,"
+            " frame_index INTEGER,"
+            " count INTEGER NOT NULL,"
+            " latency_ms REAL)"           # time from decoding the frame to its count being available
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS counts_camera_ts ON counts (camera, ts)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_commit = time.monotonic()
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.rows_written = 0
+
+    def append(self, ts, camera, frame_index, count, latency_ms=None):
+        with self._lock:
+            self._pending.append((ts, camera, frame_index, count, latency_ms))
+            if len(self._pending) >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+                self._commit()
+
+    def _commit(self):
+        if self._pending:
+            self._conn.executemany(
+                "INSERT INTO counts (ts, camera, frame_index, count, latency_ms) VALUES (?, ?, ?, ?, ?)", self._pending
+            )
+            self._conn.commit()
+            self.rows_written += len(self._pending)
+            self._pending = []
+        self._last_commit = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class RollingAggregator:
+    def __init__(self, max_minutes=60, max_hours=24):
+        """
+        Keeps count statistics (frames, mean, max) per camera in minute and hour buckets.
+        Only the most recent max_minutes minute buckets and max_hours hour buckets are kept.
+        """
+        self.max_minutes = max_minutes
+        self.max_hours = max_hours
+        self._lock = threading.Lock()
+        self._minutes = {}  # camera -> OrderedDict(bucket_start -> [frames, count_sum, count_max])
+        self._hours = {}
+
+    @staticmethod
+    def _add(buckets, bucket_start, count, max_buckets):
+        bucket = buckets.get(bucket_start)
+        if bucket is None:
+            bucket = buckets[bucket_start] = [0, 0, 0]
+            while len(buckets) > max_buckets:
+                buckets.popitem(last=False)
+        bucket[0] += 1
+        bucket[1] += count
+        bucket[2] = max(bucket[2], count)
+
+    def add(self, ts, camera, count):
+        with self._lock:
+            minutes = self._minutes.setdefault(camera, OrderedDict())
+            hours = self._hours.setdefault(camera, OrderedDict())
+            self._add(minutes, int(ts // 60) * 60, count, self.max_minutes)
+            self._add(hours, int(ts // 3600) * 3600, count, self.max_hours)
+
+    @staticmethod
+    def _summarize(buckets):
+        return [
+            {"start": start, "frames": frames, "mean": count_sum / frames, "max": count_max}
+            for start, (frames, count_sum, count_max) in buckets.items()
+        ]
+
+    def per_minute(self, camera):
+        with self._lock:
+            return self._summarize(self._minutes.get(camera, {}))
+
+    def per_hour(self, camera):
+        with self._lock:
+            return self._summarize(self._hours.get(camera, {}))
+
+    def cameras(self):
+        with self._lock:
+            return list(self._minutes)
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from inference_backend import Detections, load_detector
+
+# =========================
+# Persistent detection cache
+# Detections are stored in a local SQLite database keyed by the model (hash of the weights, backend and input
+# size), the source (video file or "" for content-addressed images), the item (frame index or image hash)
+# and the inference parameters (conf, iou, classes). Boxes are stored as one compact blob of float32/int32
+# arrays per frame. When the store grows beyond max_bytes the least recently used entries are evicted.
+# Re-rendering a clip or re-evaluating a test set with the same model and parameters then never loads or
+# runs the model.
+# =========================
+
+_ROW_OVERHEAD = 96  # approximate bytes per row besides the box data, used for the size estimate
+_weights_hashes = {}  # (path, size, mtime) -> sha256 of the weights, so each file is hashed once per process
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha256 of a file, or of every file in a directory (OpenVINO exports), as a hex string."""
+    digest = hashlib.sha256()
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    for file_path in paths:
+        if os.path.isdir(file_path):
+            continue
+        with open(file_path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def weights_hash(model_path):
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime)
+    if key not in _weights_hashes:
+        _weights_hashes[key] = file_hash(model_path)
+    return _weights_hashes[key]
+
+
+def image_hash(frame):
+    """Content hash of a decoded frame."""
+    digest = hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16)
+    digest.update(str(frame.shape).encode())
+    return digest.hexdigest()
+
+
+def source_key(path):
+    """Key of a video file: its absolute path, size and modification time, so an edited file is not matched."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def params_key(classes=None, conf=0.25, iou=0.7):
+    classes = ",".join(str(int(c)) for c in sorted(classes)) if classes is not None else "all"
+    return f"conf={conf:g};iou={iou:g};classes={classes}"
+
+
+def encode_detections(detections):
+    return (detections.xyxy.astype(np.float32).tobytes() + detections.conf.astype(np.float32).tobytes()
+            + detections.cls.astype(np.int32).tobytes())
+
+
+def decode_detections(data, n):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    xyxy = buffer[:n * 16].view(np.float32).reshape(n, 4)
+    conf = buffer[n * 16:n * 20].view(np.float32)
+    cls = buffer[n * 20:n * 24].view(np.int32)
+    return Detections(xyxy.copy(), conf.copy(), cls.copy())
+
+
+class DetectionCache:
+    def __init__(self, db_path, max_bytes=512 * 1024 * 1024, commit_every=100):
+        """
+        Parameters:
+            db_path (str | Path): SQLite database file. Created (with its directory) if missing.
+            max_bytes (int): approximate size above which the least recently used entries are evicted.
+            commit_every (int): commit after this many pending writes (new entries and hits).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # the cache is used from inference threads, so the connection is shared behind a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            " model TEXT NOT NULL,"       # weights hash, backend and input size
+            " source TEXT NOT NULL,"      # video file key, or "" for images addressed by content
+            " item TEXT NOT NULL,"        # frame index or image hash
+            " params TEXT NOT NULL,"      # conf, iou and classes
+            " n INTEGER NOT NULL,"        # number of boxes
+            " data BLOB NOT NULL,"        # n x 4 float32 xyxy, n float32 conf, n int32 cls
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS detections_key ON detections (model, source, item, params)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, names TEXT NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self._pending = 0
+        rows, data_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM detections").fetchone()
+        self._size = data_bytes + rows * _ROW_OVERHEAD
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def model_key(model_path, backend="torch", imgsz=640):
+        return f"{weights_hash(model_path)}:{backend}:{imgsz}"
+
+    def get(self, model, source, item, params):
+        """Return the cached Detections, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT rowid, n, data FROM detections WHERE model = ? AND source = ? AND item = ? AND params = ?",
+                (model, source, str(item), params),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE detections SET last_used = ? WHERE rowid = ?", (time.time(), row[0]))
+            self._wrote()
+        return decode_detections(row[2], row[1])
+
+    def put(self, model, source, item, params, detections):
+        data = encode_detections(detections)
+        with self._lock:
+            # a replaced entry only changes the size by the difference of the two blobs
+            old = self._conn.execute(
+                "SELECT LENGTH(data) FROM detections WHERE model = ? AND source = ? AND item = ? AND params = ?",
+                (model, source, str(item), params),
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO detections (model, source, item, params, n, data, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, source, str(item), params, len(detections.conf), data, time.time()),
+            )
+            self._size += len(data) - old[0] if old is not None else len(data) + _ROW_OVERHEAD
+            self._wrote()
+
+    def model_names(self, model):
+        with self._lock:
+            row = self._conn.execute("SELECT names FROM models WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return None
+        return {int(k): v for k, v in json.loads(row[0]).items()}
+
+    def set_model_names(self, model, names):
+        text = json.dumps({int(k): v for k, v in names.items()})
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO models (model, names) VALUES (?, ?)", (model, text))
+            self._wrote()
+
+    def _wrote(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._commit()
+
+    def _commit(self):
+        if self._size > self.max_bytes:
+            self._evict()
+        self._conn.commit()
+        self._pending = 0
+
+    def _evict(self):
+        """Delete the least recently used entries until the store is back under 90% of max_bytes."""
+        target = self._size - int(self.max_bytes * 0.9)
+        freed, rowids = 0, []
+        for rowid, size in self._conn.execute("SELECT rowid, LENGTH(data) FROM detections ORDER BY last_used"):
+            rowids.append((rowid,))
+            freed += size + _ROW_OVERHEAD
+            if freed >= target:
+                break
+        self._conn.executemany("DELETE FROM detections WHERE rowid = ?", rowids)
+        self._size -= freed
+        self.evicted += len(rowids)
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "size_mb": self._size / 1e6}
+
+
+class CachedDetector:
+    """
+    A detector whose predictions are looked up in a DetectionCache first. The model is only loaded on the
+    first cache miss, so a fully cached run never loads it. Without a cache every call goes to the model.
+    """
+    def __init__(self, cache, model_path, backend="torch", imgsz=640, threads=0, source="", device=None):
+        """
+        Parameters:
+            cache (DetectionCache | None): the cache, or None to always run the model.
+            model_path (str | Path): weights passed to load_detector.
+            backend, imgsz, threads: passed to load_detector. backend and imgsz are part of the cache key.
+            source (str): key of the source the frames come from (see source_key), "" for images keyed by content.
+            device (str | None): torch device, e.g. "cpu". Defaults to CUDA when available.
+        """
+        self.cache = cache
+        self.model_path = model_path
+        self.backend = backend
+        self.imgsz = imgsz
+        self.threads = threads
+        self.source = source
+        self.device = device
+        self.model_key = DetectionCache.model_key(model_path, backend, imgsz) if cache is not None else None
+        self._detector = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._detector is not None
+
+    @property
+    def detector(self):
+        """The underlying detector, loaded on first use."""
+        return self.load()
+
+    def load(self):
+        with self._load_lock:
+            if self._detector is None:
+                self._detector = load_detector(self.model_path, backend=self.backend, imgsz=self.imgsz, threads=self.threads,
+                                               device=self.device)
+                if self.cache is not None:
+                    self.cache.set_model_names(self.model_key, self._detector.names)
+        return self._detector
+
+    @property
+    def names(self):
+        if self._detector is None and self.cache is not None:
+            names = self.cache.model_names(self.model_key)
+            if names is not None:
+                return names
+        return self.detector.names
+
+    def lookup(self, key, classes=None, conf=0.25, iou=0.7):
+        if self.cache is None:
+            return None
+        return self.cache.get(self.model_key, self.source, key, params_key(classes, conf, iou))
+
+    def store(self, key, detections, classes=None, conf=0.25, iou=0.7):
+        if self.cache is not None and detections is not None:
+            self.cache.put(self.model_key, self.source, key, params_key(classes, conf, iou), detections)
+
+    def predict(self, frames, classes=None, conf=0.25, iou=0.7, keys=None):
+        """
+        Like Detector.predict. keys holds the cache key of every frame (e.g. frame indices or file hashes);
+        by default frames are keyed by a hash of their pixels.
+        """
+        if keys is None:
+            keys = [image_hash(frame) for frame in frames] if self.cache is not None else [None] * len(frames)
+        results = [self.lookup(key, classes, conf, iou) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            predicted = self.detector.predict([frames[i] for i in missing], classes=classes, conf=conf, iou=iou)
+            for i, detections in zip(missing, predicted):
+                results[i] = detections
+                self.store(keys[i], detections, classes, conf, iou)
+        return results
@@ -0,0 +1,289 @@
+import os
+import csv
+import json
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from box_ops import box_iou
+from yolo_labels import read_labels, xywhn_to_xyxy
+from inference_backend import BACKENDS, set_torch_threads
+from detection_cache import DetectionCache, CachedDetector, file_hash
+
+# =========================
+# Headless model evaluation
+# Streams a labeled split (an Ultralytics image list such as dataset_webcam/test.txt, or an image directory)
+# through batched inference and scores the predictions of the target class against the labels:
+# precision, recall and F1 at the confidence threshold, mAP@0.5 and mAP@0.5:0.95 over all confidences, and
+# the per-image count error (MAE, RMSE and bias) that matters for counting people. Images and labels are read
+# and decoded on a thread pool one batch ahead of the model, and the IoU matrices and matching of every image
+# are NumPy operations. Results go to <output>.json together with <output>_worst.csv, the frames with the
+# largest count error, for review. Predictions are kept in the detection cache, so re-evaluating the same
+# model only re-runs the matching.
+# Example:
+#   python evaluate_model.py --model_path finetune/<run>/weights/best.pt --source datasets/dataset_webcam/test.txt
+# =========================
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)  # mAP@0.5:0.95; the first one is mAP@0.5
+
+valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+# gt: number of labeled boxes; conf: (N,) confidences of the predictions, highest first;
+# tp: (N, len(IOU_THRESHOLDS)) bool, whether each prediction matched a label at each IoU threshold
+ImageResult = namedtuple("ImageResult", ["path", "gt", "conf", "tp"])
+
+
+def label_path_of(image_path):
+    """Label file of an image by the Ultralytics convention: .../images/.../x.jpg -> .../labels/.../x.txt"""
+    head, sep, tail = image_path.rpartition(f"{os.sep}images{os.sep}")
+    if not sep:
+        raise ValueError(f"{image_path} is not inside an images directory")
+    return os.path.splitext(f"{head}{os.sep}labels{os.sep}{tail}")[0] + ".txt"
+
+
+def read_split(source):
+    """
+    Image paths of a split: the entries of an image list (relative to the list's directory) or an image directory.
+    A list of such sources, as in a data yaml with several directories per split, gives their images in order.
+    """
+    if isinstance(source, (list, tuple)):
+        return [path for entry in source for path in read_split(entry)]
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, f) for f in os.listdir(source)
+                      if os.path.splitext(f)[1].lower() in valid_extensions)
+    root = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        entries = [line.strip() for line in f if line.strip()]
+    return [os.path.normpath(os.path.join(root, entry)) for entry in entries]
+
+
+def match_predictions(iou, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match predictions (rows of iou, sorted by confidence) to labels (columns) at every IoU threshold.
+    Each label matches at most one prediction and each prediction at most one label, highest IoU pairs first.
+    Returns an (N, len(iou_thresholds)) bool array of true positives.
+    """
+    tp = np.zeros((iou.shape[0], len(iou_thresholds)), dtype=bool)
+    if iou.size == 0:
+        return tp
+    for t, threshold in enumerate(iou_thresholds):
+        rows, cols = np.nonzero(iou >= threshold)
+        if rows.size == 0:
+            continue
+        order = np.argsort(-iou[rows, cols], kind="stable")
+        rows, cols = rows[order], cols[order]
+        # keep the best pair of every prediction, then the best remaining pair of every label
+        _, first = np.unique(rows, return_index=True)
+        rows, cols = rows[first], cols[first]
+        order = np.argsort(-iou[rows, cols], kind="stable")
+        rows, cols = rows[order], cols[order]
+        _, first = np.unique(cols, return_index=True)
+        tp[rows[first], t] = True
+    return tp
+
+
+def average_precision(conf, tp, num_gt):
+    """
+    All-point interpolated average precision of every column of tp (one per IoU threshold) for predictions
+    with the given confidences, against num_gt labels.
+    """
+    if num_gt == 0 or len(conf) == 0:
+        return np.zeros(tp.shape[1])
+    order = np.argsort(-conf, kind="stable")
+    tp_cumulative = np.cumsum(tp[order], axis=0)
+    fp_cumulative = np.cumsum(~tp[order], axis=0)
+    recall = tp_cumulative / num_gt
+    precision = tp_cumulative / (tp_cumulative + fp_cumulative)
+    # precision envelope: the best precision at any higher recall
+    envelope = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+    recall_steps = np.diff(np.vstack([np.zeros((1, tp.shape[1])), recall]), axis=0)
+    return (recall_steps * envelope).sum(axis=0)
+
+
+def load_item(image_path, label_class=0, cache_key=False):
+    """Read an image and its labels of label_class as pixel xyxy boxes. Returns (image, gt boxes, cache key)."""
+    image = cv2.imread(image_path)
+    if image is None:
+        return None, None, None
+    height, width = image.shape[:2]
+    label_path = label_path_of(image_path)
+    gt = np.zeros((0, 4), dtype=np.float32)
+    if os.path.exists(label_path):
+        classes, xywhn = read_labels(label_path)
+        gt = xywhn_to_xyxy(xywhn[classes == label_class], width, height)
+    return image, gt, file_hash(image_path) if cache_key else None
+
+
+def read_batches(image_paths, batch_size, workers, label_class=0, cache_keys=False):
+    """Yield (paths, images, gt boxes, cache keys) batches, read on a thread pool one batch ahead of the model."""
+    def submit(paths):
+        return paths, [pool.submit(load_item, path, label_class, cache_keys) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        pending = submit(batches[0]) if batches else None
+        for next_paths in batches[1:] + [None]:
+            paths, futures = pending
+            pending = submit(next_paths) if next_paths is not None else None
+            items = [future.result() for future in futures]
+            yield paths, [item[0] for item in items], [item[1] for item in items], [item[2] for item in items]
+
+
+def evaluate(detector, image_paths, class_id=None, label_class=0, conf_floor=0.001, iou=0.7, batch_size=8,
+             workers=4, cache_keys=False):
+    """
+    Run a detector over a split and match its predictions to the labels.
+
+    Parameters:
+        detector: anything with predict(frames, classes, conf, iou) (a CachedDetector if cache_keys is set).
+        image_paths (list[str]): images of the split; labels are found with label_path_of.
+        class_id (int | None): model class that is evaluated; None evaluates every predicted class.
+        label_class (int): label class the predictions are compared with.
+        conf_floor (float): confidence the model runs at. Low, so the precision-recall curve is complete.
+        iou (float): NMS IoU threshold of the model.
+        batch_size (int): images per forward pass.
+        workers (int): threads reading and decoding images and labels.
+        cache_keys (bool): key predictions by the file hash of each image (detector must be a CachedDetector).
+    Returns a list of ImageResult.
+    """
+    classes = [class_id] if class_id is not None else None
+    results = []
+    start = time.perf_counter()
+    for paths, images, gts, keys in read_batches(image_paths, batch_size, workers, label_class, cache_keys):
+        readable = [i for i, image in enumerate(images) if image is not None]
+        for i in set(range(len(paths))) - set(readable):
+            print(f"Could not read {paths[i]}")
+        if not readable:
+            continue
+        kwargs = {"keys": [keys[i] for i in readable]} if cache_keys else {}
+        predictions = detector.predict([images[i] for i in readable], classes=classes, conf=conf_floor, iou=iou, **kwargs)
+        for i, detections in zip(readable, predictions):
+            order = np.argsort(-detections.conf, kind="stable")
+            tp = match_predictions(box_iou(detections.xyxy[order], gts[i]))
+            results.append(ImageResult(paths[i], len(gts[i]), detections.conf[order], tp))
+        if len(results) % (batch_size * 25) < len(readable):
+            print(f"Evaluated {len(results)}/{len(image_paths)} images "
+                  f"({len(results) / (time.perf_counter() - start):.1f} images/s)")
+    return results
+
+
+def summarize(results, conf_threshold=0.4):
+    """Aggregate metrics of a list of ImageResult. Returns (metrics dict, per-image rows)."""
+    conf = np.concatenate([r.conf for r in results]) if results else np.zeros(0, np.float32)
+    tp = np.concatenate([r.tp for r in results]) if results else np.zeros((0, len(IOU_THRESHOLDS)), bool)
+    num_gt = sum(r.gt for r in results)
+    ap = average_precision(conf, tp, num_gt)
+
+    kept = conf >= conf_threshold
+    true_positives = int(tp[kept, 0].sum())
+    predicted = int(kept.sum())
+    precision = true_positives / predicted if predicted else 0.0
+    recall = true_positives / num_gt if num_gt else 0.0
+
+    rows = []
+    for r in results:
+        image_kept = r.conf >= conf_threshold
+        image_tp = int(r.tp[image_kept, 0].sum())
+        count = int(image_kept.sum())
+        rows.append({"image": r.path, "labels": r.gt, "predicted": count, "count_error": count - r.gt,
+                     "true_positives": image_tp, "false_positives": count - image_tp,
+                     "false_negatives": r.gt - image_tp})
+    errors = np.array([row["count_error"] for row in rows], dtype=np.float64)
+    metrics = {
+        "images": len(results),
+        "labels": num_gt,
+        "predictions": predicted,
+        "conf_threshold": conf_threshold,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "map50": float(ap[0]),
+        "map50_95": float(ap.mean()),
+        "count_mae": float(np.abs(errors).mean()) if len(errors) else 0.0,
+        "count_rmse": float(np.sqrt((errors ** 2).mean())) if len(errors) else 0.0,
+        "count_bias": float(errors.mean()) if len(errors) else 0.0,
+    }
+    return metrics, rows
+
+
+def write_report(output, metrics, rows, worst=50):
+    """Write <output>.json (metrics) and <output>_worst.csv (the worst frames, largest count error first)."""
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(f"{output}.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    ranked = sorted(rows, key=lambda row: (abs(row["count_error"]), row["false_positives"] + row["false_negatives"]),
+                    reverse=True)
+    with open(f"{output}_worst.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["image"])
+        writer.writeheader()
+        writer.writerows(ranked[:worst])
+
+
+def main():
+    from config.config import frame_capture_settings, train_val_test_settings
+
+    parser = argparse.ArgumentParser(description="Evaluate a model on a labeled split without a display.")
+    parser.add_argument("--model_path", type=str, required=True, help="Model weights to evaluate.")
+    parser.add_argument("--source", type=str, default=os.path.join(train_val_test_settings.manifest_dir, "test.txt"),
+                        help="Image list (e.g. dataset_webcam/test.txt) or image directory of the split.")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads of the backend (0 = backend default).")
+    parser.add_argument("--device", type=str, default="cpu", help="torch device of the torch backend.")
+    parser.add_argument("--batch_size", type=int, default=8, help="Images per forward pass.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads reading images and labels.")
+    parser.add_argument("--conf_threshold", type=float, default=frame_capture_settings.conf_threshold,
+                        help="Confidence for precision, recall and counts.")
+    parser.add_argument("--conf_floor", type=float, default=0.001, help="Confidence the model runs at (for mAP).")
+    parser.add_argument("--label_class", type=int, default=0, help="Class id of the target in the label files.")
+    parser.add_argument("--worst", type=int, default=50, help="Number of worst frames written out.")
+    parser.add_argument("--output", type=str, default="evaluations/evaluation",
+                        help="Output path without extension; <output>.json and <output>_worst.csv are written.")
+    parser.add_argument("--cache_path", type=str, default="detection_cache.sqlite",
+                        help="SQLite detection cache; empty to disable.")
+    args = parser.parse_args()
+
+    image_paths = read_split(args.source)
+    if not image_paths:
+        parser.error(f"No images found in {args.source}")
+
+    cache = DetectionCache(args.cache_path) if args.cache_path else None
+    if args.backend == "torch":
+        set_torch_threads(args.threads)
+    detector = CachedDetector(cache, args.model_path, backend=args.backend, imgsz=args.imgsz, threads=args.threads,
+                              device=args.device)
+    try:
+        class_id = next((k for k, v in detector.names.items() if v == frame_capture_settings.target_label), None)
+        if class_id is None:
+            print(f"Target label '{frame_capture_settings.target_label}' not found in model classes, evaluating every class")
+        print(f"Evaluating {args.model_path} on {len(image_paths)} images from {args.source}")
+        start = time.perf_counter()
+        results = evaluate(detector, image_paths, class_id=class_id, label_class=args.label_class,
+                           conf_floor=args.conf_floor, batch_size=args.batch_size, workers=args.workers,
+                           cache_keys=cache is not None)
+        elapsed = time.perf_counter() - start
+    finally:
+        if cache is not None:
+            print("Detection cache:", cache.stats())
+            cache.close()
+
+    metrics, rows = summarize(results, args.conf_threshold)
+    metrics.update({"model_path": args.model_path, "source": args.source, "backend": args.backend,
+                    "imgsz": args.imgsz, "seconds": elapsed, "images_per_second": len(results) / elapsed})
+    write_report(args.output, metrics, rows, args.worst)
+
+    print(f"{metrics['images']} images, {metrics['labels']} labels, {metrics['predictions']} predictions "
+          f"at conf {args.conf_threshold} ({elapsed:.1f} s, {metrics['images_per_second']:.1f} images/s)")
+    print(f"Precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}, F1 {metrics['f1']:.3f}, "
+          f"mAP@0.5 {metrics['map50']:.3f}, mAP@0.5:0.95 {metrics['map50_95']:.3f}")
+    print(f"Count error per image: MAE {metrics['count_mae']:.2f}, RMSE {metrics['count_rmse']:.2f}, "
+          f"bias {metrics['count_bias']:+.2f}")
+    print(f"Results written to {args.output}.json, worst frames to {args.output}_worst.csv")
+
+
+if __name__ == "__main__":
+    main()
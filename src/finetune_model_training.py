@@ -6,21 +6,65 @@ from datetime import datetime
 
 from config.config import finetune_settings
 
-def external_train(timestamp):
+# augmentations of the webcam stage, which trains on frames of a fixed camera
+WEBCAM_AUGMENTATION = dict(degrees=0.0, translate=0.0, scale=0.0, fliplr=0.0, mosaic=0.0, erasing=0.0)
+
+
+def training_data(data_yaml, imgsz):
+    """
+    (data yaml, trainer) to train on: with packed_dataset enabled, the yaml of the splits packed at imgsz
+    (packed first if missing or stale) and the trainer that reads them; otherwise the yaml as is and the default trainer.
+    """
+    if not finetune_settings.packed_dataset:
+        return data_yaml, None
+    # imported here so that training without packed datasets does not depend on them
+    from pack_dataset import ensure_packed
+    from packed_training import PackedDetectionTrainer
+
+    packed_yaml = ensure_packed(str(data_yaml), imgsz, str(finetune_settings.packed_dataset_dir))
+    return packed_yaml, PackedDetectionTrainer
+
+
+def cached_stage(stage, model_path, data_yaml, settings, train):
+    """
+    Return the best.pt of a training stage. With stage_cache enabled, a stage whose starting weights, dataset and
+    settings are unchanged is skipped and its cached best.pt reused; otherwise train(run_id) trains it, with the
+    first characters of the stage key as run_id, and its best.pt is added to the cache. Without the cache run_id
+    is a timestamp.
+    """
+    if not finetune_settings.stage_cache:
+        return train(datetime.now().strftime("%Y_%m_%d_%H_%M"))
+    from stage_cache import StageCache, stage_key
+
+    key, inputs = stage_key(stage, model_path, data_yaml, settings)
+    cache = StageCache(finetune_settings.stage_cache_dir)
+    cached_model = cache.get(key)
+    if cached_model is not None:
+        print(f"Inputs of the {stage} stage are unchanged (key {key[:12]}), reusing {cached_model}")
+        return cached_model
+    best_model_path = train(key[:12])
+    run_dir = os.path.dirname(os.path.dirname(best_model_path))
+    cached_model = cache.put(key, best_model_path, inputs, run_dir=run_dir)
+    print(f"Cached the {stage} stage as {cached_model}")
+    return cached_model
+
+
+def external_train(run_id):
     # Load the pre-trained YOLO model
     model = YOLO(finetune_settings.model_path)
 
-    data_yaml = finetune_settings.external_finetune_yaml
+    data_yaml, trainer = training_data(finetune_settings.external_finetune_yaml, finetune_settings.external_finetune_imgsz)
     print("Data YAML path:", data_yaml)
     model_name = os.path.splitext(os.path.basename(finetune_settings.model_path))[0]
     
     results = model.train(
         data=data_yaml,
+        trainer=trainer,
         epochs=finetune_settings.external_finetune_epochs,
         imgsz=finetune_settings.external_finetune_imgsz,
         batch=finetune_settings.external_finetune_batch_size,
         project=finetune_settings.project_name,
-        name=f"Stage_1_{model_name}_external_finetune_{timestamp}",
+        name=f"Stage_1_{model_name}_external_finetune_{run_id}",
     )
     
     print("Finetuning on external dataset complete!")
@@ -34,24 +78,20 @@ def webcam_train(model_path, model_name):
     
     model = YOLO(model_path)
 
-    data_yaml = finetune_settings.webcam_finetune_yaml
+    data_yaml, trainer = training_data(finetune_settings.webcam_finetune_yaml, finetune_settings.webcam_finetune_imgsz)
     print("Data YAML path:", data_yaml)
     print("Model name:", model_name)
     print("Model path:", model_path)
     
     results = model.train(
         data=data_yaml,
+        trainer=trainer,
         epochs=finetune_settings.webcam_finetune_epochs,
         imgsz=finetune_settings.webcam_finetune_imgsz,
         batch=finetune_settings.webcam_finetune_batch_size,
         project=finetune_settings.project_name,
         name=model_name,
-        degrees = 0.0,
-        translate = 0.0,
-        scale = 0.0,
-        fliplr = 0.0,
-        mosaic = 0.0,
-        erasing = 0.0,
+        **WEBCAM_AUGMENTATION,
     )
     
     print("Finetuning on webcam dataset complete!")
@@ -61,17 +101,32 @@ def webcam_train(model_path, model_name):
     return best_model_path
 
 def main():
-    timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M")
+    base_name = os.path.splitext(os.path.basename(finetune_settings.model_path))[0]
+    model_path = finetune_settings.model_path
+    prefix = ""
     if finetune_settings.external_finetune:
-        external_model = external_train(timestamp)
-        model_name = f"Stage_2_{os.path.splitext(os.path.basename(finetune_settings.model_path))[0]}_webcam_finetune_{timestamp}"
-        webcam_model = webcam_train(external_model, model_name)
-    else:
-        model_name = f"{os.path.splitext(os.path.basename(finetune_settings.model_path))[0]}_webcam_finetune_{timestamp}"
-        webcam_model = webcam_train(finetune_settings.model_path, model_name)
+        external_settings = {
+            "imgsz": finetune_settings.external_finetune_imgsz,
+            "epochs": finetune_settings.external_finetune_epochs,
+            "batch": finetune_settings.external_finetune_batch_size,
+            "packed_dataset": finetune_settings.packed_dataset,
+        }
+        model_path = cached_stage("external", model_path, finetune_settings.external_finetune_yaml,
+                                  external_settings, external_train)
+        prefix = "Stage_2_"
+    webcam_settings = {
+        "imgsz": finetune_settings.webcam_finetune_imgsz,
+        "epochs": finetune_settings.webcam_finetune_epochs,
+        "batch": finetune_settings.webcam_finetune_batch_size,
+        "packed_dataset": finetune_settings.packed_dataset,
+        **WEBCAM_AUGMENTATION,
+    }
+    webcam_model = cached_stage(
+        "webcam", model_path, finetune_settings.webcam_finetune_yaml, webcam_settings,
+        lambda run_id: webcam_train(model_path, f"{prefix}{base_name}_webcam_finetune_{run_id}"),
+    )
     print("Training complete!")
     print("Best model for the current run is saved at:", webcam_model)
 
 if __name__ == "__main__":
     main()
-
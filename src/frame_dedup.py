@@ -0,0 +1,123 @@
+import os
+
+import cv2
+import numpy as np
+
+# =========================
+# Near-duplicate frame filter
+# Each frame is reduced to a 64 bit difference hash (dHash): the frame is downsampled to 9x8 grey pixels and
+# every bit records whether a pixel is brighter than its right hand neighbour. Frames whose hashes differ in
+# at most max_distance bits are treated as duplicates. Hashes are compared against a ring of recent frames and
+# against a persistent index of every frame saved so far, both as vectorized XOR + popcount over uint64 arrays.
+# =========================
+
+valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def dhash(frame, hash_size=8):
+    """Return the difference hash of a BGR (or greyscale) frame as a numpy uint64."""
+    # nearest-neighbour sampling to a 16x oversized grid first keeps the area average cheap on large frames
+    coarse = cv2.resize(frame, ((hash_size + 1) * 16, hash_size * 16), interpolation=cv2.INTER_NEAREST)
+    small = cv2.resize(coarse, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits.ravel()).view(">u8")[0].astype(np.uint64)
+
+
+def hamming_distances(hashes, value):
+    """Number of differing bits between every hash in a uint64 array and a single uint64 value."""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class DuplicateFilter:
+    def __init__(self, index_path, max_distance=3, recent_size=256):
+        """
+        Parameters:
+            index_path (str | Path): file holding the hashes of every saved frame as raw uint64 values.
+                New hashes are appended to it, so it survives restarts.
+            max_distance (int): frames within this many differing bits of a known frame are duplicates.
+            recent_size (int): number of recently saved hashes checked before the full index.
+        """
+        self.index_path = index_path
+        self.max_distance = int(max_distance)
+
+        self._recent = np.zeros(max(1, int(recent_size)), dtype=np.uint64)
+        self._recent_count = 0
+        self._recent_pos = 0
+
+        # growable array so appending a hash does not copy the whole index
+        existing = np.fromfile(index_path, dtype=np.uint64) if os.path.exists(index_path) else np.zeros(0, np.uint64)
+        self._index = np.zeros(max(1024, existing.size * 2), dtype=np.uint64)
+        self._index[:existing.size] = existing
+        self._index_count = existing.size
+
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def __len__(self):
+        return self._index_count
+
+    def build_index(self, img_dir):
+        """Hash every image in img_dir and write them as the persistent index. Used when no index exists yet."""
+        hashes = []
+        for filename in sorted(os.listdir(img_dir)):
+            if os.path.splitext(filename)[1].lower() not in valid_extensions:
+                continue
+            # a reduced decode is plenty for a 9x8 hash and much faster on large frames
+            img = cv2.imread(os.path.join(img_dir, filename), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if img is not None:
+                hashes.append(dhash(img))
+        hashes = np.array(hashes, dtype=np.uint64)
+        hashes.tofile(self.index_path)
+        self._index = np.zeros(max(1024, hashes.size * 2), dtype=np.uint64)
+        self._index[:hashes.size] = hashes
+        self._index_count = hashes.size
+        return hashes.size
+
+    def min_distance(self, frame_hash):
+        """Smallest Hamming distance between frame_hash and any recent or indexed hash (65 if none are known)."""
+        best = 65
+        if self._recent_count:
+            best = int(hamming_distances(self._recent[:self._recent_count], frame_hash).min())
+        if best > self.max_distance and self._index_count:
+            best = min(best, int(hamming_distances(self._index[:self._index_count], frame_hash).min()))
+        return best
+
+    def check(self, frame):
+        """
+        Return (is_duplicate, frame_hash, distance) for a frame.
+        Frames that are not duplicates should be passed to add() once they are saved.
+        """
+        frame_hash = dhash(frame)
+        distance = self.min_distance(frame_hash)
+        is_duplicate = distance <= self.max_distance
+        self.frames_checked += 1
+        if is_duplicate:
+            self.frames_skipped += 1
+        return is_duplicate, frame_hash, distance
+
+    def add(self, frame_hash):
+        """Record the hash of a saved frame in the recent ring and append it to the persistent index."""
+        self._recent[self._recent_pos] = frame_hash
+        self._recent_pos = (self._recent_pos + 1) % self._recent.size
+        self._recent_count = min(self._recent_count + 1, self._recent.size)
+
+        if self._index_count == self._index.size:
+            grown = np.zeros(self._index.size * 2, dtype=np.uint64)
+            grown[:self._index_count] = self._index[:self._index_count]
+            self._index = grown
+        self._index[self._index_count] = frame_hash
+        self._index_count += 1
+        with open(self.index_path, "ab") as f:
+            f.write(np.uint64(frame_hash).tobytes())
+
+    def stats(self):
+        return {
+            "frames_checked": self.frames_checked,
+            "frames_skipped": self.frames_skipped,
+            "indexed_frames": self._index_count,
+        }
@@ -0,0 +1,129 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# =========================
+# Background writer pool
+# JPEG encoding and file writes are handed to a pool of worker threads through a bounded queue so the
+# capture loop never waits on slow (e.g. network mounted) storage. When the queue is full, submitting
+# blocks, which slows the capture loop down instead of growing memory without bound.
+# =========================
+
+_STOP = object()
+
+
+class FrameWriterPool:
+    def __init__(self, num_workers=2, max_queue=64, jpeg_quality=95, latency_window=200, metrics=None):
+        """
+        Parameters:
+            num_workers (int): number of writer threads.
+            max_queue (int): maximum number of pending write jobs.
+            jpeg_quality (int): JPEG quality (0-100) used when encoding frames.
+            latency_window (int): number of recent writes used for the latency statistics.
+            metrics (StageMetrics | None): if given, JPEG encoding and image and label writes are recorded
+                as the "jpeg_encode", "image_write" and "label_write" stages.
+        """
+        self.jpeg_quality = int(jpeg_quality)
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.jobs_written = 0
+        self.jobs_failed = 0
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"frame-writer-{i}", daemon=True)
+            for i in range(max(1, int(num_workers)))
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._closed = False
+
+    def write_image(self, path, frame):
+        """Queue a BGR frame to be JPEG encoded and written to path. The frame must not be modified afterwards."""
+        self._submit(self._encode_and_write, path, frame)
+
+    def write_text(self, path, text):
+        """Queue text (e.g. a YOLO annotation file) to be written to path."""
+        self._submit(self._write_label, path, text.encode("utf-8"))
+
+    def _submit(self, func, path, payload):
+        if self._closed:
+            raise RuntimeError("FrameWriterPool is closed")
+        self._queue.put((func, path, payload, time.monotonic()))
+
+    def _encode_and_write(self, path, frame):
+        start = time.perf_counter()
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise IOError(f"Could not encode frame for {path}")
+        encoded = time.perf_counter()
+        self._write_bytes(path, buffer.tobytes())
+        if self.metrics is not None:
+            self.metrics.record("jpeg_encode", encoded - start)
+            self.metrics.record("image_write", time.perf_counter() - encoded)
+
+    def _write_label(self, path, data):
+        start = time.perf_counter()
+        self._write_bytes(path, data)
+        if self.metrics is not None:
+            self.metrics.record("label_write", time.perf_counter() - start)
+
+    @staticmethod
+    def _write_bytes(path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                func, path, payload, submitted_at = job
+                try:
+                    func(path, payload)
+                except Exception as e:
+                    print(f"Could not write {path}: {e}")
+                    with self._lock:
+                        self.jobs_failed += 1
+                    continue
+                with self._lock:
+                    self.jobs_written += 1
+                    # latency includes time spent waiting in the queue, which is what tells us storage is behind
+                    self._latencies.append(time.monotonic() - submitted_at)
+            finally:
+                self._queue.task_done()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64)
+            written, failed = self.jobs_written, self.jobs_failed
+        return {
+            "queue_depth": self.queue_depth(),
+            "jobs_written": written,
+            "jobs_failed": failed,
+            "write_latency_mean": float(latencies.mean()) if latencies.size else 0.0,
+            "write_latency_max": float(latencies.max()) if latencies.size else 0.0,
+        }
+
+    def flush(self):
+        """Block until every queued job has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Flush all pending writes and stop the worker threads."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
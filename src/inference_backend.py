@@ -0,0 +1,270 @@
+import ast
+import os
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from box_ops import nms
+
+# =========================
+# Pluggable inference backends
+# Every backend loads a YOLO detection model and exposes the same predict(frames, classes, conf) method,
+# returning one Detections tuple per frame. The "torch" backend runs the .pt weights through ultralytics.
+# The "onnx" and "openvino" backends run a model exported by ultralytics on the CPU with a configurable
+# number of threads; pre- and post-processing (letterbox, confidence filter, NMS) are done here in NumPy
+# so the boxes match the ultralytics pipeline.
+# The number of threads PyTorch uses is a process-wide setting, so it is set once by each entry point with
+# set_torch_threads rather than by every torch detector.
+# =========================
+
+# xyxy: (N, 4) float32 pixel boxes in the original frame, conf: (N,) float32, cls: (N,) int32
+Detections = namedtuple("Detections", ["xyxy", "conf", "cls"])
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def empty_detections():
+    return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int32))
+
+
+def letterbox(frame, imgsz):
+    """
+    Resize frame to fit an imgsz x imgsz square keeping its aspect ratio, and pad the rest with grey (114)
+    like ultralytics does. Returns (padded image, gain, (pad_x, pad_y)).
+    """
+    height, width = frame.shape[:2]
+    gain = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * gain)), int(round(height * gain))
+    pad_x, pad_y = (imgsz - new_w) / 2, (imgsz - new_h) / 2
+    if (new_w, new_h) != (width, height):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, gain, (left, top)
+
+
+def set_torch_threads(threads):
+    """Set the number of CPU threads PyTorch uses in this process. 0 keeps the PyTorch default."""
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+class TorchDetector:
+    """Runs .pt weights through ultralytics (PyTorch). Its CPU threads are set with set_torch_threads."""
+    backend = "torch"
+
+    def __init__(self, model_path, imgsz=640, device=None):
+        import torch
+        from ultralytics import YOLO
+
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = YOLO(model_path).to(self.device)
+        self.names = self.model.names
+        self.imgsz = imgsz
+
+    def predict(self, frames, classes=None, conf=0.25, iou=0.7):
+        results = self.model(frames, classes=classes, conf=conf, iou=iou, imgsz=self.imgsz, verbose=False)
+        detections = []
+        for result in results:
+            if result.boxes is None:
+                detections.append(empty_detections())
+                continue
+            boxes = result.boxes
+            detections.append(Detections(
+                boxes.xyxy.cpu().numpy().astype(np.float32),
+                boxes.conf.cpu().numpy().astype(np.float32),
+                boxes.cls.cpu().numpy().astype(np.int32),
+            ))
+        return detections
+
+
+class _ExportedDetector(ABC):
+    """Shared letterbox pre-processing and NMS post-processing for exported (ONNX / OpenVINO) models."""
+
+    def __init__(self, imgsz):
+        self.imgsz = imgsz
+        self.dynamic_batch = False
+        self.names = {}
+
+    def preprocess(self, frames):
+        """Letterbox and stack frames into a (B, 3, imgsz, imgsz) float32 RGB tensor."""
+        batch = np.empty((len(frames), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        transforms = []
+        for i, frame in enumerate(frames):
+            padded, gain, pad = letterbox(frame, self.imgsz)
+            # BGR HWC uint8 -> RGB CHW float in [0, 1]
+            batch[i] = padded[:, :, ::-1].transpose(2, 0, 1) * (1.0 / 255.0)
+            transforms.append((gain, pad, frame.shape[:2]))
+        return batch, transforms
+
+    @abstractmethod
+    def _run(self, batch):
+        """Run the model on a preprocessed (B, 3, imgsz, imgsz) batch and return its raw output."""
+
+    def postprocess(self, output, transforms, classes=None, conf=0.25, iou=0.7, max_det=300):
+        """Decode a (B, 4 + num_classes, anchors) YOLO output into Detections in original frame pixels."""
+        detections = []
+        for prediction, (gain, (pad_x, pad_y), (height, width)) in zip(output, transforms):
+            prediction = prediction.T  # (anchors, 4 + num_classes)
+            scores = prediction[:, 4:]
+            cls = scores.argmax(axis=1)
+            best = scores[np.arange(len(cls)), cls]
+            mask = best > conf
+            if classes is not None:
+                mask &= np.isin(cls, classes)
+            if not mask.any():
+                detections.append(empty_detections())
+                continue
+            xywh, best, cls = prediction[mask, :4], best[mask], cls[mask]
+            xyxy = np.empty_like(xywh)
+            xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+            xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+            keep = nms(xyxy, best, iou_threshold=iou, classes=cls, max_det=max_det)
+            xyxy = xyxy[keep]
+            # undo the letterbox: remove the padding, scale back and clip to the frame
+            xyxy[:, [0, 2]] = np.clip((xyxy[:, [0, 2]] - pad_x) / gain, 0, width)
+            xyxy[:, [1, 3]] = np.clip((xyxy[:, [1, 3]] - pad_y) / gain, 0, height)
+            detections.append(Detections(xyxy.astype(np.float32), best[keep].astype(np.float32), cls[keep].astype(np.int32)))
+        return detections
+
+    def predict(self, frames, classes=None, conf=0.25, iou=0.7):
+        if not frames:
+            return []
+        return self.predict_preprocessed(self.preprocess(frames), classes=classes, conf=conf, iou=iou)
+
+    def predict_preprocessed(self, preprocessed, classes=None, conf=0.25, iou=0.7):
+        """Run inference on the output of preprocess(), so models with the same input size can share one preprocessing."""
+        batch, transforms = preprocessed
+        if self.dynamic_batch:
+            output = self._run(batch)
+        else:
+            # models exported with a fixed batch size of 1 are run frame by frame
+            output = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(batch))])
+        return self.postprocess(output, transforms, classes=classes, conf=conf, iou=iou)
+
+
+class OnnxDetector(_ExportedDetector):
+    """Runs an ONNX export on the CPU with ONNX Runtime."""
+    backend = "onnx"
+
+    def __init__(self, model_path, imgsz=640, threads=0):
+        import onnxruntime as ort
+
+        super().__init__(imgsz)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+        # ultralytics stores the class names in the model metadata as a dict literal
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if "names" in metadata:
+            self.names = ast.literal_eval(metadata["names"])
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoDetector(_ExportedDetector):
+    """Runs an OpenVINO IR export on the CPU."""
+    backend = "openvino"
+
+    def __init__(self, model_path, imgsz=640, threads=0):
+        import openvino as ov
+        import yaml
+
+        super().__init__(imgsz)
+        model_path = str(model_path)
+        if os.path.isdir(model_path):
+            # ultralytics exports a directory holding <name>.xml, <name>.bin and metadata.yaml
+            xml_files = [f for f in os.listdir(model_path) if f.endswith(".xml")]
+            if not xml_files:
+                raise FileNotFoundError(f"No OpenVINO .xml model found in {model_path}")
+            metadata_path = os.path.join(model_path, "metadata.yaml")
+            model_path = os.path.join(model_path, xml_files[0])
+        else:
+            metadata_path = os.path.join(os.path.dirname(model_path), "metadata.yaml")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.names = yaml.safe_load(f).get("names", {})
+
+        core = ov.Core()
+        model = core.read_model(model_path)
+        self.dynamic_batch = model.inputs[0].get_partial_shape()[0].is_dynamic
+        input_size = model.inputs[0].get_partial_shape()[2]
+        if input_size.is_static:
+            self.imgsz = input_size.get_length()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+
+    def _run(self, batch):
+        self.request.infer({0: batch})
+        return self.request.get_output_tensor(0).data.copy()
+
+
+def export_path(model_path, backend, imgsz=640, dynamic=True, half=False):
+    """Where the export of model_path for a backend, input size and export options is kept."""
+    stem = os.path.splitext(str(model_path))[0]
+    tag = f"{imgsz}{'_dynamic' if dynamic else ''}{'_half' if half else ''}"
+    return f"{stem}_{tag}.onnx" if backend == "onnx" else f"{stem}_{tag}_openvino_model"
+
+
+def resolve_model(model_path, backend, imgsz=640, dynamic=True, half=False):
+    """
+    Return the model file to load for a backend. For the onnx and openvino backends a .pt path is
+    exported with ultralytics the first time, and the export is reused afterwards by any run with the same
+    imgsz and export options.
+    """
+    model_path = str(model_path)
+    if backend == "torch" or not model_path.endswith(".pt"):
+        return model_path
+    exported = export_path(model_path, backend, imgsz, dynamic, half)
+    if not os.path.exists(exported):
+        from ultralytics import YOLO
+
+        print(f"Exporting {model_path} to {backend} at imgsz {imgsz}...")
+        written = str(YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=dynamic, half=half))
+        # ultralytics writes every export of a model to the same path, so it is moved to one per imgsz and options
+        os.replace(written, exported)
+    return exported
+
+
+def load_detector(model_path, backend="torch", imgsz=640, threads=0, device=None):
+    """
+    Load a detector for the given backend ("torch", "onnx" or "openvino").
+    threads sets the number of CPU threads the onnx and openvino backends use (0 keeps the backend default);
+    the torch backend's threads are process-wide and set with set_torch_threads.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Expected one of {BACKENDS}")
+    model_path = resolve_model(model_path, backend, imgsz)
+    if backend == "torch":
+        return TorchDetector(model_path, imgsz=imgsz, device=device)
+    if backend == "onnx":
+        return OnnxDetector(model_path, imgsz=imgsz, threads=threads)
+    return OpenVinoDetector(model_path, imgsz=imgsz, threads=threads)
+
+
+def draw_detections(frame, detections, names=None, color=(0, 255, 0), thickness=2, font_scale=0.5):
+    """Draw detections on frame (in place) with their class and confidence."""
+    for (x1, y1, x2, y2), conf, cls in zip(detections.xyxy, detections.conf, detections.cls):
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, thickness)
+        label = names.get(int(cls), int(cls)) if names else int(cls)
+        cv2.putText(frame, f"{label} {conf:.2f}", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, color, thickness)
+    return frame
@@ -0,0 +1,322 @@
+import os
+import sqlite3
+import argparse
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# =========================
+# Labeling state index
+# A local SQLite table with one row per captured frame: its image and pending label paths and its labeling
+# status (pending, edited or skipped) with the time it was captured and last changed. The capture script adds
+# every frame as pending and the annotation tool marks frames edited or skipped, so the label directories never
+# have to be listed: the next pending frame is one indexed lookup and progress is a GROUP BY.
+# Writes are committed in batches like CountStore. Frames captured before the index existed are added by
+# sync_directories (python label_index.py --sync), which the annotation tool also runs once on an empty index.
+# Pending frames can also be ordered by an informativeness score (written by score_pending_frames.py), highest
+# first, through a second index on (status, score).
+# =========================
+
+PENDING = "pending"
+EDITED = "edited"
+SKIPPED = "skipped"
+STATUSES = (PENDING, EDITED, SKIPPED)
+
+LabelRecord = namedtuple("LabelRecord", ["name", "camera", "image_path", "label_path", "status", "captured_at",
+                                         "updated_at", "score"])
+
+UNSCORED = -1.0  # score of frames that have not been scored yet, so they sort after every scored frame
+ORDERS = ("name", "score")
+
+valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+_TIMESTAMP_FORMAT = "%Y_%m_%d_%H_%M_%S"
+_TIMESTAMP_LENGTH = len("2025_01_01_00_00_00")
+
+
+def parse_frame_name(name):
+    """Return (camera, captured_at) of a frame named <webcam_name>_<YYYY_mm_dd_HH_MM_SS>, ("", None) otherwise."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    try:
+        captured_at = datetime.strptime(stem[-_TIMESTAMP_LENGTH:], _TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return "", None
+    return stem[:-_TIMESTAMP_LENGTH - 1], captured_at
+
+
+class LabelIndex:
+    def __init__(self, db_path, commit_every=50, commit_interval=1.0):
+        """
+        Parameters:
+            db_path (str | Path): SQLite database file. Created (with its directory) if missing.
+            commit_every (int): commit after this many pending writes.
+            commit_interval (float): commit pending writes at least this often, in seconds.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # frames are added from the inference thread and read from the annotation tool's prefetch thread,
+        # so the connection is shared behind a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS frames ("
+            " name TEXT PRIMARY KEY,"       # base name of the image and label files, without extension
+            " camera TEXT NOT NULL,"
+            " image_path TEXT NOT NULL,"
+            " label_path TEXT NOT NULL,"    # model (pending) label file, removed once the frame is edited
+            " status TEXT NOT NULL,"        # pending, edited or skipped
+            " captured_at REAL,"            # unix timestamp of the frame
+            " updated_at REAL NOT NULL,"    # unix timestamp of the last status change
+            f" score REAL NOT NULL DEFAULT {UNSCORED},"  # informativeness, higher is labeled first
+            " scored_at REAL,"
+            " score_detail TEXT)"           # JSON of the score components and the models that produced them
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(frames)")}
+        # indexes created before frames were scored get the score columns added in place
+        if "score" not in columns:
+            self._conn.execute(f"ALTER TABLE frames ADD COLUMN score REAL NOT NULL DEFAULT {UNSCORED}")
+            self._conn.execute("ALTER TABLE frames ADD COLUMN scored_at REAL")
+            self._conn.execute("ALTER TABLE frames ADD COLUMN score_detail TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS frames_status_name ON frames (status, name)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS frames_status_score ON frames (status, score DESC, name)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+    def add(self, name, image_path, label_path, camera="", captured_at=None, status=PENDING):
+        """Add a frame. A frame already in the index keeps its status."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO frames (name, camera, image_path, label_path, status, captured_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, camera, str(image_path), str(label_path), status, captured_at, time.time()),
+            )
+            self._wrote()
+
+    def add_many(self, records):
+        """Add (name, image_path, label_path, camera, captured_at, status) tuples in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO frames (name, camera, image_path, label_path, status, captured_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(name, camera, str(image_path), str(label_path), status, captured_at, now)
+                 for name, image_path, label_path, camera, captured_at, status in records],
+            )
+            self._commit()
+
+    def set_status(self, name, status):
+        if status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}'. Expected one of {STATUSES}")
+        with self._lock:
+            self._conn.execute("UPDATE frames SET status = ?, updated_at = ? WHERE name = ?", (status, time.time(), name))
+            # status changes come from a person one frame at a time, so they are committed right away
+            self._commit()
+
+    def reopen(self, names):
+        """Set edited frames among names back to pending."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE frames SET status = ?, updated_at = ? WHERE name = ? AND status = ?",
+                                   [(PENDING, now, name, EDITED) for name in names])
+            self._commit()
+
+    def set_scores(self, scores):
+        """Store (name, score, detail) tuples, where detail is a JSON string, in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE frames SET score = ?, scored_at = ?, score_detail = ? WHERE name = ?",
+                                   [(score, now, detail, name) for name, score, detail in scores])
+            self._commit()
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(LabelRecord._fields)} FROM frames WHERE name = ?", (name,)
+            ).fetchone()
+        return LabelRecord(*row) if row is not None else None
+
+    def next_frames(self, status=PENDING, after="", limit=1):
+        """The first limit frames with a status whose name sorts after the given one, in name order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(LabelRecord._fields)} FROM frames WHERE status = ? AND name > ? ORDER BY name LIMIT ?",
+                (status, after, limit),
+            ).fetchall()
+        return [LabelRecord(*row) for row in rows]
+
+    def next_frames_by_score(self, status=PENDING, after=None, limit=1):
+        """
+        The first limit frames with a status that come after the (score, name) pair after, ordered by score
+        (highest first) and then name.
+        """
+        query = f"SELECT {', '.join(LabelRecord._fields)} FROM frames WHERE status = ?"
+        params = [status]
+        if after is not None:
+            query += " AND (score < ? OR (score = ? AND name > ?))"
+            params += [after[0], after[0], after[1]]
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY score DESC, name LIMIT ?", params + [limit]).fetchall()
+        return [LabelRecord(*row) for row in rows]
+
+    def iter_frames(self, status=PENDING, order="name", page_size=256):
+        """
+        Yield every frame with a status, one indexed page at a time, in name order or with the most
+        informative (highest score) first and unscored frames last.
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order '{order}'. Expected one of {ORDERS}")
+        after = None
+        while True:
+            if order == "score":
+                page = self.next_frames_by_score(status, after, page_size)
+            else:
+                page = self.next_frames(status, after or "", page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1].score, page[-1].name) if order == "score" else page[-1].name
+
+    def count(self, status=PENDING, scored=None):
+        """Number of frames with a status; only scored (True) or unscored (False) frames if scored is given."""
+        query = "SELECT COUNT(*) FROM frames WHERE status = ?"
+        if scored is not None:
+            query += " AND score " + (">= 0" if scored else "< 0")
+        with self._lock:
+            return self._conn.execute(query, (status,)).fetchone()[0]
+
+    def progress(self):
+        """Number of frames per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM frames GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def _wrote(self):
+        self._pending += 1
+        if self._pending >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def _label_names(label_dir):
+    return {os.path.splitext(entry.name)[0] for entry in os.scandir(label_dir) if entry.name.endswith(".txt")}
+
+
+def _image_paths(img_dir):
+    """Lower-case base name -> path of every image in img_dir."""
+    return {os.path.splitext(entry.name)[0].lower(): os.path.join(img_dir, entry.name)
+            for entry in os.scandir(img_dir) if os.path.splitext(entry.name)[1].lower() in valid_extensions}
+
+
+def sync_directories(index, directories, edited_label_dir):
+    """
+    Add the frames of a set of label directories that are not in the index yet: frames with a label in
+    edited_label_dir as edited, frames with a label only in a default_label_dir as pending. Edited frames whose
+    label was moved back to a default_label_dir (to edit them again) become pending again.
+    directories are (img_dir, default_label_dir) pairs. As every camera shares edited_label_dir, the image of a
+    frame is looked up in every img_dir, ignoring case like test_train_split_labeled_data.py.
+    Each directory is listed once. Returns the number of frames added.
+    """
+    edited = _label_names(edited_label_dir)
+    label_dirs = {}  # frame name -> default_label_dir holding its label
+    for default_label_dir in dict.fromkeys(label_dir for _, label_dir in directories):
+        for name in _label_names(default_label_dir):
+            label_dirs.setdefault(name, default_label_dir)
+    images = {}  # lower-case frame name -> (image path, img_dir)
+    paired_label_dir = {}  # img_dir -> its default_label_dir
+    paired_img_dir = {}  # default_label_dir -> its img_dir
+    for img_dir, default_label_dir in directories:
+        paired_label_dir.setdefault(img_dir, default_label_dir)
+        paired_img_dir.setdefault(default_label_dir, img_dir)
+    for img_dir in paired_label_dir:
+        for stem, image_path in _image_paths(img_dir).items():
+            images.setdefault(stem, (image_path, img_dir))
+
+    records = []
+    for name in sorted(edited | set(label_dirs)):
+        status = EDITED if name in edited else PENDING
+        image_path, img_dir = images.get(name.lower(), (None, None))
+        if name in label_dirs:
+            label_dir = label_dirs[name]
+        elif img_dir is not None:
+            label_dir = paired_label_dir[img_dir]
+        else:
+            label_dir = directories[0][1]
+        if image_path is None:
+            # image missing from every directory: recorded where its camera writes it
+            image_path = os.path.join(paired_img_dir[label_dir], f"{name}.jpg")
+        camera, captured_at = parse_frame_name(name)
+        records.append((name, image_path, os.path.join(label_dir, f"{name}.txt"), camera, captured_at, status))
+    before = len(index)
+    index.add_many(records)
+    index.reopen(sorted(set(label_dirs) - edited))
+    return len(index) - before
+
+
+def configured_directories():
+    """Distinct (img_dir, default_label_dir) pairs of the single camera and every configured camera."""
+    from config.config import frame_capture_settings
+
+    pairs = [(frame_capture_settings.img_dir, frame_capture_settings.default_label_dir)]
+    for camera in frame_capture_settings.cameras:
+        pairs.append((camera.img_dir or frame_capture_settings.img_dir,
+                      camera.default_label_dir or frame_capture_settings.default_label_dir))
+    return list(dict.fromkeys(pairs))
+
+
+def sync_configured(index):
+    """Add the frames of every configured label directory to the index. Returns the number of frames added."""
+    from config.config import frame_capture_settings
+
+    return sync_directories(index, configured_directories(), frame_capture_settings.edited_label_dir)
+
+
+def main():
+    from config.config import frame_capture_settings
+
+    parser = argparse.ArgumentParser(description="Show labeling progress, or add frames missing from the labeling index.")
+    parser.add_argument("--db_path", type=str, default=str(frame_capture_settings.label_index_path),
+                        help="Labeling index database.")
+    parser.add_argument("--sync", action="store_true",
+                        help="Add frames found in the label directories that are not in the index yet.")
+    args = parser.parse_args()
+
+    index = LabelIndex(args.db_path)
+    try:
+        if args.sync:
+            start = time.perf_counter()
+            added = sync_configured(index)
+            print(f"Added {added} frames to {args.db_path} in {time.perf_counter() - start:.2f} s")
+        counts = index.progress()
+        total = sum(counts.values())
+        done = counts[EDITED] + counts[SKIPPED]
+        print(f"{total} frames: {counts[PENDING]} pending, {counts[EDITED]} edited, {counts[SKIPPED]} skipped"
+              + (f" ({100 * done / total:.1f}% done)" if total else ""))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,114 @@
 import os
-import sys
+import queue
+import threading
+from collections import namedtuple
+
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
 
 from config.config import frame_capture_settings
+from yolo_labels import write_labels, read_labels
+from label_index import LabelIndex, EDITED, SKIPPED, PENDING, sync_configured
+
+# =========================
+# Manual annotation tool
+# One figure stays open for the whole session: moving to the next frame swaps the pixels of its image in place
+# and replaces the box patches. A background thread reads, decodes and downsizes the next frames (to the
+# on-screen size of the axes) and their labels while the current one is being edited, so the next frame is
+# normally ready when 'n' is pressed and matplotlib has almost no resampling left to do.
+# Boxes are animated artists drawn with blitting over a saved background, so adding or removing a box only
+# redraws the boxes, not the image.
+# The pending frames come from the labeling index (label_index.py), so the tool opens at the next pending frame
+# without listing the label directories, and every saved or skipped frame is recorded there. Frames scored by
+# score_pending_frames.py are shown most informative first, followed by unscored frames in name order.
+# =========================
+
+# a decoded frame ready to be shown: record is its LabelRecord, image is RGBA and fits in the display size, while
+# width and height are the size of the original frame (the coordinate system of the boxes)
+LoadedFrame = namedtuple("LoadedFrame", ["record", "image", "width", "height", "boxes"])
+
 # =========================
 # Helper functions for display
 # =========================
 
 def get_yolo_boxes_from_annotation_file(annotation_file):
-    boxes = []
+    """Return the boxes of a YOLO annotation file as a list of [class_id, x_center, y_center, width, height]."""
     if not os.path.exists(annotation_file):
         print(f"Annotation file not found: {annotation_file}")
-        return boxes  # return empty list if no file
-    with open(annotation_file, 'r') as f:
-        lines = f.readlines()
-    for line in lines:
-        # Each line: "class_id x_center y_center width height"
-        box = line.strip().split(' ')
-        if len(box) != 5:
-            continue  # skip invalid lines
-        box = [float(x) for x in box]
-        box[0] = int(box[0])  # convert class_id to integer
-        boxes.append(box)
-    return boxes
+        return []  # return empty list if no file
+    classes, boxes = read_labels(annotation_file)
+    return [[cls] + box for cls, box in zip(classes.tolist(), boxes.tolist())]
+
+
+def load_frame(record, display_size=(1920, 1080)):
+    """
+    Read the image and boxes of a frame of the labeling index. The image is shrunk to fit in display_size
+    (width, height) and converted to RGBA, the layout matplotlib draws without a conversion.
+    Returns a LoadedFrame, or None if the image cannot be read.
+    """
+    img = cv2.imread(record.image_path)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    # the screen cannot show more pixels than this anyway, and a smaller array makes every redraw cheaper
+    scale = min(display_size[0] / width, display_size[1] / height)
+    if scale < 1:
+        img = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGBA)
+    boxes = get_yolo_boxes_from_annotation_file(record.label_path)
+    return LoadedFrame(record, img, width, height, boxes)
+
+# =========================
+# Background prefetching of the next frames
+# =========================
+
+class FramePrefetcher:
+    def __init__(self, records, depth=8, display_size=(1920, 1080)):
+        """
+        Parameters:
+          records: iterable of the LabelRecords of the frames to load, in display order. It is consumed lazily
+            on the prefetch thread.
+          depth: number of decoded frames kept ready ahead of the one being edited.
+          display_size: (width, height) in pixels the frames are shrunk to fit in. Can be changed while running.
+        """
+        self.records = records
+        self.display_size = display_size
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for record in self.records:
+            if self.stopped.is_set():
+                return
+            frame = load_frame(record, self.display_size)
+            if frame is None:
+                print(f"Could not read {record.image_path}, leaving it pending")
+                continue  # Skip if image cannot be loaded
+            self._put(frame)
+        self._put(None)  # end of the list
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self):
+        """Return the next LoadedFrame, or None when every frame has been shown."""
+        if self.stopped.is_set():
+            return None
+        return self.queue.get()
+
+    def stop(self):
+        self.stopped.set()
+        # the thread notices within one frame load; waiting for it keeps it from decoding during interpreter exit
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
 
 # =========================
 # The interactive BoxEditor class
@@ -32,21 +116,20 @@ def get_yolo_boxes_from_annotation_file(annotation_file):
 # =========================
 
 class BoxEditor:
-    def __init__(self, ax, fig, boxes, annotation_filename, img_width, img_height):
+    def __init__(self, ax, fig):
         """
         Parameters:
           ax: matplotlib axes where the image is shown.
-          fig: the current figure.
-          boxes: a list of boxes in YOLO format [class_id, x_center_norm, y_center_norm, width_norm, height_norm].
-          annotation_path: path to the annotation file (to be updated on save).
-          img_width, img_height: image dimensions in pixels.
+          fig: the figure, reused for every frame.
+        Call set_frame to start editing a frame.
         """
         self.ax = ax
         self.fig = fig
-        self.boxes = boxes  # list of boxes in YOLO format
-        self.annotation_filename = annotation_filename
-        self.img_width = img_width
-        self.img_height = img_height
+        self.boxes = []  # list of boxes in YOLO format
+        self.annotation_filename = None
+        self.default_annotation_filepath = None
+        self.img_width = 1
+        self.img_height = 1
 
         # For adding new boxes (left click)
         self.temp_point = None  # stores the first corner (x, y) when left clicking
@@ -54,15 +137,38 @@ class BoxEditor:
 
         # A list to hold the drawn rectangle patches for each box
         self.patches = []
-        for box in self.boxes:
-            patch = self.draw_box(box)
-            self.patches.append(patch)
-        
-        # Connect the mouse click event
+        # pixels of the axes without the boxes, captured after every full redraw and restored before blitting
+        self.background = None
+
+        # Connect the mouse click event, and recapture the background whenever the canvas is fully redrawn
         self.cid = fig.canvas.mpl_connect('button_press_event', self.on_click)
+        self.draw_cid = fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def set_frame(self, boxes, annotation_filename, img_width, img_height, default_annotation_filepath=None):
+        """
+        Replace the boxes with those of a new frame.
+        Parameters:
+          boxes: a list of boxes in YOLO format [class_id, x_center_norm, y_center_norm, width_norm, height_norm].
+          annotation_filename: name of the annotation file (written to edited_label_dir on save).
+          img_width, img_height: image dimensions in pixels.
+          default_annotation_filepath: the model's annotation file, deleted on save. Defaults to the file of the
+            same name in default_label_dir.
+        """
+        for patch in self.patches:
+            patch.remove()
+        self.clear_temp(redraw=False)
+        self.boxes = boxes
+        self.annotation_filename = annotation_filename
+        self.default_annotation_filepath = default_annotation_filepath or os.path.join(
+            frame_capture_settings.default_label_dir, annotation_filename)
+        self.img_width = img_width
+        self.img_height = img_height
+        self.patches = [self.draw_box(box) for box in self.boxes]
+        # the image changed under the boxes, so the background is stale until the next full redraw
+        self.background = None
 
     def draw_box(self, yolo_box):
-        """Draw a rectangle for a box in YOLO format and return the patch."""
+        """Create the rectangle patch of a box in YOLO format and return it. Call blit to show it."""
         #class_id = yolo_box[0]
         xc = yolo_box[1] * self.img_width
         yc = yolo_box[2] * self.img_height
@@ -71,15 +177,39 @@ class BoxEditor:
         x0 = xc - w/2
         y0 = yc - h/2
         edgecolor = 'green'
-        patch = plt.Rectangle((x0, y0), w, h, edgecolor=edgecolor, facecolor=(0,0,0,0), lw=2)
+        # animated artists are left out of full redraws and only drawn by blit
+        patch = plt.Rectangle((x0, y0), w, h, edgecolor=edgecolor, facecolor=(0,0,0,0), lw=2, animated=True)
         self.ax.add_patch(patch)
-        self.fig.canvas.draw_idle()
         return patch
 
+    def on_draw(self, event):
+        """After a full redraw (new frame, resize, zoom), save the background and draw the boxes on top of it."""
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for patch in self.patches:
+            self.ax.draw_artist(patch)
+        if self.temp_marker is not None:
+            self.ax.draw_artist(self.temp_marker)
+
+    def blit(self):
+        """Redraw only the boxes and the temporary marker over the saved background."""
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw_idle()  # on_draw will draw the boxes
+            return
+        canvas.restore_region(self.background)
+        self.draw_animated()
+        canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+
     def on_click(self, event):
         """Callback for mouse button press events."""
         if event.inaxes != self.ax:
             return  # ignore clicks outside the axes
+        if self.fig.canvas.toolbar is not None and self.fig.canvas.toolbar.mode:
+            return  # ignore clicks while zooming or panning
 
         if event.button == 1:  # Left click: add box
             self.handle_left_click(event)
@@ -90,8 +220,8 @@ class BoxEditor:
         if self.temp_point is None:
             # Save the first corner and mark it
             self.temp_point = (event.xdata, event.ydata)
-            self.temp_marker = self.ax.scatter(event.xdata, event.ydata, color='yellow', marker='o')
-            self.fig.canvas.draw_idle()
+            self.temp_marker = self.ax.scatter(event.xdata, event.ydata, color='yellow', marker='o', animated=True)
+            self.blit()
         else:
             # Second left click: define the opposite corner
             x1, y1 = self.temp_point
@@ -121,13 +251,14 @@ class BoxEditor:
             self.patches.append(patch)
             self.clear_temp()
 
-    def clear_temp(self):
+    def clear_temp(self, redraw=True):
         """Clear the temporary first click marker."""
         if self.temp_marker:
             self.temp_marker.remove()
             self.temp_marker = None
         self.temp_point = None
-        self.fig.canvas.draw_idle()
+        if redraw:
+            self.blit()
 
     def handle_right_click(self, event):
         """Remove a box if the click is inside one."""
@@ -149,120 +280,176 @@ class BoxEditor:
             self.boxes.pop(idx_to_remove)
             patch = self.patches.pop(idx_to_remove)
             patch.remove()
-            self.fig.canvas.draw_idle()
+            self.blit()
 
     def disconnect(self):
-        """Disconnect the mouse click event."""
+        """Disconnect the mouse click and draw events."""
         self.fig.canvas.mpl_disconnect(self.cid)
+        self.fig.canvas.mpl_disconnect(self.draw_cid)
 
     def save_annotations(self):
         """Save the current list of boxes (in YOLO format) to the annotation file."""
-        default_annotation_filepath = os.path.join(frame_capture_settings.default_label_dir, self.annotation_filename)
+        default_annotation_filepath = self.default_annotation_filepath
         edited_annotation_filepath = os.path.join(frame_capture_settings.edited_label_dir, self.annotation_filename)
-        with open(edited_annotation_filepath, 'w') as f:
-            for box in self.boxes:
-                line = ' '.join(str(x) for x in box)
-                f.write(line + '\n')
-            print(f"Annotations saved to: {edited_annotation_filepath}")
-            if os.path.exists(default_annotation_filepath):
-                os.remove(default_annotation_filepath)
-                print(f"{default_annotation_filepath} deleted successfully.")
-            else:
-                print(f"{default_annotation_filepath} not found.")
+        boxes = np.array(self.boxes, dtype=np.float32).reshape(-1, 5)
+        write_labels(edited_annotation_filepath, boxes[:, 0], boxes[:, 1:])
+        print(f"Annotations saved to: {edited_annotation_filepath}")
+        if os.path.exists(default_annotation_filepath):
+            os.remove(default_annotation_filepath)
+            print(f"{default_annotation_filepath} deleted successfully.")
+        else:
+            print(f"{default_annotation_filepath} not found.")
 
 # =========================
-# Key press callback for the editor
+# Annotation session: one figure, frames swapped in place
 # =========================
 
-def on_key_editor(event, editor):
-    """
-    When 'n' or 'enter' is pressed, save the annotation file and close the figure.
-    When 'q' is pressed, save and quit the program.
-    """
-    if event.key in ['n', 'enter', 'return']:
-        editor.save_annotations()
-        editor.disconnect()
-        plt.close()
-    elif event.key == 'q':
-        editor.save_annotations()
-        editor.disconnect()
-        plt.close('all')
-        sys.exit(0)
-    else:
-        # Ignore any other keys
-        pass
+class AnnotationSession:
+    def __init__(self, prefetcher, label_index=None):
+        """
+        Parameters:
+          prefetcher: FramePrefetcher providing the frames in display order.
+          label_index: LabelIndex in which saved and skipped frames are recorded.
+        """
+        self.prefetcher = prefetcher
+        self.label_index = label_index
+        self.fig, self.ax = plt.subplots()
+        self.ax.set_axis_off()  # ticks are of no use for labeling and cost a lot of text layout on every redraw
+        self.image = None  # AxesImage whose pixels are replaced for every frame
+        self.frame = None
+        self.editor = BoxEditor(self.ax, self.fig)
+        self.fig.canvas.mpl_connect('key_press_event', self.on_key)
+        self.fig.canvas.mpl_connect('resize_event', self.on_resize)
+        self.on_resize(None)
+
+    def show_next(self):
+        """Show the next frame in the existing figure. Returns False when there are no frames left."""
+        frame = self.prefetcher.get()
+        if frame is None:
+            return False
+        self.frame = frame
+        # the image keeps the pixel coordinates of the original frame even when the displayed array is smaller
+        extent = (0, frame.width, frame.height, 0)
+        if self.image is None:
+            # the frame already has about the size of the axes on screen, so nearest neighbour is enough
+            self.image = self.ax.imshow(frame.image, extent=extent, interpolation='nearest')
+        else:
+            self.image.set_data(frame.image)
+            self.image.set_extent(extent)
+            # reset any zoom of the previous frame
+            self.ax.set_xlim(0, frame.width)
+            self.ax.set_ylim(frame.height, 0)
+        record = frame.record
+        self.editor.set_frame(frame.boxes, f"{record.name}.txt", frame.width, frame.height, record.label_path)
+        self.ax.set_title(record.name if record.score < 0 else f"{record.name} (score {record.score:.2f})")
+        # one redraw of the image; the boxes are drawn on top of it by BoxEditor.on_draw
+        self.fig.canvas.draw_idle()
+        print(f"Displaying {record.image_path}.")
+        return True
+
+    def on_resize(self, event):
+        """Frames prefetched from now on are shrunk to the new on-screen size of the axes."""
+        bbox = self.ax.get_window_extent()
+        self.prefetcher.display_size = (max(1, int(bbox.width)), max(1, int(bbox.height)))
+
+    def set_status(self, status):
+        if self.label_index is not None:
+            self.label_index.set_status(self.frame.record.name, status)
+
+    def next_or_close(self):
+        if not self.show_next():
+            print("No more images to annotate.")
+            self.close()
+
+    def on_key(self, event):
+        """
+        When 'n' or 'enter' is pressed, save the annotation file and show the next image.
+        When 's' is pressed, mark the image as skipped without saving and show the next image.
+        When 'q' is pressed, save and quit the program.
+        """
+        if event.key in ['n', 'enter', 'return']:
+            self.editor.save_annotations()
+            self.set_status(EDITED)
+            self.next_or_close()
+        elif event.key == 's':
+            print(f"Skipped {self.frame.record.name}")
+            self.set_status(SKIPPED)
+            self.next_or_close()
+        elif event.key == 'q':
+            self.editor.save_annotations()
+            self.set_status(EDITED)
+            self.close()
+        else:
+            # Ignore any other keys
+            pass
+
+    def close(self):
+        self.prefetcher.stop()
+        self.editor.disconnect()
+        plt.close(self.fig)
 
 # =========================
 # Main display function (modified to include editing)
 # =========================
 
-def display_images(folder):
+def display_images(label_index, prefetch=8, order="score"):
     """
-    Loop through annotation .txt files in the default_label_dir folder. For each file, 
-    display the corresponding image and the existing bounding boxes. 
+    Loop through the pending frames of the labeling index, most informative first (order="score") or in
+    name order (order="name"). For each frame,
+    display the image and the existing bounding boxes.
     Then allow the user to add boxes with left-clicks and remove boxes with right-clicks.
     Press 'n' or 'enter' to save changes and move to the next image,
-    or press 'q' to quit the program.
+    's' to skip the image, or 'q' to save and quit the program.
     This will move the annotation files to the edited_label_dir folder and out of the default_label_dir folder.
-
+    The next prefetch images are decoded in the background while the current one is edited.
     """
-    for annotation_filename in sorted(os.listdir(folder)):
-        if not annotation_filename.lower().endswith('.txt'):
-            continue
-        annotation_path = os.path.join(folder, annotation_filename)
-        # Load image (convert from BGR to RGB)
-        img_filename = annotation_filename.replace('.txt', '.jpg')
-        img_path = os.path.join(frame_capture_settings.img_dir, img_filename)
-        img = cv2.imread(img_path)
-        if img is None:
-            continue  # Skip if image cannot be loaded
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        # Construct the annotation file path.
-        print("Loading annotations from:", annotation_path)
-        boxes = get_yolo_boxes_from_annotation_file(annotation_path)
-
-        # Create figure and axis; display the image.
-        fig, ax = plt.subplots()
-        ax.imshow(img)
-        height, width, _ = img.shape
-
-        # (Optional) Draw the original boxes with your existing function:
-        # show_yolo_boxes(boxes, ax, height, width)
-
-        # Create a BoxEditor to enable interactive editing.
-        editor = BoxEditor(ax, fig, boxes, annotation_filename, width, height)
-
-        # Connect the key press event; we pass the editor to the callback via a lambda.
-        fig.canvas.mpl_connect('key_press_event', lambda event: on_key_editor(event, editor))
-        print(f"Displaying {img_path}.")
-        print("  Left-click twice to add a box; right-click inside a box to remove it.")
-        print("  Press 'n' or 'enter' to save and move to the next image, or 'q' to quit.")
-
-
-        mng = plt.get_current_fig_manager()
-        try:
-            # First try with state('zoomed')
-            mng.window.state('zoomed')
-        except Exception:
-            try:
-                # If that fails, try with attributes
-                mng.window.attributes('-zoomed', True)
-            except Exception as e:
-                print("Could not maximize the window:", e)
+    if len(label_index) == 0:
+        # first run with an index: record the frames captured so far, once
+        print("Labeling index is empty, adding the frames found in the label directories...")
+        print(f"Added {sync_configured(label_index)} frames")
+    counts = label_index.progress()
+    print(f"{counts[PENDING]} pending, {counts[EDITED]} edited, {counts[SKIPPED]} skipped")
+    if order == "score":
+        print(f"{label_index.count(PENDING, scored=True)} pending frames scored, shown most informative first")
+
+    prefetcher = FramePrefetcher(label_index.iter_frames(PENDING, order=order), depth=prefetch)
+    # matplotlib's default 'q' closes the figure without saving and 's' opens a save dialog;
+    # the session handles both keys instead
+    for keymap, key in (('keymap.quit', 'q'), ('keymap.save', 's')):
+        if key in plt.rcParams[keymap]:
+            plt.rcParams[keymap].remove(key)
+    session = AnnotationSession(prefetcher, label_index)
+    if not session.show_next():
+        print("No images to annotate.")
+        session.close()
+        return
 
-        # # Maximize window if possible and show the figure (this call blocks until the figure is closed)
-        # mng = plt.get_current_fig_manager()
-        # try:
-        #     mng.window.showMaximized()
-        # except AttributeError:
-        #     print(mng.__dict__)
-        #     pass  # Some backends may not support this
+    print("  Left-click twice to add a box; right-click inside a box to remove it.")
+    print("  Press 'n' or 'enter' to save and move to the next image, 's' to skip it, or 'q' to quit.")
+
+    mng = plt.get_current_fig_manager()
+    try:
+        # First try with state('zoomed')
+        mng.window.state('zoomed')
+    except Exception:
+        try:
+            # If that fails, try with attributes
+            mng.window.attributes('-zoomed', True)
+        except Exception as e:
+            print("Could not maximize the window:", e)
 
-        plt.show()
+    # blocks until the session closes the figure
+    plt.show()
+    prefetcher.stop()
 
 # =========================
 # Run the viewer/editor
 # =========================
 
-display_images(frame_capture_settings.default_label_dir)
+if __name__ == "__main__":
+    label_index = LabelIndex(frame_capture_settings.label_index_path)
+    try:
+        display_images(label_index, prefetch=frame_capture_settings.annotation_prefetch,
+                       order=frame_capture_settings.annotation_order)
+    finally:
+        label_index.close()
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+
+from inference_backend import letterbox
+from yolo_labels import read_labels
+from evaluate_model import read_split, label_path_of
+
+# =========================
+# Packed training datasets
+# Turns every split of an Ultralytics data yaml into a shard that training reads without decoding any JPEG:
+#   images.u8    memory-mapped (N, imgsz, imgsz, 3) uint8 BGR array, every image letterboxed to the training imgsz
+#   labels.npy   (M, 5) float32 rows of class, x_center, y_center, width, height, normalized to the letterboxed image
+#   offsets.npy  (N + 1,) int64; the labels of image i are labels[offsets[i]:offsets[i + 1]]
+#   meta.json    imgsz, the source image paths and original shapes, and the hash of the split's files
+# plus a data.yaml pointing Ultralytics at the shards (see packed_training.py for the dataset and trainer).
+# A split is only repacked when its files (names, sizes and modification times of images and labels) or the
+# imgsz change. Images are decoded and letterboxed on a thread pool straight into the memory map.
+# Example:
+#   python src/pack_dataset.py data_webcam.yaml --imgsz 640
+# =========================
+
+SPLITS = ("train", "val", "test")
+FORMAT_VERSION = 1
+
+
+def split_hash(image_paths):
+    """sha256 over the paths, sizes and modification times of the images of a split and of their label files."""
+    digest = hashlib.sha256()
+    for image_path in image_paths:
+        label_path = label_path_of(image_path)
+        image_stat = os.stat(image_path)
+        label_stat = os.stat(label_path) if os.path.exists(label_path) else None
+        digest.update(f"{image_path}:{image_stat.st_size}:{image_stat.st_mtime_ns}".encode())
+        digest.update(f":{label_stat.st_size}:{label_stat.st_mtime_ns}\n".encode() if label_stat else b":-\n")
+    return digest.hexdigest()
+
+
+def _path_strings(paths):
+    return [str(path) for path in paths] if isinstance(paths, list) else str(paths)
+
+
+def resolve_splits(data_yaml, datasets_dir=None):
+    """
+    Return (yaml contents, {split: image list file or directory, or a list of them}) of an Ultralytics data
+    yaml, with the split paths the trainer will read (read_split concatenates the images of a list). Without
+    datasets_dir they are resolved by Ultralytics' own check_det_dataset, so they follow its datasets_dir
+    setting and the rules of the installed version. With datasets_dir (or "datasets" if ultralytics is not
+    installed), the same rules are applied here: the root is the yaml's "path" (its own directory if unset),
+    looked up in datasets_dir when it is relative and does not exist, and split paths are relative to that root.
+    """
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+    if datasets_dir is None:
+        try:
+            from ultralytics.data.utils import check_det_dataset
+        except ImportError:
+            datasets_dir = "datasets"
+        else:
+            resolved = check_det_dataset(str(data_yaml), autodownload=False)
+            return data, {split: _path_strings(resolved[split]) for split in SPLITS if resolved.get(split)}
+    root = str(data.get("path") or os.path.dirname(os.path.abspath(data_yaml)))
+    if not os.path.exists(root) and not os.path.isabs(root):
+        root = os.path.join(datasets_dir, root)
+
+    def resolve(entry):
+        path = os.path.abspath(os.path.join(root, entry))
+        if not os.path.exists(path) and entry.startswith("../"):
+            path = os.path.abspath(os.path.join(root, entry[3:]))
+        return path
+
+    splits = {}
+    for split in SPLITS:
+        entry = data.get(split)
+        if entry:
+            splits[split] = [resolve(str(e)) for e in entry] if isinstance(entry, list) else resolve(str(entry))
+    return data, splits
+
+
+def _pack_item(args):
+    """Letterbox one image into the memory map and return its labels in letterboxed coordinates."""
+    images, i, image_path, imgsz = args
+    image = cv2.imread(image_path)
+    if image is None:
+        raise IOError(f"Could not read {image_path}")
+    height, width = image.shape[:2]
+    padded, gain, (left, top) = letterbox(image, imgsz)
+    images[i] = padded
+    label_path = label_path_of(image_path)
+    if not os.path.exists(label_path):
+        return np.zeros((0, 5), dtype=np.float32), (height, width)
+    classes, xywhn = read_labels(label_path)
+    rows = np.empty((len(classes), 5), dtype=np.float32)
+    rows[:, 0] = classes
+    rows[:, 1] = (xywhn[:, 0] * width * gain + left) / imgsz
+    rows[:, 2] = (xywhn[:, 1] * height * gain + top) / imgsz
+    rows[:, 3] = xywhn[:, 2] * width * gain / imgsz
+    rows[:, 4] = xywhn[:, 3] * height * gain / imgsz
+    return rows, (height, width)
+
+
+def pack_split(image_paths, out_dir, imgsz=640, workers=8, source_hash=None):
+    """
+    Pack the images of a split and their labels into a shard directory (see the module header).
+    The shard is written to a temporary directory first, so an interrupted run never leaves a partial shard.
+    """
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    images = np.memmap(os.path.join(tmp_dir, "images.u8"), dtype=np.uint8, mode="w+",
+                       shape=(max(len(image_paths), 1), imgsz, imgsz, 3))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_pack_item, ((images, i, path, imgsz) for i, path in enumerate(image_paths))))
+    images.flush()
+    del images
+
+    labels = [rows for rows, _ in results]
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum([len(rows) for rows in labels], out=offsets[1:])
+    np.save(os.path.join(tmp_dir, "labels.npy"),
+            np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32))
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    meta = {
+        "version": FORMAT_VERSION,
+        "imgsz": imgsz,
+        "count": len(image_paths),
+        "im_files": list(image_paths),
+        "shapes": [shape for _, shape in results],
+        "source_hash": source_hash or split_hash(image_paths),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    elapsed = time.perf_counter() - start
+    print(f"Packed {len(image_paths)} images ({int(offsets[-1])} labels) into {out_dir} in {elapsed:.1f} s")
+    return meta
+
+
+class PackedSplit:
+    """Read access to a packed split. The image array is memory-mapped on first use, so the object pickles cheaply."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.imgsz = self.meta["imgsz"]
+        self.im_files = self.meta["im_files"]
+        self.labels = np.load(os.path.join(directory, "labels.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        self._images = None
+
+    def __len__(self):
+        return len(self.im_files)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None  # every data loader worker maps the file itself
+        return state
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.memmap(os.path.join(self.directory, "images.u8"), dtype=np.uint8, mode="r",
+                                     shape=(max(len(self), 1), self.imgsz, self.imgsz, 3))
+        return self._images
+
+    def image(self, i):
+        """A writable copy of image i (augmentations modify images in place)."""
+        return np.array(self.images[i])
+
+    def image_labels(self, i):
+        """(classes (n,) float32, boxes (n, 4) float32 normalized xywh) of image i."""
+        rows = self.labels[self.offsets[i]:self.offsets[i + 1]]
+        return rows[:, 0], rows[:, 1:]
+
+
+def is_packed_split(directory):
+    return os.path.isfile(os.path.join(str(directory), "meta.json"))
+
+
+def packed_dir(data_yaml, out_root):
+    """Directory the packed splits of a data yaml are written to."""
+    return os.path.join(out_root, os.path.splitext(os.path.basename(data_yaml))[0])
+
+
+def ensure_packed(data_yaml, imgsz=640, out_root="datasets/packed", datasets_dir=None, workers=8, force=False):
+    """
+    Pack every split of a data yaml whose files or imgsz changed since it was last packed, and write the
+    data.yaml of the packed splits. Returns the path of that yaml.
+    """
+    data, splits = resolve_splits(data_yaml, datasets_dir)
+    out_dir = packed_dir(data_yaml, out_root)
+    os.makedirs(out_dir, exist_ok=True)
+    packed = {}
+    for split, source in splits.items():
+        image_paths = read_split(source)
+        source_hash = split_hash(image_paths)
+        split_dir = os.path.join(out_dir, split)
+        if not force and is_packed_split(split_dir):
+            meta = PackedSplit(split_dir).meta
+            if meta.get("version") == FORMAT_VERSION and meta["imgsz"] == imgsz and meta["source_hash"] == source_hash:
+                print(f"{split}: {len(image_paths)} images already packed in {split_dir}")
+                packed[split] = os.path.abspath(split_dir)
+                continue
+        print(f"{split}: packing {len(image_paths)} images from {source}")
+        pack_split(image_paths, split_dir, imgsz=imgsz, workers=workers, source_hash=source_hash)
+        packed[split] = os.path.abspath(split_dir)
+
+    packed_yaml = os.path.join(out_dir, "data.yaml")
+    contents = {key: value for key, value in data.items() if key not in SPLITS and key != "path"}
+    contents.update(packed)
+    with open(packed_yaml, "w") as f:
+        yaml.safe_dump(contents, f, sort_keys=False)
+    return packed_yaml
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the splits of an Ultralytics data yaml into memory-mapped shards.")
+    parser.add_argument("data_yaml", type=str, help="Data yaml, e.g. data_webcam.yaml.")
+    parser.add_argument("--imgsz", type=int, default=640, help="Training image size the images are letterboxed to.")
+    parser.add_argument("--out_root", type=str, default="datasets/packed", help="Directory the shards are written to.")
+    parser.add_argument("--datasets_dir", type=str, default=None,
+                        help="Directory relative split paths are resolved against (default: resolved by Ultralytics "
+                             "like training does).")
+    parser.add_argument("--workers", type=int, default=8, help="Image decoding threads.")
+    parser.add_argument("--force", action="store_true", help="Repack every split even if unchanged.")
+    args = parser.parse_args()
+
+    packed_yaml = ensure_packed(args.data_yaml, args.imgsz, args.out_root, args.datasets_dir, args.workers, args.force)
+    print(f"Train on {packed_yaml} with packed_training.PackedDetectionTrainer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from copy import copy
+
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+
+from pack_dataset import PackedSplit, is_packed_split
+
+# =========================
+# Ultralytics training from packed datasets
+# PackedYOLODataset is a YOLODataset whose images and labels come from a split packed by pack_dataset.py:
+# images are copied out of the memory map instead of being read and decoded from JPEG, and labels come from
+# the packed label array instead of being scanned from .txt files. Augmentations are unchanged, except that the
+# images already carry their letterbox padding. PackedDetectionTrainer builds its training and validation data
+# with it whenever a split of the data yaml is a packed split directory, so training only needs
+#   model.train(data=<packed data.yaml>, trainer=PackedDetectionTrainer, ...)
+# Splits that are not packed are loaded by Ultralytics as usual.
+# =========================
+
+
+class PackedYOLODataset(YOLODataset):
+    """YOLODataset reading a packed split directory (img_path) instead of image files."""
+
+    def get_img_files(self, img_path):
+        self.packed = PackedSplit(str(img_path))
+        if self.packed.imgsz != self.imgsz:
+            raise ValueError(f"{img_path} is packed at imgsz {self.packed.imgsz}, training runs at {self.imgsz}. "
+                             f"Repack it with pack_dataset.py --imgsz {self.imgsz}")
+        # rect batching reorders im_files and labels, so images are looked up by file rather than by index
+        self.packed_index = {im_file: i for i, im_file in enumerate(self.packed.im_files)}
+        im_files = list(self.packed.im_files)
+        # fraction is a ratio, or an image count in recent Ultralytics versions
+        count = self.fraction if isinstance(self.fraction, int) else max(1, round(len(im_files) * self.fraction))
+        return im_files[:count]
+
+    def get_labels(self):
+        shape = (self.packed.imgsz, self.packed.imgsz)
+        labels = []
+        for im_file in self.im_files:
+            classes, boxes = self.packed.image_labels(self.packed_index[im_file])
+            labels.append({
+                "im_file": im_file,
+                "shape": shape,  # the letterboxed image is the original as far as training is concerned
+                "cls": classes[:, None].copy(),
+                "bboxes": boxes.copy(),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True, *args, **kwargs):
+        if self.ims[i] is not None:  # cached in RAM (cache=ram)
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        image = self.packed.image(self.packed_index[self.im_files[i]])
+        shape = image.shape[:2]
+        if self.augment:
+            # mosaic picks its extra images from the indices of recently loaded images, like YOLODataset
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return image, shape, shape
+
+
+def build_packed_dataset(cfg, img_path, batch, data, mode="train", rect=False, stride=32):
+    """Same arguments and options as ultralytics.data.build_yolo_dataset, for a packed split."""
+    return PackedYOLODataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=cfg.cache or None,
+        single_cls=cfg.single_cls or False,
+        stride=int(stride),
+        pad=0.0 if mode == "train" else 0.5,
+        fraction=cfg.fraction if mode == "train" else 1.0,
+        prefix=colorstr(f"{mode}: "),
+        task=cfg.task,
+        classes=cfg.classes,
+        data=data,
+    )
+
+
+class PackedDetectionValidator(DetectionValidator):
+    def build_dataset(self, img_path, mode="val", batch=None):
+        if not is_packed_split(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        return build_packed_dataset(self.args, img_path, batch, self.data, mode=mode, stride=self.stride or 32)
+
+
+class PackedDetectionTrainer(DetectionTrainer):
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if not is_packed_split(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        model = getattr(self.model, "module", self.model)  # unwrap DDP
+        stride = max(int(model.stride.max()), 32) if model is not None else 32
+        return build_packed_dataset(self.args, img_path, batch, self.data, mode=mode, rect=mode == "val", stride=stride)
+
+    def get_validator(self):
+        super().get_validator()  # sets the loss names
+        return PackedDetectionValidator(self.test_loader, save_dir=self.save_dir, args=copy(self.args),
+                                        _callbacks=self.callbacks)
@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+
+from box_ops import nms
+from inference_backend import Detections, empty_detections
+
+# =========================
+# Region-of-interest and tiled inference
+# A RegionPlan describes which parts of a camera's frames the model looks at. Each ROI polygon is cropped to
+# its bounding rectangle, so the model input is spent on the zones where people appear instead of on sky
+# and walls. With tiling enabled every region is further cut into overlapping tile_size x tile_size windows
+# that are run at (close to) native resolution, so small, distant people are not lost in the downscale.
+# All crops of a frame are submitted to the micro-batcher together, their boxes are shifted back to
+# full-frame coordinates, boxes whose centre lies outside every polygon are dropped and the rest are merged
+# with NMS so objects seen by several overlapping crops are only kept once.
+# =========================
+
+
+def tile_starts(length, tile_size, overlap):
+    """Start offsets of overlapping windows of tile_size covering [0, length). The last window ends at length."""
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+class RegionPlan:
+    def __init__(self, roi_polygons=None, tile_size=0, tile_overlap=0.2):
+        """
+        Parameters:
+            roi_polygons (list | None): polygons as lists of (x, y) points normalized to [0, 1] by the frame
+                width and height. Empty or None to run on the whole frame.
+            tile_size (int): side in pixels of the square tiles each region is cut into. 0 disables tiling.
+            tile_overlap (float): fraction of a tile shared with its neighbour, so objects on a tile border
+                are fully inside at least one tile.
+        """
+        self.roi_polygons = [np.asarray(polygon, dtype=np.float32).reshape(-1, 2) for polygon in roi_polygons or []]
+        self.tile_size = int(tile_size or 0)
+        self.tile_overlap = min(max(float(tile_overlap), 0.0), 0.9)
+        # windows and ROI mask only depend on the frame size, so they are computed once per size
+        self._windows = {}
+        self._masks = {}
+
+    @property
+    def active(self):
+        """False when the plan is a single full-frame pass and frames can be submitted as they are."""
+        return bool(self.roi_polygons) or self.tile_size > 0
+
+    def _pixel_polygons(self, height, width):
+        return [np.round(polygon * (width, height)).astype(np.int32) for polygon in self.roi_polygons]
+
+    def windows(self, height, width):
+        """(x1, y1, x2, y2) pixel crop windows for a frame of the given size."""
+        key = (height, width)
+        if key not in self._windows:
+            if self.roi_polygons:
+                regions = []
+                for polygon in self._pixel_polygons(height, width):
+                    x1, y1 = np.clip(polygon.min(axis=0), 0, (width, height))
+                    x2, y2 = np.clip(polygon.max(axis=0), 0, (width, height))
+                    if x2 > x1 and y2 > y1:
+                        regions.append((int(x1), int(y1), int(x2), int(y2)))
+            else:
+                regions = [(0, 0, width, height)]
+            windows = []
+            for x1, y1, x2, y2 in regions:
+                if not self.tile_size:
+                    windows.append((x1, y1, x2, y2))
+                    continue
+                for ty in tile_starts(y2 - y1, self.tile_size, self.tile_overlap):
+                    for tx in tile_starts(x2 - x1, self.tile_size, self.tile_overlap):
+                        windows.append((x1 + tx, y1 + ty,
+                                        min(x1 + tx + self.tile_size, x2), min(y1 + ty + self.tile_size, y2)))
+            self._windows[key] = windows
+        return self._windows[key]
+
+    def roi_mask(self, height, width):
+        """uint8 mask of the frame that is 1 inside any ROI polygon, or None without polygons."""
+        if not self.roi_polygons:
+            return None
+        key = (height, width)
+        if key not in self._masks:
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, self._pixel_polygons(height, width), 1)
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def crops(self, frame):
+        """Views of frame for every window, with the (x, y) offset of each."""
+        height, width = frame.shape[:2]
+        return [(frame[y1:y2, x1:x2], (x1, y1)) for x1, y1, x2, y2 in self.windows(height, width)]
+
+    def merge(self, results, offsets, frame_shape, iou=0.7):
+        """Map the Detections of every crop back to frame coordinates, drop boxes outside the ROI and run NMS."""
+        height, width = frame_shape[:2]
+        results = [(r, offset) for r, offset in zip(results, offsets) if r is not None and len(r.conf)]
+        if not results:
+            return empty_detections()
+        xyxy = np.concatenate([r.xyxy + np.array(offset * 2, dtype=np.float32) for r, offset in results])
+        conf = np.concatenate([r.conf for r, _ in results])
+        cls = np.concatenate([r.cls for r, _ in results])
+
+        mask = self.roi_mask(height, width)
+        if mask is not None:
+            cx = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(np.int64), 0, width - 1)
+            cy = np.clip(((xyxy[:, 1] + xyxy[:, 3]) / 2).astype(np.int64), 0, height - 1)
+            inside = mask[cy, cx] > 0
+            xyxy, conf, cls = xyxy[inside], conf[inside], cls[inside]
+        if len(results) > 1:
+            keep = nms(xyxy, conf, iou_threshold=iou, classes=cls)
+            xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+        return Detections(xyxy, conf, cls)
+
+    def submit(self, batcher, frame, callback, iou=0.7):
+        """
+        Queue frame on a MicroBatcher. Without ROIs or tiling the frame is submitted as is; otherwise every crop
+        is submitted and callback(frame, detections) is called once the merged result of all crops is ready.
+        """
+        if not self.active:
+            batcher.submit(frame, callback)
+            return
+        crops = self.crops(frame)
+        if not crops:
+            callback(frame, empty_detections())
+            return
+        offsets = [offset for _, offset in crops]
+        results = [None] * len(crops)
+        pending = [len(crops)]
+        failed = [False]
+
+        # the batcher calls back from its single worker thread, so the counters need no lock
+        def on_crop(index):
+            def crop_callback(crop, result):
+                results[index] = result
+                failed[0] |= result is None
+                pending[0] -= 1
+                if pending[0] == 0:
+                    callback(frame, None if failed[0] else self.merge(results, offsets, frame.shape, iou=iou))
+            return crop_callback
+
+        # crops of a frame are queued back to back, so they are run in as few forward passes as the batch size allows
+        for index, (crop, _) in enumerate(crops):
+            batcher.submit(crop, on_crop(index))
+
+    def draw(self, frame, color=(255, 0, 0), thickness=2):
+        """Outline the ROI polygons on frame (in place)."""
+        if self.roi_polygons:
+            height, width = frame.shape[:2]
+            cv2.polylines(frame, self._pixel_polygons(height, width), True, color, thickness)
+        return frame
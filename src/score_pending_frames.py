@@ -0,0 +1,172 @@
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from box_ops import box_iou
+from tracker import greedy_match
+from inference_backend import load_detector, set_torch_threads, BACKENDS
+from label_index import LabelIndex, PENDING
+
+# =========================
+# Informativeness scoring of pending frames
+# Runs one or two models over the pending frames of the labeling index in batches and gives every frame a
+# score of how much labeling it would teach the model, so the annotation tool can show the most informative
+# frames first. The score adds up three signals:
+#   uncertainty: 1 - the highest confidence of any box (no box at all counts as fully certain)
+#   near threshold: a soft count of boxes whose confidence is within margin of the confidence threshold
+#   disagreement: 1 - F1 between the boxes of the two models above the threshold, matched at IoU 0.5
+# Models run with a confidence floor below the threshold so the boxes just under it are seen. Images are
+# decoded on a thread pool while the previous batch runs through the model.
+# Example:
+#   python score_pending_frames.py --second_model_path models/yolo11l.pt
+# =========================
+
+DEFAULT_WEIGHTS = {"uncertainty": 1.0, "near_threshold": 0.5, "disagreement": 1.0}
+
+
+def near_threshold(conf, conf_threshold, margin):
+    """Soft count of the boxes near the threshold: 1 at the threshold, falling linearly to 0 at +-margin."""
+    return float(np.clip(1 - np.abs(conf - conf_threshold) / margin, 0, None).sum())
+
+
+def disagreement(detections_a, detections_b, conf_threshold, iou_threshold=0.5):
+    """1 - F1 of the boxes of two models above the threshold, matched one to one by IoU. 0 if both found nothing."""
+    boxes_a = detections_a.xyxy[detections_a.conf >= conf_threshold]
+    boxes_b = detections_b.xyxy[detections_b.conf >= conf_threshold]
+    if len(boxes_a) + len(boxes_b) == 0:
+        return 0.0
+    matched, _ = greedy_match(box_iou(boxes_a, boxes_b), iou_threshold)
+    return 1 - 2 * len(matched) / (len(boxes_a) + len(boxes_b))
+
+
+def informativeness(detections, second_detections=None, conf_threshold=0.4, margin=0.15, weights=None):
+    """Return (score, components) of a frame from the Detections of one or two models."""
+    weights = weights or DEFAULT_WEIGHTS
+    components = {
+        "uncertainty": 1 - float(detections.conf.max()) if len(detections.conf) else 0.0,
+        # log so that a crowded frame does not outweigh every other signal
+        "near_threshold": float(np.log1p(near_threshold(detections.conf, conf_threshold, margin))),
+        "disagreement": disagreement(detections, second_detections, conf_threshold) if second_detections is not None else 0.0,
+    }
+    score = sum(weights[name] * value for name, value in components.items())
+    return score, components
+
+
+def read_batches(records, batch_size, workers):
+    """Yield (records, frames) batches, decoding the images on a thread pool one batch ahead of the model."""
+    def read(record):
+        return cv2.imread(record.image_path)
+
+    def submit(batch):
+        return batch, [pool.submit(read, record) for record in batch]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+        if not batches:
+            return
+        pending = submit(batches[0])
+        for next_batch in batches[1:] + [None]:
+            batch, futures = pending
+            # the next batch is decoding while this one is waited on and runs through the model
+            pending = submit(next_batch) if next_batch is not None else None
+            yield batch, [future.result() for future in futures]
+
+
+def score_pending_frames(label_index, detector, second_detector=None, class_id=None, conf_threshold=0.4,
+                         conf_floor=0.05, margin=0.15, batch_size=8, workers=4, rescore=False, weights=None):
+    """
+    Score the pending frames of a LabelIndex and store the scores in it.
+
+    Parameters:
+        label_index (LabelIndex): index whose pending frames are scored.
+        detector: model whose uncertainty is measured (anything with predict(frames, classes, conf)).
+        second_detector: optional second model; without it the disagreement term is 0.
+        class_id (int | None): only boxes of this class are considered.
+        conf_threshold (float): confidence threshold the boxes are labeled at.
+        conf_floor (float): confidence the models run at, below conf_threshold so near misses are seen.
+        margin (float): boxes within this distance of conf_threshold count as near the threshold.
+        batch_size (int): frames per forward pass.
+        workers (int): image decoding threads.
+        rescore (bool): also score frames that already have a score.
+        weights (dict | None): weight of each score component (see DEFAULT_WEIGHTS).
+    Returns the number of frames scored.
+    """
+    classes = [class_id] if class_id is not None else None
+    records = [record for record in label_index.iter_frames(PENDING) if rescore or record.score < 0]
+    print(f"Scoring {len(records)} pending frames")
+    scored = 0
+    start = time.perf_counter()
+    for batch, frames in read_batches(records, batch_size, workers):
+        readable = [i for i, frame in enumerate(frames) if frame is not None]
+        for i in set(range(len(batch))) - set(readable):
+            print(f"Could not read {batch[i].image_path}")
+        if not readable:
+            continue
+        images = [frames[i] for i in readable]
+        results = detector.predict(images, classes=classes, conf=conf_floor)
+        second_results = (second_detector.predict(images, classes=classes, conf=conf_floor)
+                          if second_detector is not None else [None] * len(images))
+        scores = []
+        for i, detections, second_detections in zip(readable, results, second_results):
+            score, components = informativeness(detections, second_detections, conf_threshold, margin, weights)
+            scores.append((batch[i].name, score, json.dumps(components)))
+        label_index.set_scores(scores)
+        scored += len(scores)
+        elapsed = time.perf_counter() - start
+        print(f"Scored {scored}/{len(records)} frames ({scored / elapsed:.1f} frames/s)")
+    return scored
+
+
+def main():
+    from config.config import frame_capture_settings
+
+    parser = argparse.ArgumentParser(description="Score pending frames by how informative labeling them would be.")
+    parser.add_argument("--model_path", type=str, default=str(frame_capture_settings.model_path),
+                        help="Model whose uncertainty is scored (default: the capture model).")
+    parser.add_argument("--second_model_path", type=str, default="",
+                        help="Optional second model; frames where the two disagree score higher.")
+    parser.add_argument("--backend", type=str, default=frame_capture_settings.inference_backend, choices=BACKENDS)
+    parser.add_argument("--imgsz", type=int, default=frame_capture_settings.inference_imgsz)
+    parser.add_argument("--threads", type=int, default=frame_capture_settings.inference_threads)
+    parser.add_argument("--batch_size", type=int, default=8, help="Frames per forward pass.")
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding threads.")
+    parser.add_argument("--conf_threshold", type=float, default=frame_capture_settings.conf_threshold)
+    parser.add_argument("--conf_floor", type=float, default=0.05, help="Confidence the models run at.")
+    parser.add_argument("--margin", type=float, default=0.15, help="Width of the band around the threshold.")
+    parser.add_argument("--rescore", action="store_true", help="Also rescore frames that already have a score.")
+    parser.add_argument("--db_path", type=str, default=str(frame_capture_settings.label_index_path),
+                        help="Labeling index database.")
+    args = parser.parse_args()
+
+    if args.backend == "torch":
+        set_torch_threads(args.threads)
+    detector = load_detector(args.model_path, backend=args.backend, imgsz=args.imgsz, threads=args.threads)
+    second_detector = None
+    if args.second_model_path:
+        second_detector = load_detector(args.second_model_path, backend=args.backend, imgsz=args.imgsz,
+                                        threads=args.threads)
+    class_id = next((k for k, v in detector.names.items() if v == frame_capture_settings.target_label), None)
+    if class_id is None:
+        print(f"Target label '{frame_capture_settings.target_label}' not found in model classes, scoring every class")
+    elif second_detector is not None and second_detector.names.get(class_id) != frame_capture_settings.target_label:
+        parser.error(f"The second model does not have '{frame_capture_settings.target_label}' as class {class_id}")
+
+    label_index = LabelIndex(args.db_path)
+    try:
+        score_pending_frames(label_index, detector, second_detector, class_id=class_id,
+                             conf_threshold=args.conf_threshold, conf_floor=args.conf_floor, margin=args.margin,
+                             batch_size=args.batch_size, workers=args.workers, rescore=args.rescore)
+        print(f"{label_index.count(PENDING, scored=True)} pending frames scored, "
+              f"{label_index.count(PENDING, scored=False)} unscored")
+        for record in label_index.next_frames_by_score(PENDING, limit=5):
+            print(f"  {record.score:.3f} {record.name}")
+    finally:
+        label_index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+from detection_cache import weights_hash
+from evaluate_model import read_split
+from pack_dataset import resolve_splits, split_hash
+
+# =========================
+# Content-addressed cache of finetuning stages
+# Every training stage is keyed by a hash of its inputs:
+#   the sha256 of the weights it starts from,
+#   the manifest hash of its dataset (class names plus the paths, sizes and modification times of every image
+#   and label file of every split, see pack_dataset.split_hash),
+#   the settings that change its result (imgsz, epochs, batch size, augmentations, ...).
+# The best.pt of a finished stage is copied to <cache_dir>/<key>/best.pt with a stage.json describing its inputs
+# and the run it came from. A stage whose key is already cached is skipped and its best.pt reused, so changing
+# only the webcam data reruns only the webcam stage. As the next stage's key includes the hash of these weights,
+# a retrained earlier stage always invalidates the stages after it.
+# Example (list the cached stages):
+#   python src/stage_cache.py
+# =========================
+
+KEY_VERSION = 1  # bump to invalidate every cached stage when the key inputs change meaning
+
+
+def dataset_hash(data_yaml, datasets_dir=None):
+    """Manifest hash of a data yaml: its class names and the files of each of its splits."""
+    data, splits = resolve_splits(data_yaml, datasets_dir)
+    digest = hashlib.sha256(json.dumps(data.get("names"), sort_keys=True).encode())
+    for split, source in sorted(splits.items()):
+        digest.update(f"{split}:{split_hash(read_split(source))}\n".encode())
+    return digest.hexdigest()
+
+
+def stage_key(stage, weights_path, data_yaml, settings, datasets_dir=None):
+    """
+    Return (key, inputs) of a stage: the sha256 of its inputs, and the inputs themselves.
+
+    Parameters:
+        stage (str): name of the stage, e.g. "external" or "webcam".
+        weights_path (str | Path): weights the stage starts from.
+        data_yaml (str | Path): data yaml the stage trains on.
+        settings (dict): JSON-serializable settings that change the trained weights.
+        datasets_dir (str): directory relative split paths are resolved against, None to resolve them like
+            training does (see pack_dataset.resolve_splits).
+    """
+    inputs = {
+        "version": KEY_VERSION,
+        "stage": stage,
+        "weights": weights_hash(str(weights_path)),
+        "data": dataset_hash(str(data_yaml), datasets_dir),
+        "settings": settings,
+    }
+    key = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+    return key, inputs
+
+
+class StageCache:
+    def __init__(self, cache_dir):
+        """
+        Parameters:
+            cache_dir (str | Path): directory of the cached stages. Created if missing.
+        """
+        self.cache_dir = str(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Path of the cached best.pt of a stage key, None if the stage has not been cached."""
+        weights_path = os.path.join(self._entry_dir(key), "best.pt")
+        return weights_path if os.path.isfile(weights_path) else None
+
+    def put(self, key, weights_path, inputs, run_dir=None):
+        """
+        Copy the best.pt of a finished stage into the cache and return the cached path. The entry is written to a
+        temporary directory first, so an interrupted copy is never mistaken for a cached stage.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        shutil.copy2(weights_path, os.path.join(tmp_dir, "best.pt"))
+        with open(os.path.join(tmp_dir, "stage.json"), "w") as f:
+            json.dump({"key": key, "inputs": inputs, "run_dir": str(run_dir) if run_dir else None,
+                       "created_at": time.time()}, f, indent=2, default=str)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        return os.path.join(entry_dir, "best.pt")
+
+    def entries(self):
+        """stage.json contents of every cached stage, oldest first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            info_path = os.path.join(self.cache_dir, name, "stage.json")
+            if not name.endswith(".tmp") and os.path.isfile(info_path):
+                with open(info_path) as f:
+                    entries.append(json.load(f))
+        return sorted(entries, key=lambda entry: entry["created_at"])
+
+
+def main():
+    from config.config import finetune_settings
+
+    parser = argparse.ArgumentParser(description="List the finetuning stages in the stage cache.")
+    parser.add_argument("--cache_dir", type=str, default=str(finetune_settings.stage_cache_dir),
+                        help="Directory of the cached stages.")
+    args = parser.parse_args()
+
+    entries = StageCache(args.cache_dir).entries()
+    print(f"{len(entries)} cached stages in {args.cache_dir}")
+    for entry in entries:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created_at"]))
+        print(f"  {entry['key'][:12]} {entry['inputs']['stage']:<8} {created} {entry['inputs']['settings']} "
+              f"from {entry['run_dir']}")
+
+
+if __name__ == "__main__":
+    main()
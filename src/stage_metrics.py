@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# =========================
+# Per-stage latency metrics
+# StageMetrics keeps the most recent durations of every named stage (a rolling window, summarized as
+# p50/p95/p99) and monotonically increasing counters. Recording a sample is two perf_counter calls and a
+# deque append, so it can wrap every stage of the capture loop. MetricsReporter periodically writes a
+# snapshot to a JSON file and/or serves it as plain text on a local HTTP port.
+# =========================
+
+
+class StageMetrics:
+    def __init__(self, window=1000):
+        """
+        Parameters:
+            window (int): number of most recent samples per stage used for the percentiles.
+        """
+        self.window = window
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._samples = {}   # stage -> deque of durations in seconds
+        self._totals = {}    # stage -> [samples recorded, total seconds]
+        self._counters = {}  # counter -> value
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager recording the duration of the with block under stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def snapshot(self):
+        """Return the current percentiles (in milliseconds), counters and counter rates as a dict."""
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items()}
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+            counters = dict(self._counters)
+        elapsed = time.monotonic() - self.started_at
+        stages = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000 if values.size else (0.0, 0.0, 0.0)
+            stages[stage] = {
+                "count": totals[stage][0],
+                "total_s": totals[stage][1],
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(values.max() * 1000) if values.size else 0.0,
+            }
+        return {
+            "uptime_s": elapsed,
+            "stages": stages,
+            "counters": counters,
+            "rates_per_s": {name: value / elapsed for name, value in counters.items()} if elapsed > 0 else {},
+        }
+
+    def format_text(self):
+        """Render a snapshot as one "name value" line per metric."""
+        snapshot = self.snapshot()
+        lines = [f"uptime_s {snapshot['uptime_s']:.3f}"]
+        for stage, values in sorted(snapshot["stages"].items()):
+            for key, value in values.items():
+                lines.append(f"stage_{key}{{stage=\"{stage}\"}} {value:.3f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"counter{{name=\"{name}\"}} {value}")
+            lines.append(f"rate_per_s{{name=\"{name}\"}} {snapshot['rates_per_s'].get(name, 0.0):.3f}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsReporter:
+    def __init__(self, metrics, json_path=None, interval=10.0, port=0):
+        """
+        Parameters:
+            metrics (StageMetrics): metrics to report.
+            json_path (str | Path | None): file the snapshot is written to every interval seconds.
+            interval (float): seconds between JSON snapshots.
+            port (int): if non-zero, serve the metrics as text on http://127.0.0.1:<port>/metrics.
+        """
+        self.metrics = metrics
+        self.json_path = json_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        if port:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def _make_handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.format_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep request logs out of the capture output
+
+        return Handler
+
+    def write_json(self):
+        if self.json_path is None:
+            return
+        # write to a temporary file and rename so readers never see a partial snapshot
+        tmp_path = f"{self.json_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.json_path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_json()
+            except OSError as e:
+                print(f"Could not write metrics to {self.json_path}: {e}")
+
+    def start(self):
+        if self.json_path is not None:
+            self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.write_json()
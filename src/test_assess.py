@@ -3,7 +3,9 @@ import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import cv2
-from ultralytics import YOLO
+
+from yolo_labels import read_labels
+from detection_cache import DetectionCache, CachedDetector, file_hash
 
 #from config.config import frame_capture_settings
 # =========================
@@ -11,20 +13,12 @@ from ultralytics import YOLO
 # =========================
 
 def get_yolo_boxes_from_annotation_file(annotation_file):
-    boxes = []
+    """Return the boxes of a YOLO annotation file as a list of [class_id, x_center, y_center, width, height]."""
     if not os.path.exists(annotation_file):
         print(f"Annotation file not found: {annotation_file}")
-        return boxes  # return empty list if no file
-    with open(annotation_file, 'r') as f:
-        lines = f.readlines()
-    for line in lines:
-        # Each line: "class_id x_center y_center width height"
-        box = line.strip().split(' ')
-        if len(box) != 5:
-            continue  # skip invalid lines
-        box = [float(x) for x in box]
-        boxes.append(box)
-    return boxes
+        return []  # return empty list if no file
+    classes, boxes = read_labels(annotation_file)
+    return [[float(cls)] + box for cls, box in zip(classes.tolist(), boxes.tolist())]
 
 # =========================
 # The interactive BoxEditor class
@@ -58,15 +52,9 @@ class BoxEditor:
         for box in self.boxes:
             patch = self.draw_box(box)
             self.patches.append(patch)
-        for result in self.results:
-            if result.boxes is not None:
-                boxes = result.boxes.data.cpu().numpy()
-                for box in boxes:
-                    x1, y1, x2, y2, conf, cls = box
-                    # In COCO, the 'person' class typically has an id of 0.
-                    box = [cls, x1, y1, x2, y2]
-                    patch = plt.Rectangle((x1, y1), x2-x1, y2-y1, edgecolor='red', facecolor=(0,0,0,0), lw=1)
-                    self.ax.add_patch(patch)    
+        for x1, y1, x2, y2 in self.results.xyxy:
+            patch = plt.Rectangle((x1, y1), x2-x1, y2-y1, edgecolor='red', facecolor=(0,0,0,0), lw=1)
+            self.ax.add_patch(patch)
 
         self.cid = fig.canvas.mpl_connect('button_press_event', self.on_click)
         
@@ -139,8 +127,9 @@ def display_images(folder, model):
         img = cv2.imread(img_path)
         if img is None:
             continue  # Skip if image cannot be loaded
+        # the model expects BGR frames. Images are cached by content, so re-running skips the model
+        results = model.predict([img], keys=[file_hash(img_path)])[0]
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = model(img)
 
         # Construct the annotation file path.
         print("Loading annotations from:", annotation_path)
@@ -191,5 +180,9 @@ def display_images(folder, model):
 folder_path = 'datasets/dataset_webcam/labels/train'
 
 model_path = 'finetune/yolo11l_webcam_finetune/weights/best.pt'
-model = YOLO(model_path).to('cuda')
-display_images(folder_path, model)
+cache = DetectionCache('detection_cache.sqlite')
+model = CachedDetector(cache, model_path)
+try:
+    display_images(folder_path, model)
+finally:
+    cache.close()
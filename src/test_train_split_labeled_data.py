@@ -1,102 +1,205 @@
 import os
-import random
-import shutil
+import json
+import hashlib
 
 from config.config import train_val_test_settings, frame_capture_settings
+from label_index import configured_directories
+
+# =========================
+# Deterministic train/val/test split
+# Every labeled frame is assigned to a split by a stable hash of its file name, so a frame always lands in
+# the same split no matter when it was captured or how many frames exist, and val/test never overlap.
+# Nothing is moved: the split is written as Ultralytics image-list manifests (train.txt, val.txt, test.txt)
+# in manifest_dir, which the dataset yaml points at. The manually labeled frames of every configured image
+# directory (the single camera's and each camera's own) are exposed to Ultralytics through images/labeled*
+# and labels/labeled* links in manifest_dir, so it finds each label next to its image. Images and labels are
+# matched ignoring case; a pair whose names differ in case gets its own file links under images/case_matched
+# and labels/case_matched, named after the image.
+# Frames already listed in a manifest are skipped, so later runs only hash and append the new frames.
+# =========================
 
 valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
-    
-def move_files(src_img_dir, src_labels_dir, dest_img_dir, dest_labels_dir, images, sample_size):
+SPLITS = ("train", "val", "test")
+
+
+def split_of(name, ratio_val, ratio_test, salt=""):
+    """Split of a frame from a sha1 hash of its (case-insensitive) base name, uniform in [0, 1)."""
+    digest = hashlib.sha1(f"{salt}{os.path.splitext(name)[0].lower()}".encode()).digest()
+    position = int.from_bytes(digest[:8], "big") / 2 ** 64
+    if position < ratio_test:
+        return "test"
+    if position < ratio_test + ratio_val:
+        return "val"
+    return "train"
+
+
+def label_stems(labels_dir):
+    """Lower-case base name -> file name of every label file in labels_dir."""
+    return {os.path.splitext(entry.name)[0].lower(): entry.name
+            for entry in os.scandir(labels_dir) if entry.name.lower().endswith(".txt")}
+
+
+def labeled_images(images_dir, labels):
     """
-    Randomly selects a number of images from src_img_dir and moves them, along with their
-    associated label files from src_label_dir, to dest_img_dir and dest_label_dir.
-    """    
-
-    # Randomly sample images
-    sampled_files = random.sample(images, sample_size)
-    print(f"Moving {len(sampled_files)} files from {src_img_dir} to {dest_img_dir}")
-    
-    for file in sampled_files:
-        # Build full paths for image and label files
-        src_image = os.path.join(src_img_dir, file)
-        dst_image = os.path.join(dest_img_dir, file)
-        
-        # Move the image file
-        shutil.move(src_image, dst_image)
-        
-        # For the label, we assume it's a .txt file with the same base name.
-        base_name, _ = os.path.splitext(file)
-        label_filename = base_name + ".txt"
-        src_label = os.path.join(src_labels_dir, label_filename)
-        dst_label = os.path.join(dest_labels_dir, label_filename)
-        
-        if os.path.exists(src_label):
-            shutil.move(src_label, dst_label)
-        else:
-            print(f"Label file not found for image {file} at {src_label}")
-
-
-def main():    
-    src_imgs_dir = frame_capture_settings.img_dir
-    src_labels_dir = frame_capture_settings.edited_label_dir
-
-        # Get a list of image files in the source directory
-    labels = [
-        os.path.splitext(f)[0].lower() for f in os.listdir(src_labels_dir)
-        if os.path.splitext(f)[1].lower() == ".txt"
-    ]
-
-    images = [
-        f for f in os.listdir(src_imgs_dir)
-        if os.path.splitext(f)[1].lower() in valid_extensions
-    ]
-
-    # Find images without labels
-    images = [f for f in images if os.path.splitext(f)[0].lower() in labels]
-    
-    if not images:
-        print("No images with manually edited labels found in", src_imgs_dir)
+    Return (image file name, label file name) of every image in images_dir with a label in labels (see
+    label_stems) of the same base name, ignoring case. The directory is listed once and matched through a dict.
+    """
+    pairs = []
+    for entry in os.scandir(images_dir):
+        stem, ext = os.path.splitext(entry.name)
+        if ext.lower() in valid_extensions and stem.lower() in labels:
+            pairs.append((entry.name, labels[stem.lower()]))
+    return pairs
+
+
+def manifest_entry(manifest_dir, image_path):
+    """Path of an image as written in a manifest: relative ("./...") inside manifest_dir, absolute otherwise."""
+    relative = os.path.relpath(image_path, manifest_dir)
+    if relative.startswith(".."):
+        return os.path.abspath(image_path)
+    return "./" + relative.replace(os.sep, "/")
+
+
+def read_manifest(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_manifest(path, entries, append=False):
+    if append:
+        with open(path, "a") as f:
+            f.writelines(f"{entry}\n" for entry in entries)
+        return
+    # write the whole manifest to a temp file first, so an interrupted run never leaves a truncated split
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{entry}\n" for entry in entries)
+    os.replace(tmp_path, path)
+
+
+def link_directory(link_path, target):
+    """Create link_path as a symlink to target unless it already exists."""
+    if os.path.lexists(link_path):
+        return
+    os.makedirs(os.path.dirname(link_path), exist_ok=True)
+    os.symlink(os.path.abspath(target), link_path, target_is_directory=True)
+    print(f"Linked {link_path} -> {target}")
+
+
+def link_file(link_path, target):
+    """Create (or repoint) link_path as a symlink to the file target."""
+    os.makedirs(os.path.dirname(link_path), exist_ok=True)
+    if os.path.lexists(link_path):
+        if os.path.realpath(link_path) == os.path.realpath(target):
+            return
+        os.remove(link_path)
+    os.symlink(os.path.abspath(target), link_path)
+
+
+def pool_name(img_dir):
+    """Name of the links of an image directory in manifest_dir: labeled for the single camera's, else per path."""
+    if os.path.abspath(img_dir) == os.path.abspath(frame_capture_settings.img_dir):
+        return "labeled"
+    return f"labeled_{hashlib.sha1(os.path.abspath(img_dir).encode()).hexdigest()[:8]}"
+
+
+def main():
+    manifest_dir = train_val_test_settings.manifest_dir
+    ratio_val = train_val_test_settings.sample_ratio_val
+    ratio_test = train_val_test_settings.sample_ratio_test
+    salt = train_val_test_settings.split_salt
+    os.makedirs(manifest_dir, exist_ok=True)
+
+    # Ultralytics finds the label of images/<dir>/x.jpg at labels/<dir>/x.txt, so the manually labeled frames
+    # of every configured image directory are linked into manifest_dir rather than moved
+    sources = []
+    img_dirs = {os.path.abspath(img_dir): img_dir for img_dir, _ in configured_directories()}
+    for img_dir in img_dirs.values():
+        pool_images_dir = os.path.join(manifest_dir, "images", pool_name(img_dir))
+        pool_labels_dir = os.path.join(manifest_dir, "labels", pool_name(img_dir))
+        link_directory(pool_images_dir, img_dir)
+        link_directory(pool_labels_dir, frame_capture_settings.edited_label_dir)
+        sources.append((pool_images_dir, pool_labels_dir))
+
+    # Frames moved into the split directories by earlier versions of this script are included as they are
+    for split in SPLITS:
+        images_dir = getattr(train_val_test_settings, f"{split}_images_dir")
+        labels_dir = getattr(train_val_test_settings, f"{split}_labels_dir")
+        if os.path.isdir(images_dir) and os.path.isdir(labels_dir):
+            sources.append((images_dir, labels_dir))
+
+    # lower-case base name -> manifest entry of every labeled frame; the first source wins if a name appears twice
+    frames = {}
+    labels = {}   # labels directory -> its label_stems
+    matched = {}  # labels directory -> lower-case base names matched to an image in any source
+    for images_dir, labels_dir in sources:
+        real_labels_dir = os.path.realpath(labels_dir)
+        if real_labels_dir not in labels:
+            labels[real_labels_dir] = label_stems(labels_dir)
+            matched[real_labels_dir] = set()
+        for image, label in labeled_images(images_dir, labels[real_labels_dir]):
+            stem = os.path.splitext(image)[0]
+            matched[real_labels_dir].add(stem.lower())
+            if stem.lower() in frames:
+                continue
+            image_path = os.path.join(images_dir, image)
+            if os.path.splitext(label)[0] != stem:
+                # Ultralytics looks the label up by the image's exact name, so the pair gets links that agree
+                case_images_dir = os.path.join(manifest_dir, "images", "case_matched")
+                image_path = os.path.join(case_images_dir, image)
+                link_file(image_path, os.path.join(images_dir, image))
+                link_file(os.path.join(manifest_dir, "labels", "case_matched", f"{stem}.txt"),
+                          os.path.join(labels_dir, label))
+            frames[stem.lower()] = manifest_entry(manifest_dir, image_path)
+    for real_labels_dir, stems in labels.items():
+        for stem in sorted(set(stems) - matched[real_labels_dir]):
+            print(f"Image not found for {os.path.join(real_labels_dir, stems[stem])}")
+    if not frames:
+        print("No images with manually edited labels found in", ", ".join(str(d) for d in img_dirs.values()))
         exit()
 
+    manifest_paths = {split: os.path.join(manifest_dir, f"{split}.txt") for split in SPLITS}
+    params_path = os.path.join(manifest_dir, "split_params.json")
+    params = {"sample_ratio_val": ratio_val, "sample_ratio_test": ratio_test, "split_salt": salt}
+    previous_params = None
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            previous_params = json.load(f)
+
+    listed = {split: read_manifest(path) for split, path in manifest_paths.items()}
+    listed_entries = set().union(*listed.values())
+    current_entries = set(frames.values())
+    new_entries = [entry for entry in frames.values() if entry not in listed_entries]
+    removed = listed_entries - current_entries
+
+    assignments = {split: [] for split in SPLITS}
+    if previous_params == params and not removed:
+        # incremental run: only the new frames are hashed and appended
+        for entry in new_entries:
+            assignments[split_of(os.path.basename(entry), ratio_val, ratio_test, salt)].append(entry)
+        for split, entries in assignments.items():
+            if entries:
+                write_manifest(manifest_paths[split], entries, append=True)
+        totals = {split: len(listed[split]) + len(assignments[split]) for split in SPLITS}
+    else:
+        # split settings changed or frames were removed: rebuild every manifest
+        if previous_params is not None and previous_params != params:
+            print(f"Split settings changed from {previous_params} to {params}, re-splitting every frame")
+        for entry in sorted(current_entries):
+            assignments[split_of(os.path.basename(entry), ratio_val, ratio_test, salt)].append(entry)
+        for split, entries in assignments.items():
+            write_manifest(manifest_paths[split], entries)
+        with open(params_path, "w") as f:
+            json.dump(params, f, indent=2)
+        totals = {split: len(assignments[split]) for split in SPLITS}
+
+    print(f"{len(new_entries)} new frames, {len(removed)} frames no longer labeled")
+    for split in SPLITS:
+        print(f"{split}: {totals[split]} frames ({manifest_paths[split]})")
 
-    dest_train_img_dir = train_val_test_settings.train_images_dir
-    dest_train_label_dir = train_val_test_settings.train_labels_dir
-    dest_val_img_dir = train_val_test_settings.val_images_dir
-    dest_val_label_dir = train_val_test_settings.val_labels_dir
-    dest_test_img_dir = train_val_test_settings.test_images_dir
-    dest_test_label_dir = train_val_test_settings.test_labels_dir
-
-       
-    # Ensure destination directories exist
-    os.makedirs(train_val_test_settings.val_images_dir, exist_ok=True)
-    os.makedirs(train_val_test_settings.val_labels_dir, exist_ok=True)
-    os.makedirs(train_val_test_settings.test_images_dir, exist_ok=True)
-    os.makedirs(train_val_test_settings.test_labels_dir, exist_ok=True)
-    os.makedirs(train_val_test_settings.train_images_dir, exist_ok=True)
-    os.makedirs(train_val_test_settings.train_labels_dir, exist_ok=True)
-
-    
-    val_sample_size = int(len(images) * train_val_test_settings.sample_ratio_val)
-    test_sample_size = int(len(images) * train_val_test_settings.sample_ratio_test)
-    train_sample_size = len(images) - val_sample_size - test_sample_size
-    
-
-    move_files(src_imgs_dir, src_labels_dir, dest_val_img_dir, dest_val_label_dir, images, sample_size=val_sample_size)
-    move_files(src_imgs_dir, src_labels_dir, dest_test_img_dir, dest_test_label_dir, images, sample_size=test_sample_size)
-    move_files(src_imgs_dir, src_labels_dir, dest_train_img_dir, dest_train_label_dir, images, sample_size=train_sample_size)
-
-    remaining_images = len(os.listdir(src_imgs_dir))
-    remaining_labels = len(os.listdir(src_labels_dir))
-    print(f"Remaining image count: {remaining_images}")
-    print(f"Remaining label count: {remaining_labels}")
-    for f in os.listdir(src_imgs_dir):
-        filename, ext = os.path.splitext(f)
-        if filename+'.txt' not in os.listdir(src_labels_dir):
-            print(f"Label not found for {f}")
-    for f in os.listdir(src_labels_dir):
-        filename, ext = os.path.splitext(f)
-        if filename+'.jpg' not in os.listdir(src_imgs_dir):
-            print(f"Image not found for {f}") 
 
 if __name__ == "__main__":
-    print("Splitting labeled data into train, validation, and test sets...")
\ No newline at end of file
+    print("Splitting labeled data into train, validation, and test sets...")
+    main()
@@ -0,0 +1,291 @@
+from collections import namedtuple
+
+import numpy as np
+
+from box_ops import box_iou
+
+# =========================
+# Multi-object tracking for counting
+# Every track is a constant-velocity Kalman filter over (centre x, centre y, width, height). All tracks are
+# stored in stacked arrays, so predicting and correcting them is a handful of batched matrix operations no
+# matter how many people are in view. Detections are associated with the predicted track boxes through an
+# IoU cost matrix first, and whatever is left through a centre distance matrix normalized by the box height,
+# which keeps identities when the detector only runs every few frames and people move further than a box
+# width between runs. Between detector runs the tracker only predicts, which costs microseconds per frame.
+# Besides the number of people currently in view the tracker counts unique identities and crossings of
+# counting lines.
+# =========================
+
+# ids: (N,) int64 track ids, xyxy: (N, 4) float32 pixel boxes, cls: (N,) int32, conf: (N,) float32 last detection confidence
+Tracks = namedtuple("Tracks", ["ids", "xyxy", "cls", "conf"])
+
+_STATE = 8  # cx, cy, w, h and their velocities per frame
+_F = np.eye(_STATE, dtype=np.float64)
+_F[:4, 4:] = np.eye(4)
+# process and measurement noise scale with the box height, like in SORT/DeepSORT
+_STD_POSITION = 1.0 / 20
+_STD_VELOCITY = 1.0 / 160
+
+
+def xyxy_to_cxcywh(xyxy):
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    return np.stack([(xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2,
+                     xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]], axis=1)
+
+
+def cxcywh_to_xyxy(cxcywh):
+    wh = np.clip(cxcywh[:, 2:4], 1.0, None) / 2
+    return np.concatenate([cxcywh[:, :2] - wh, cxcywh[:, :2] + wh], axis=1).astype(np.float32)
+
+
+def greedy_match(score, threshold, higher_is_better=True):
+    """
+    Match rows to columns of a score matrix, best pairs first, keeping only pairs within threshold.
+    Returns (matched rows, matched columns) as int arrays.
+    """
+    valid = score >= threshold if higher_is_better else score <= threshold
+    rows, cols = np.nonzero(valid)
+    if rows.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    values = score[rows, cols]
+    order = np.argsort(-values if higher_is_better else values, kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order], cols[order]):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+def cross_2d(a, b):
+    """z component of the cross product of 2D vectors, broadcast over leading dimensions."""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+class CountingLine:
+    def __init__(self, start, end, name="line"):
+        """
+        Parameters:
+            start, end ((x, y)): end points of the line in pixels.
+            name (str): label used when reporting the counts.
+        Looking from start towards end on screen (y pointing down), tracks crossing from the left of the line to
+        its right are counted as "in", the other way as "out".
+        """
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.name = name
+        self.crossed_in = 0
+        self.crossed_out = 0
+
+    def update(self, previous, current):
+        """Count the tracks whose anchor point moved from previous (N, 2) to current (N, 2) across the line."""
+        if len(previous) == 0:
+            return
+        direction = self.end - self.start
+        side_before = np.sign(cross_2d(direction, previous - self.start))
+        side_after = np.sign(cross_2d(direction, current - self.start))
+        # the movement must also pass between the end points of the line, not beside it
+        motion = current - previous
+        side_start = np.sign(cross_2d(motion, self.start - previous))
+        side_end = np.sign(cross_2d(motion, self.end - previous))
+        crossed = (side_before * side_after < 0) & (side_start * side_end < 0)
+        self.crossed_in += int(np.count_nonzero(crossed & (side_before < 0)))
+        self.crossed_out += int(np.count_nonzero(crossed & (side_before > 0)))
+
+
+class Tracker:
+    def __init__(self, iou_threshold=0.3, max_center_distance=1.0, max_missed=5, min_hits=2, count_max_missed=1,
+                 lines=None):
+        """
+        Parameters:
+            iou_threshold (float): minimum IoU between a predicted track box and a detection to associate them.
+            max_center_distance (float): second association pass for tracks and detections left over by the IoU
+                pass, as the maximum centre distance in units of the track's box height. 0 disables it.
+            max_missed (int): number of consecutive detector runs a track may go unmatched before it is removed.
+            min_hits (int): number of matched detections before a track is confirmed and counted.
+            count_max_missed (int): confirmed tracks missed by at most this many detector runs are in view.
+            lines (list[CountingLine] | None): lines whose crossings by confirmed tracks are counted.
+        """
+        self.iou_threshold = float(iou_threshold)
+        self.max_center_distance = float(max_center_distance)
+        self.max_missed = int(max_missed)
+        self.min_hits = max(1, int(min_hits))
+        self.count_max_missed = int(count_max_missed)
+        self.lines = list(lines or [])
+
+        self._mean = np.zeros((0, _STATE))
+        self._cov = np.zeros((0, _STATE, _STATE))
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._cls = np.zeros(0, dtype=np.int32)
+        self._conf = np.zeros(0, dtype=np.float32)
+        self._hits = np.zeros(0, dtype=np.int64)
+        self._missed = np.zeros(0, dtype=np.int64)
+        self._anchor = np.zeros((0, 2))  # bottom centre of each track after the previous step
+        self._next_id = 1
+        self.unique_count = 0  # number of tracks ever confirmed
+        self.frames_tracked = 0
+        self.detector_updates = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    # ----- Kalman filter, batched over all tracks -----
+
+    def _noise(self, heights, position_scale, velocity_scale):
+        """(N, 8, 8) diagonal covariance with standard deviations proportional to the box heights."""
+        heights = np.maximum(heights, 1.0)
+        std = np.empty((len(heights), _STATE))
+        std[:, :4] = (position_scale * _STD_POSITION) * heights[:, None]
+        std[:, 4:] = (velocity_scale * _STD_VELOCITY) * heights[:, None]
+        cov = np.zeros((len(heights), _STATE, _STATE))
+        idx = np.arange(_STATE)
+        cov[:, idx, idx] = std ** 2
+        return cov
+
+    def _predict(self):
+        if len(self._ids) == 0:
+            return
+        self._mean = self._mean @ _F.T
+        self._cov = _F @ self._cov @ _F.T + self._noise(self._mean[:, 3], 1.0, 1.0)
+
+    def _correct(self, track_idx, measurements):
+        mean, cov = self._mean[track_idx], self._cov[track_idx]
+        measurement_noise = self._noise(mean[:, 3], 1.0, 0.0)[:, :4, :4]
+        innovation_cov = cov[:, :4, :4] + measurement_noise
+        # K = P H^T S^-1; with H = [I 0], P H^T is P[:, :, :4] and solve(S, H P) gives K^T because S is symmetric
+        gain = np.linalg.solve(innovation_cov, cov[:, :4, :]).transpose(0, 2, 1)
+        self._mean[track_idx] = mean + np.einsum("nij,nj->ni", gain, measurements - mean[:, :4])
+        self._cov[track_idx] = cov - gain @ cov[:, :4, :]
+
+    # ----- association -----
+
+    def _associate(self, detections):
+        """Return (matched track indices, matched detection indices, unmatched detection indices)."""
+        num_tracks, num_detections = len(self._ids), len(detections.conf)
+        if num_tracks == 0 or num_detections == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64), np.arange(num_detections)
+
+        predicted = cxcywh_to_xyxy(self._mean[:, :4])
+        same_class = self._cls[:, None] == detections.cls[None, :]
+        iou = np.where(same_class, box_iou(predicted, detections.xyxy), 0.0)
+        track_idx, detection_idx = greedy_match(iou, self.iou_threshold)
+
+        if self.max_center_distance > 0:
+            free_tracks = np.setdiff1d(np.arange(num_tracks), track_idx)
+            free_detections = np.setdiff1d(np.arange(num_detections), detection_idx)
+            if free_tracks.size and free_detections.size:
+                centers = xyxy_to_cxcywh(detections.xyxy[free_detections])[:, :2]
+                track_centers = self._mean[free_tracks, :2]
+                heights = np.maximum(self._mean[free_tracks, 3], 1.0)
+                distance = np.linalg.norm(track_centers[:, None, :] - centers[None, :, :], axis=2) / heights[:, None]
+                distance = np.where(same_class[np.ix_(free_tracks, free_detections)], distance, np.inf)
+                rows, cols = greedy_match(distance, self.max_center_distance, higher_is_better=False)
+                track_idx = np.concatenate([track_idx, free_tracks[rows]])
+                detection_idx = np.concatenate([detection_idx, free_detections[cols]])
+
+        unmatched = np.setdiff1d(np.arange(num_detections), detection_idx)
+        return track_idx, detection_idx, unmatched
+
+    # ----- public API -----
+
+    def step(self, detections=None):
+        """
+        Advance the tracker by one frame. Pass the frame's Detections when the detector ran on it, or None to
+        only predict where the tracks moved. Returns the Tracks in view.
+        """
+        self._predict()
+        if detections is not None:
+            self._update(detections)
+        self.frames_tracked += 1
+        self._update_lines()
+        return self.tracks()
+
+    def _update(self, detections):
+        self.detector_updates += 1
+        track_idx, detection_idx, unmatched = self._associate(detections)
+
+        if track_idx.size:
+            self._correct(track_idx, xyxy_to_cxcywh(detections.xyxy[detection_idx]))
+            self._conf[track_idx] = detections.conf[detection_idx]
+        matched = np.zeros(len(self._ids), dtype=bool)
+        matched[track_idx] = True
+        self._hits[matched] += 1
+        self._missed[matched] = 0
+        self._missed[~matched] += 1
+        newly_confirmed = matched & (self._hits == self.min_hits)
+        self.unique_count += int(np.count_nonzero(newly_confirmed))
+
+        # drop tracks that went unmatched for too long
+        alive = self._missed <= self.max_missed
+        if not alive.all():
+            self._keep(alive)
+
+        if unmatched.size:
+            self._add(detections, unmatched)
+
+    def _keep(self, mask):
+        self._mean, self._cov = self._mean[mask], self._cov[mask]
+        self._ids, self._cls, self._conf = self._ids[mask], self._cls[mask], self._conf[mask]
+        self._hits, self._missed, self._anchor = self._hits[mask], self._missed[mask], self._anchor[mask]
+
+    def _add(self, detections, idx):
+        measurements = xyxy_to_cxcywh(detections.xyxy[idx])
+        mean = np.zeros((len(idx), _STATE))
+        mean[:, :4] = measurements
+        cov = self._noise(measurements[:, 3], 2.0, 10.0)
+        ids = np.arange(self._next_id, self._next_id + len(idx), dtype=np.int64)
+        self._next_id += len(idx)
+        hits = np.ones(len(idx), dtype=np.int64)
+        self.unique_count += int(np.count_nonzero(hits >= self.min_hits))
+
+        self._mean = np.concatenate([self._mean, mean])
+        self._cov = np.concatenate([self._cov, cov])
+        self._ids = np.concatenate([self._ids, ids])
+        self._cls = np.concatenate([self._cls, detections.cls[idx].astype(np.int32)])
+        self._conf = np.concatenate([self._conf, detections.conf[idx].astype(np.float32)])
+        self._hits = np.concatenate([self._hits, hits])
+        self._missed = np.concatenate([self._missed, np.zeros(len(idx), dtype=np.int64)])
+        self._anchor = np.concatenate([self._anchor, self._anchors(mean)])
+
+    @staticmethod
+    def _anchors(mean):
+        """Bottom centre of the boxes, the point of a person that crosses a line on the ground."""
+        return np.stack([mean[:, 0], mean[:, 1] + mean[:, 3] / 2], axis=1)
+
+    def _update_lines(self):
+        anchors = self._anchors(self._mean)
+        if self.lines:
+            confirmed = self._hits >= self.min_hits
+            for line in self.lines:
+                line.update(self._anchor[confirmed], anchors[confirmed])
+        self._anchor = anchors
+
+    def _in_view(self):
+        return (self._hits >= self.min_hits) & (self._missed <= self.count_max_missed)
+
+    def tracks(self):
+        """Confirmed tracks currently in view."""
+        mask = self._in_view()
+        return Tracks(self._ids[mask], cxcywh_to_xyxy(self._mean[mask, :4]), self._cls[mask], self._conf[mask])
+
+    @property
+    def count(self):
+        """Number of confirmed people currently in view."""
+        return int(np.count_nonzero(self._in_view()))
+
+    def line_counts(self):
+        return {line.name: {"in": line.crossed_in, "out": line.crossed_out} for line in self.lines}
+
+    def stats(self):
+        return {
+            "frames_tracked": self.frames_tracked,
+            "detector_updates": self.detector_updates,
+            "active_tracks": len(self._ids),
+            "in_view": self.count,
+            "unique_count": self.unique_count,
+            "lines": self.line_counts(),
+        }
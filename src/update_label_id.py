@@ -1,71 +1,268 @@
 import os
-from pprint import pprint
+import time
+import argparse
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-def update_txt_files(target_int, directory_path):
+import numpy as np
+
+from yolo_labels import read_label_dir, write_label_text
+
+# =========================
+# Bulk class-ID remapper for YOLO label trees
+# Applies a class mapping to every .txt label file under a directory: mapped classes are kept (and renamed if
+# the new id differs), classes listed in --drop are removed, and unmapped classes are dropped or kept as they
+# are. Files are sharded across a process pool, every shard is decoded in one vectorized pass, and only files
+# whose labels actually change are rewritten, each through a temporary file that atomically replaces it.
+# Rewritten files only get new class tokens: coordinates and any extra column are kept as they were written.
+# Files with lines other than 5-value boxes are remapped line by line so 6-value lines keep their extra
+# column; a file with any other line (segmentation polygons, malformed values, a class that is not a
+# non-negative integer) is reported and left untouched.
+# With --dry_run nothing is written and the report shows what would change.
+# Example: keep only COCO persons as class 0 in the external dataset
+#   python update_label_id.py datasets/dataset_external/labels --mapping 0:0
+# =========================
+
+
+def parse_mapping(text):
+    """Parse "old:new,old:new" into a dict of ints."""
+    mapping = {}
+    for pair in text.split(","):
+        if pair.strip():
+            old, new = pair.split(":")
+            mapping[int(old)] = int(new)
+    return mapping
+
+
+def remap_classes(classes, mapping, drop=(), keep_unmapped=False):
+    """Return the new class of every label, -1 for labels that are dropped."""
+    if len(classes) == 0:
+        return classes.copy()
+    size = max(int(classes.max()), max(mapping, default=0), max(drop, default=0)) + 1
+    # lookup table indexed by the old class id
+    table = np.arange(size, dtype=np.int32) if keep_unmapped else np.full(size, -1, dtype=np.int32)
+    for old, new in mapping.items():
+        table[old] = new
+    for old in drop:
+        table[old] = -1
+    return table[classes]
+
+
+def remap_lines(text, mapping, drop=(), keep_unmapped=False):
+    """
+    Remap a label file line by line, keeping everything after the class of every line as it is (e.g. a sixth
+    confidence column). Returns (new text, old classes, new classes with -1 for dropped lines).
+    Raises ValueError if a non-blank line is not a 5- or 6-value box, such as a segmentation polygon or a
+    malformed line, so such a file is never rewritten.
+    """
+    classes, rests = [], []
+    for number, line in enumerate(text.splitlines(), start=1):
+        tokens = line.split()
+        if not tokens:
+            continue
+        if len(tokens) not in (5, 6):
+            raise ValueError(f"line {number} has {len(tokens)} values, not a 5- or 6-value box")
+        try:
+            values = [float(token) for token in tokens]
+        except ValueError:
+            raise ValueError(f"line {number} is not numeric: {line.strip()!r}") from None
+        if values[0] != int(values[0]) or values[0] < 0:
+            raise ValueError(f"line {number} has an invalid class {tokens[0]!r}")
+        classes.append(int(values[0]))
+        rests.append(" ".join(tokens[1:]))
+    old = np.array(classes, dtype=np.int32)
+    new = remap_classes(old, mapping, drop, keep_unmapped)
+    new_text = "".join(f"{cls} {rest}\n" for cls, rest in zip(new.tolist(), rests) if cls >= 0)
+    return new_text, old, new
+
+
+def _class_counts(classes):
+    values, counts = np.unique(classes, return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def _add_counts(target, counts):
+    for cls, count in counts.items():
+        target[cls] = target.get(cls, 0) + count
+
+
+def _merge_stats(all_stats):
+    merged = {"files": 0, "files_changed": 0, "boxes": 0, "boxes_dropped": 0, "boxes_renamed": 0, "bytes": 0,
+              "changed": [], "errors": [], "classes_before": {}, "classes_after": {}}
+    for stats in all_stats:
+        for key in ("files", "files_changed", "boxes", "boxes_dropped", "boxes_renamed", "bytes"):
+            merged[key] += stats[key]
+        merged["changed"].extend(stats["changed"])
+        merged["errors"].extend(stats["errors"])
+        _add_counts(merged["classes_before"], stats["classes_before"])
+        _add_counts(merged["classes_after"], stats["classes_after"])
+    return merged
+
+
+def remap_irregular_file(path, mapping, drop, keep_unmapped, dry_run, stats):
+    """
+    Remap a file that has lines other than 5-value boxes through remap_lines, adding to stats. A file with a
+    line that is not a 5- or 6-value box is left untouched and reported as an error.
     """
-    Recursively process all .txt files in the given directory and its subdirectories.
-    
-    For each file, only keep lines where the first space-delimited piece equals `target_int`.
-    In those lines, the first token is replaced with 0.
-    
+    try:
+        with open(path) as f:
+            new_text, old, new = remap_lines(f.read(), mapping, drop, keep_unmapped)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        stats["errors"].append(f"{path}: left unchanged, {e}")
+        return
+    kept = new >= 0
+    stats["boxes"] += len(old)
+    stats["boxes_dropped"] += int(np.count_nonzero(~kept))
+    stats["boxes_renamed"] += int(np.count_nonzero(kept & (new != old)))
+    _add_counts(stats["classes_before"], _class_counts(old))
+    _add_counts(stats["classes_after"], _class_counts(new[kept]))
+    if np.array_equal(old, new):
+        return
+    if not dry_run:
+        try:
+            write_label_text(path, new_text, atomic=True)
+        except OSError as e:
+            stats["errors"].append(f"{path}: {e}")
+            return
+    stats["changed"].append(os.path.basename(path))
+
+
+def remap_shard(task):
+    """Remap the label files of one shard (a directory and a list of file names). Runs in a worker process."""
+    directory, names, mapping, drop, keep_unmapped, dry_run = task
+    stats = {"files": len(names), "files_changed": 0, "boxes": 0, "boxes_dropped": 0, "boxes_renamed": 0,
+             "bytes": 0, "changed": [], "errors": [], "classes_before": {}, "classes_after": {}}
+    try:
+        labels = read_label_dir(directory, names)
+    except OSError as e:
+        stats["errors"].append(f"{directory}: {e}")
+        return stats
+    except ValueError as e:
+        if len(names) == 1:
+            stats["errors"].append(f"{os.path.join(directory, names[0])}: left unchanged, not a valid label file ({e})")
+            return stats
+        # a malformed value somewhere in the shard: remap its files one at a time so only the bad files are skipped
+        return _merge_stats(remap_shard((directory, [name], mapping, drop, keep_unmapped, dry_run)) for name in names)
+    stats["bytes"] = sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+
+    # files with lines the vectorized codec skips (polygons, extra columns, ...) would lose them if rewritten
+    # from the decoded boxes, so they go through remap_irregular_file and are left out of the vectorized pass
+    counts = np.diff(labels.offsets)
+    irregular = labels.skipped_lines > 0
+    regular_rows = np.repeat(~irregular, counts)
+    new_classes = remap_classes(labels.classes, mapping, drop, keep_unmapped)
+    kept = new_classes >= 0
+    renamed = kept & (new_classes != labels.classes)
+    stats["boxes"] = int(np.count_nonzero(regular_rows))
+    stats["boxes_dropped"] = int(np.count_nonzero(~kept & regular_rows))
+    stats["boxes_renamed"] = int(np.count_nonzero(renamed & regular_rows))
+    stats["classes_before"] = _class_counts(labels.classes[regular_rows])
+    stats["classes_after"] = _class_counts(new_classes[kept & regular_rows])
+
+    # number of dropped or renamed labels in every file, without a Python loop over labels
+    file_of_label = np.repeat(np.arange(len(names)), counts)
+    changes_per_file = np.bincount(file_of_label, weights=~kept | renamed, minlength=len(names))
+    for index in np.flatnonzero((changes_per_file > 0) & ~irregular):
+        path = os.path.join(directory, names[index])
+        if not dry_run:
+            # rewritten from the text rather than the decoded float32 boxes, so coordinates keep their precision
+            try:
+                with open(path) as f:
+                    new_text, _, _ = remap_lines(f.read(), mapping, drop, keep_unmapped)
+                write_label_text(path, new_text, atomic=True)
+            except (OSError, UnicodeDecodeError, ValueError) as e:
+                stats["errors"].append(f"{path}: left unchanged, {e}")
+                continue
+        stats["changed"].append(names[index])
+    for index in np.flatnonzero(irregular):
+        remap_irregular_file(os.path.join(directory, names[index]), mapping, drop, keep_unmapped, dry_run, stats)
+    stats["files_changed"] = len(stats["changed"])
+    return stats
+
+
+def shard_tree(root, chunk_size):
+    """Yield (directory, file names) shards of at most chunk_size label files for every directory under root."""
+    for directory, _, files in os.walk(root):
+        names = sorted(f for f in files if f.lower().endswith(".txt"))
+        for start in range(0, len(names), chunk_size):
+            yield directory, names[start:start + chunk_size]
+
+
+def update_txt_files(directory_path, mapping, drop=(), keep_unmapped=False, dry_run=False, workers=None,
+                     chunk_size=2000, verbose=False):
+    """
+    Remap the classes of every .txt label file under directory_path and print a report.
+
     Parameters:
-        target_int (int): The integer to match against the first token in each line.
-        directory_path (str): The root directory to start processing .txt files.
+        directory_path (str): root directory of the label tree.
+        mapping (dict): old class id -> new class id for the classes to keep.
+        drop (iterable): class ids to remove.
+        keep_unmapped (bool): keep classes that are neither mapped nor dropped unchanged instead of removing them.
+        dry_run (bool): only report what would change.
+        workers (int | None): number of worker processes (default: number of CPUs).
+        chunk_size (int): number of files per shard.
+        verbose (bool): list every changed file.
+    Returns the totals as a dict.
     """
-    log_dict = dict()
-    files_changed_dict = defaultdict(list)
-    for root, _, files in os.walk(directory_path):
-        log_dict[root] = 0
-        for file in files:
-            if file.lower().endswith('.txt'):
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r') as f:
-                        lines = f.readlines()
-                except Exception as e:
-                    print(f"Could not read {file_path}: {e}")
-                    continue
-
-                new_lines = []
-                for line in lines:
-                    # Remove leading/trailing whitespace
-                    stripped_line = line.strip()
-                    # Skip blank lines
-                    if not stripped_line:
-                        continue
-
-                    parts = stripped_line.split()
-                    
-                    # Check if the first token is an integer and equals target_int
-                    try:
-                        if int(parts[0]) == target_int:
-                            # Replace the first token with "0"
-                            parts[0] = "0"
-                            # Reconstruct the line and add a newline character
-                            new_lines.append(" ".join(parts) + "\n")
-                    except ValueError:
-                        # If the first token isn't an integer, skip the line.
-                        continue
-                
-                # Write the updated content back to the file.
-                try:
-                    with open(file_path, 'w') as f:
-                        f.writelines(new_lines)
-                        if new_lines != lines:
-                            log_dict[root] += 1
-                            files_changed_dict[root].append(file)
-
-                except Exception as e:
-                    print(f"Could not write to {file_path}: {e}")
-    print_flag = input("Do you want to see how many files were changed in each directory? (y/n): ")
-    if print_flag.lower() == 'y':
-        pprint(log_dict)
-    print_flag = input("Do you want to see the list of files changed in each directory? (y/n): ")
-    if print_flag.lower() == 'y':
-        pprint(files_changed_dict)
+    start = time.perf_counter()
+    tasks = [(directory, names, mapping, tuple(drop), keep_unmapped, dry_run)
+             for directory, names in shard_tree(directory_path, chunk_size)]
+    totals = defaultdict(int)
+    classes_before, classes_after = defaultdict(int), defaultdict(int)
+    changed_per_directory = defaultdict(int)
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, stats in zip(tasks, pool.map(remap_shard, tasks)):
+            directory = task[0]
+            for key in ("files", "files_changed", "boxes", "boxes_dropped", "boxes_renamed", "bytes"):
+                totals[key] += stats[key]
+            for cls, count in stats["classes_before"].items():
+                classes_before[cls] += count
+            for cls, count in stats["classes_after"].items():
+                classes_after[cls] += count
+            changed_per_directory[directory] += stats["files_changed"]
+            errors.extend(stats["errors"])
+            if verbose:
+                for name in stats["changed"]:
+                    print(f"{'Would change' if dry_run else 'Changed'} {os.path.join(directory, name)}")
+    elapsed = time.perf_counter() - start
+
+    print("Dry run, no files were written." if dry_run else "Remapping done.")
+    print("Files changed per directory:")
+    for directory, count in sorted(changed_per_directory.items()):
+        print(f"  {directory}: {count}")
+    print("Labels per class before -> after:")
+    for cls in sorted(set(classes_before) | set(classes_after)):
+        print(f"  {cls}: {classes_before.get(cls, 0)} -> {classes_after.get(cls, 0)}")
+    print(f"{totals['files']} files, {totals['files_changed']} {'would change' if dry_run else 'changed'}; "
+          f"{totals['boxes']} labels, {totals['boxes_dropped']} dropped, {totals['boxes_renamed']} renamed")
+    print(f"Throughput: {totals['files'] / elapsed:.0f} files/s, {totals['boxes'] / elapsed:.0f} labels/s, "
+          f"{totals['bytes'] / 1e6 / elapsed:.1f} MB/s ({elapsed:.2f} s)")
+    for error in errors:
+        print(f"Error: {error}")
+    totals["errors"] = len(errors)
+    totals["seconds"] = elapsed
+    return dict(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remap, rename or drop class ids in every YOLO label file under a directory.")
+    parser.add_argument("directory_path", type=str, help="Root directory of the label tree.")
+    parser.add_argument("--mapping", type=str, required=True,
+                        help="Classes to keep as old:new pairs, e.g. 0:0 or 0:0,2:1.")
+    parser.add_argument("--drop", type=str, default="", help="Comma-separated class ids to remove.")
+    parser.add_argument("--keep_unmapped", action="store_true",
+                        help="Keep classes that are neither mapped nor dropped (by default they are removed).")
+    parser.add_argument("--dry_run", action="store_true", help="Report what would change without writing.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--chunk_size", type=int, default=2000, help="Label files per shard.")
+    parser.add_argument("--verbose", action="store_true", help="List every changed file.")
+    args = parser.parse_args()
+
+    drop = [int(c) for c in args.drop.split(",") if c.strip()]
+    update_txt_files(args.directory_path, parse_mapping(args.mapping), drop=drop, keep_unmapped=args.keep_unmapped,
+                     dry_run=args.dry_run, workers=args.workers, chunk_size=args.chunk_size, verbose=args.verbose)
+
 
 if __name__ == "__main__":
-    target_int = int(input("Enter the target integer: "))
-    directory_path = input("Enter the directory path: ")
-    update_txt_files(target_int, directory_path)
\ No newline at end of file
+    main()
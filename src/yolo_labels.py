@@ -0,0 +1,182 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# =========================
+# YOLO label codec
+# Shared reading and writing of YOLO .txt annotation files. Each line of a label file is
+# "class_id x_center_norm y_center_norm width_norm height_norm". Boxes are handled as NumPy arrays:
+# classes as an int32 array of shape (N,) and boxes as a float32 array of shape (N, 4) in normalized xywh.
+# =========================
+
+LINE_FORMAT = "%d %.6f %.6f %.6f %.6f\n"
+
+# names: label file names (without directory) in the order they were read
+# classes, boxes: all labels of the directory concatenated, (N,) int32 and (N, 4) float32 normalized xywh
+# offsets: (len(names) + 1,) int64; the labels of names[i] are classes[offsets[i]:offsets[i + 1]]
+# skipped_lines: (len(names),) int64 number of non-blank lines of every file that are not 5-value boxes with a
+#   non-negative integer class
+LabelSet = namedtuple("LabelSet", ["names", "classes", "boxes", "offsets", "skipped_lines"])
+
+
+def empty_labels():
+    return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32)
+
+
+def xyxy_to_xywhn(xyxy, width, height):
+    """Convert pixel (x1, y1, x2, y2) boxes of shape (N, 4) into normalized (x_center, y_center, w, h)."""
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    xywhn = np.empty_like(xyxy)
+    xywhn[:, 0] = (xyxy[:, 0] + xyxy[:, 2]) / 2.0 / width
+    xywhn[:, 1] = (xyxy[:, 1] + xyxy[:, 3]) / 2.0 / height
+    xywhn[:, 2] = (xyxy[:, 2] - xyxy[:, 0]) / width
+    xywhn[:, 3] = (xyxy[:, 3] - xyxy[:, 1]) / height
+    return xywhn
+
+
+def xywhn_to_xyxy(xywhn, width, height):
+    """Convert normalized (x_center, y_center, w, h) boxes of shape (N, 4) into pixel (x1, y1, x2, y2)."""
+    xywhn = np.asarray(xywhn, dtype=np.float32).reshape(-1, 4)
+    xyxy = np.empty_like(xywhn)
+    half_w = xywhn[:, 2] * width / 2.0
+    half_h = xywhn[:, 3] * height / 2.0
+    xyxy[:, 0] = xywhn[:, 0] * width - half_w
+    xyxy[:, 1] = xywhn[:, 1] * height - half_h
+    xyxy[:, 2] = xywhn[:, 0] * width + half_w
+    xyxy[:, 3] = xywhn[:, 1] * height + half_h
+    return xyxy
+
+
+def format_labels(classes, xywhn):
+    """Encode labels as the text of a YOLO annotation file."""
+    xywhn = np.asarray(xywhn, dtype=np.float64).reshape(-1, 4)
+    if len(xywhn) == 0:
+        return ""
+    rows = np.column_stack([np.broadcast_to(np.asarray(classes), len(xywhn)), xywhn])
+    # one formatting call for the whole file instead of an f-string per box
+    return (LINE_FORMAT * len(rows)) % tuple(rows.ravel().tolist())
+
+
+# byte values bytes.split() treats as whitespace
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[9, 10, 11, 12, 13, 32]] = True
+
+
+def _parse_buffer(data, file_starts):
+    """
+    Decode a bytes buffer holding one or more label files joined by newlines.
+    file_starts holds the byte offset at which every file starts.
+    Returns (classes, xywhn, rows per file, non-blank lines per file that were skipped).
+
+    Tokens are located with vectorized operations over the raw bytes so that the number of values on every
+    line is known without a Python loop over lines; only lines with exactly 5 values whose class is a
+    non-negative integer are kept.
+    """
+    if not data:
+        classes, xywhn = empty_labels()
+        return classes, xywhn, np.zeros(len(file_starts), dtype=np.int64), np.zeros(len(file_starts), dtype=np.int64)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    whitespace = _WHITESPACE[buf]
+    token_starts = np.flatnonzero(~whitespace & np.concatenate(([True], whitespace[:-1])))
+    line_of_token = np.searchsorted(np.flatnonzero(buf == 10), token_starts)
+    tokens_per_line = np.bincount(line_of_token)
+    valid = (tokens_per_line == 5)[line_of_token]
+    file_of_token = np.searchsorted(np.asarray(file_starts), token_starts, side="right") - 1
+
+    tokens = data.split()
+    skipped_per_file = np.zeros(len(file_starts), dtype=np.int64)
+    if not valid.all():
+        # the first token of every skipped line tells which file the line belongs to
+        first_of_line = np.concatenate(([True], line_of_token[1:] != line_of_token[:-1]))
+        skipped_per_file = np.bincount(file_of_token[first_of_line & ~valid], minlength=len(file_starts))
+        tokens = [token for token, keep in zip(tokens, valid.tolist()) if keep]
+        file_of_token = file_of_token[valid]
+    rows_per_file = np.bincount(file_of_token, minlength=len(file_starts)) // 5
+
+    if not tokens:
+        classes, xywhn = empty_labels()
+        return classes, xywhn, rows_per_file, skipped_per_file
+    values = np.array(tokens, dtype=np.float32).reshape(-1, 5)
+    # a class such as 1.7 or -1 would silently become another class once cast, so its line is skipped instead
+    bad_class = (values[:, 0] < 0) | (values[:, 0] != np.floor(values[:, 0]))
+    if bad_class.any():
+        file_of_row = np.repeat(np.arange(len(file_starts)), rows_per_file)
+        bad_per_file = np.bincount(file_of_row[bad_class], minlength=len(file_starts))
+        rows_per_file = rows_per_file - bad_per_file
+        skipped_per_file = skipped_per_file + bad_per_file
+        values = values[~bad_class]
+    return values[:, 0].astype(np.int32), values[:, 1:], rows_per_file, skipped_per_file
+
+
+def parse_labels(text):
+    """
+    Decode the text of a YOLO annotation file into (classes, xywhn) arrays.
+    Lines that do not have exactly 5 values (blank lines, segmentation polygons, ...) or whose class is not a
+    non-negative integer are skipped.
+    """
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    classes, xywhn, _, _ = _parse_buffer(data, [0])
+    return classes, xywhn
+
+
+def read_labels(path):
+    """Read a YOLO annotation file. A missing file gives empty arrays."""
+    if not os.path.exists(path):
+        return empty_labels()
+    with open(path, "rb") as f:
+        return parse_labels(f.read())
+
+
+def write_labels(path, classes, xywhn, atomic=False):
+    """
+    Write a YOLO annotation file. With atomic=True the text is written to a temporary file next to path that
+    then replaces it, so readers never see a partially written file.
+    """
+    write_label_text(path, format_labels(classes, xywhn), atomic=atomic)
+
+
+def write_label_text(path, text, atomic=False):
+    """Write the text of a YOLO annotation file, atomically like write_labels if atomic=True."""
+    if not atomic:
+        with open(path, "w") as f:
+            f.write(text)
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _read_bytes(path):
+    # unbuffered: label files are read in one call, so a BufferedReader per file is pure overhead
+    with open(path, "rb", buffering=0) as f:
+        return f.readall()
+
+
+def read_label_dir(directory, names=None, workers=1):
+    """
+    Read every .txt label file in directory (or only the given file names) into one LabelSet.
+    All files are decoded together in a single vectorized pass. On network storage, where reading many
+    small files is dominated by latency, workers > 1 reads the files on a thread pool.
+    """
+    if names is None:
+        names = sorted(f for f in os.listdir(directory) if f.lower().endswith(".txt"))
+    names = list(names)
+    paths = [os.path.join(directory, name) for name in names]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            contents = list(pool.map(_read_bytes, paths))
+    else:
+        contents = [_read_bytes(path) for path in paths]
+
+    # join with newlines so that every file starts on a new line
+    lengths = np.array([len(content) + 1 for content in contents], dtype=np.int64)
+    file_starts = np.zeros(len(contents), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=file_starts[1:])
+    classes, boxes, rows_per_file, skipped_lines = _parse_buffer(b"\n".join(contents), file_starts)
+
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(rows_per_file, out=offsets[1:])
+    return LabelSet(names, classes, boxes, offsets, skipped_lines)
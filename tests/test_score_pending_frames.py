@@ -0,0 +1,34 @@
+import threading
+from collections import namedtuple
+
+import score_pending_frames
+
+Record = namedtuple("Record", ["image_path"])
+
+
+def test_read_batches_decodes_next_batch_during_model(monkeypatch):
+    records = [Record(f"frame_{i}.jpg") for i in range(6)]
+    started = {record.image_path: threading.Event() for record in records}
+
+    def imread(path):
+        started[path].set()
+        return path
+
+    monkeypatch.setattr(score_pending_frames.cv2, "imread", imread)
+    batches = []
+    for batch, frames in score_pending_frames.read_batches(records, batch_size=2, workers=2):
+        assert frames == [record.image_path for record in batch]
+        index = len(batches)
+        batches.append(batch)
+        # while the model runs on this batch, the next one must already be decoding
+        for record in records[2 * (index + 1):2 * (index + 2)]:
+            assert started[record.image_path].wait(timeout=5), f"{record.image_path} not read ahead of batch {index}"
+    assert [record for batch in batches for record in batch] == records
+
+
+def test_read_batches_partial_last_batch(monkeypatch):
+    monkeypatch.setattr(score_pending_frames.cv2, "imread", lambda path: path)
+    records = [Record(f"frame_{i}.jpg") for i in range(5)]
+    sizes = [len(batch) for batch, _ in score_pending_frames.read_batches(records, batch_size=2, workers=2)]
+    assert sizes == [2, 2, 1]
+    assert list(score_pending_frames.read_batches([], batch_size=2, workers=2)) == []